@@ -0,0 +1,117 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from bulk_embed import collection_version
+from tracing import tracer
+
+# Default cosine similarity above which two questions count as the same question
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+# Default number of seconds an answer stays valid
+DEFAULT_TTL = 3600
+
+# Default number of answers kept before the least recently used are evicted
+DEFAULT_MAX_ENTRIES = 256
+
+# Function to fingerprint the collection contents. The version stamp changes with
+# every upsert or delete, including edits that keep the chunk count; the count
+# still catches writes made without a stamp.
+def collection_fingerprint(app):
+    return collection_version(app), app.db.count()
+
+# Words that make a question lean on the conversation before it ("tell me more about
+# it", "why is that?")
+FOLLOW_UP_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "he", "him", "his",
+    "she", "her", "hers", "there", "more", "else", "also", "again", "same", "above", "previous",
+    "earlier", "elaborate", "expand", "continue",
+}
+
+# Function to check whether a question is a follow-up to the previous turn; very
+# short questions ("and?", "why?") count as follow-ups too
+def is_follow_up(query):
+    words = re.findall(r"[a-z']+", query.lower())
+    return len(words) < 3 or any(word in FOLLOW_UP_WORDS for word in words)
+
+# Function to fingerprint the conversation a question depends on. A standalone
+# question has no context, so it is answered from the cache however the chat got
+# there; a follow-up is tied to the previous user and assistant turn, so "tell me
+# more" is never answered with the reply given after another turn.
+def conversation_context(query, history):
+    if not is_follow_up(query):
+        return None
+    turns = [
+        (message["role"], message["content"])
+        for message in history or []
+        if message.get("role") in ("user", "assistant") and message.get("content")
+    ][-2:]
+    return hashlib.sha1(json.dumps(turns).encode("utf-8")).hexdigest() if turns else None
+
+# Semantic answer cache for the chat loops. Questions are matched on their query
+# embedding, so near-duplicate questions share an answer; follow-up questions only
+# share one when asked after the same previous turn. All answers are dropped when
+# the collection fingerprint changes, and entries are bounded by TTL and LRU.
+class AnswerCache:
+    def __init__(self, app, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+                 ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.app = app
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.next_key = 0
+        self.fingerprint = None
+
+    # Function to embed a question as a unit vector
+    def embed(self, query):
+        embedding = np.asarray(self.app.embedder.embedding_fn([query])[0], dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    # Function to drop every cached answer
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+
+    # Function to find a cached answer for a question asked after history (the earlier
+    # messages). Returns (answer, key); answer is None on a miss and the key can be
+    # handed to store().
+    def lookup(self, query, history=None):
+        query_embedding = self.embed(query)
+        context = conversation_context(query, history)
+        key = (query_embedding, context)
+        fingerprint = collection_fingerprint(self.app)
+        now = time.time()
+        with self.lock:
+            if fingerprint != self.fingerprint:
+                self.entries.clear()
+                self.fingerprint = fingerprint
+            for entry_key in [entry_key for entry_key, entry in self.entries.items() if now - entry[2] > self.ttl]:
+                del self.entries[entry_key]
+            keys = [entry_key for entry_key, entry in self.entries.items() if entry[3] == context]
+            if not keys:
+                tracer.count("answer_cache_misses")
+                return None, key
+            matrix = np.stack([self.entries[entry_key][0] for entry_key in keys])
+            similarities = matrix @ query_embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                tracer.count("answer_cache_misses")
+                return None, key
+            tracer.count("answer_cache_hits")
+            self.entries.move_to_end(keys[best])
+            return self.entries[keys[best]][1], key
+
+    # Function to cache the answer to a question, under the key lookup() returned
+    def store(self, key, answer):
+        query_embedding, context = key
+        with self.lock:
+            self.entries[self.next_key] = (query_embedding, answer, time.time(), context)
+            self.next_key += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.corpus import generate_corpus
+from benchmarks.stubs import StubEmbedder
+from chunking import AdaptiveChunker, CharacterChunker, TokenCounter
+from ingestion import read_files_from_directory
+
+# Offline evaluator for chunking configs. Queries are built from sentences sampled
+# out of the documents (with some words dropped), and a query counts as answered when
+# one of its top-k chunks covers most of the source sentence. For every candidate
+# config it reports recall@k next to the chunk count, index size and the context
+# tokens k chunks add to a prompt.
+#
+#   python -m benchmarks.chunking --directory /path/to/documents
+#   python -m benchmarks.chunking --configs adaptive,adaptive:128,300:50:200 --embedder-model BAAI/bge-small-en-v1.5
+
+DEFAULT_CONFIGS = "adaptive,adaptive:128,200:100:100,300:50:200,400:50:200"
+
+SENTENCE = re.compile(r"[^.!?\n]+[.!?]")
+
+# Shortest sentence, in words, that a query is built from
+MIN_QUERY_WORDS = 8
+
+# Function to build a chunker from a spec: "adaptive", "adaptive:<target tokens>",
+# or a "chunk_size:chunk_overlap:min_chunk_size" character triple
+def chunker_from_spec(spec, counter=None):
+    parts = spec.split(":")
+    if parts[0] == "adaptive":
+        target_tokens = int(parts[1]) if len(parts) > 1 else None
+        return AdaptiveChunker(counter or TokenCounter(), target_tokens=target_tokens)
+    chunk_size, chunk_overlap, min_chunk_size = (int(value) for value in parts)
+    return CharacterChunker(chunk_size, chunk_overlap, min_chunk_size)
+
+# Function to load the documents to evaluate on
+def load_documents(directory):
+    return [
+        {"text": data["text"], "source": data["metadata"]["source"], "page_offsets": data["page_offsets"]}
+        for data in read_files_from_directory(directory)
+        if data["text"].strip()
+    ]
+
+# Function to sample evaluation queries: (query, source, start, end) where start/end
+# is the character span of the sentence the query was built from
+def sample_queries(documents, count, rng, drop_fraction=0.3):
+    candidates = [
+        (document["source"], match.start(), match.end())
+        for document in documents
+        for match in SENTENCE.finditer(document["text"])
+        if len(match.group().split()) >= MIN_QUERY_WORDS
+    ]
+    texts = {document["source"]: document["text"] for document in documents}
+    queries = []
+    for source, start, end in rng.sample(candidates, min(count, len(candidates))):
+        words = texts[source][start:end].split()
+        kept = [word for word in words if rng.random() >= drop_fraction] or words
+        queries.append((" ".join(kept), source, start, end))
+    return queries
+
+# Function to embed texts in batches as a normalized float32 matrix
+def embed(embedding_fn, texts, batch_size=64):
+    rows = []
+    for start in range(0, len(texts), batch_size):
+        rows.extend(embedding_fn(texts[start:start + batch_size]))
+    matrix = np.asarray(rows, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+# Function to evaluate one chunker against the sampled queries
+def evaluate(spec, chunker, documents, queries, query_matrix, embedding_fn, top_k):
+    started = time.perf_counter()
+    chunks = []
+    for document in documents:
+        document_chunks, _ = chunker.split(document["text"], source=document["source"], page_offsets=document["page_offsets"])
+        for chunk in document_chunks:
+            chunks.append((document["source"], chunk["start"], chunk["start"] + len(chunk["text"]), chunk["text"], chunk["tokens"]))
+    chunk_seconds = time.perf_counter() - started
+    if not chunks:
+        return {"config": spec, "chunks": 0}
+
+    started = time.perf_counter()
+    chunk_matrix = embed(embedding_fn, [chunk[3] for chunk in chunks])
+    embed_seconds = time.perf_counter() - started
+
+    hits = 0
+    context_tokens = 0
+    k = min(top_k, len(chunks))
+    top = np.argpartition(-(query_matrix @ chunk_matrix.T), k - 1, axis=1)[:, :k] if queries else []
+    for row, (_, source, start, end) in enumerate(queries):
+        context_tokens += sum(chunks[index][4] for index in top[row])
+        for index in top[row]:
+            chunk_source, chunk_start, chunk_end = chunks[index][:3]
+            covered = min(end, chunk_end) - max(start, chunk_start)
+            if chunk_source == source and covered >= (end - start) / 2:
+                hits += 1
+                break
+
+    tokens = [chunk[4] for chunk in chunks]
+    text_bytes = sum(len(chunk[3].encode("utf-8")) for chunk in chunks)
+    # Per-query figures are 0 when no queries were sampled
+    per_query = max(len(queries), 1)
+    return {
+        "config": spec,
+        f"recall@{top_k}": round(hits / per_query, 4),
+        "chunks": len(chunks),
+        "mean_chunk_tokens": round(float(np.mean(tokens)), 1),
+        "stored_tokens": int(sum(tokens)),
+        "index_mb": round((chunk_matrix.nbytes + text_bytes) / (1024 * 1024), 3),
+        f"prompt_tokens@{top_k}": round(context_tokens / per_query, 1),
+        "chunk_seconds": round(chunk_seconds, 3),
+        "embed_seconds": round(embed_seconds, 3),
+    }
+
+# Function to load the embedding function and token counter for the evaluation
+def load_embedder(model_name):
+    if not model_name:
+        return StubEmbedder().embedding_fn, TokenCounter()
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name)
+    return (lambda texts: model.encode(list(texts), normalize_embeddings=True)), TokenCounter(model_name)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare chunking configs by retrieval recall, chunk count and index size.")
+    parser.add_argument("--directory", help="Documents to evaluate on (default: a generated synthetic corpus)")
+    parser.add_argument("--documents", type=int, default=60, help="Number of synthetic documents")
+    parser.add_argument("--doc-chars", dest="doc_chars", type=int, default=8000, help="Approximate characters per synthetic document")
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS,
+                        help="Comma-separated chunker specs: adaptive, adaptive:<tokens> or chunk_size:chunk_overlap:min_chunk_size")
+    parser.add_argument("--embedder-model", dest="embedder_model",
+                        help="sentence-transformers model to embed with (default: the offline stub embedder)")
+    parser.add_argument("--queries", type=int, default=300, help="Number of sampled queries")
+    parser.add_argument("--top-k", dest="top_k", type=int, default=3, help="Chunks retrieved per query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    corpus_directory = None
+    directory = args.directory
+    if directory is None:
+        corpus_directory = directory = tempfile.mkdtemp(prefix="embedchain-chunking-corpus-")
+        generate_corpus(directory, documents=args.documents, doc_chars=args.doc_chars, seed=args.seed)
+    try:
+        documents = load_documents(directory)
+    finally:
+        if corpus_directory:
+            shutil.rmtree(corpus_directory, ignore_errors=True)
+    if not documents:
+        print(f"No documents found in {directory}.", file=sys.stderr)
+        return 1
+
+    embedding_fn, counter = load_embedder(args.embedder_model)
+    queries = sample_queries(documents, args.queries, random.Random(args.seed))
+    if not queries:
+        print(f"No sentences of {MIN_QUERY_WORDS} or more words to build queries from.", file=sys.stderr)
+        return 1
+    query_matrix = embed(embedding_fn, [query[0] for query in queries])
+    print(f"Evaluating on {len(documents)} documents and {len(queries)} queries "
+          f"({'exact' if counter.exact else 'estimated'} token counts).", file=sys.stderr)
+
+    results = [
+        evaluate(spec, chunker_from_spec(spec, counter), documents, queries, query_matrix, embedding_fn, args.top_k)
+        for spec in args.configs.split(",")
+    ]
+    columns = ["config", f"recall@{args.top_k}", "chunks", "mean_chunk_tokens", "index_mb", f"prompt_tokens@{args.top_k}"]
+    print(" | ".join(f"{column:>16}" for column in columns))
+    for result in results:
+        print(" | ".join(f"{str(result.get(column, '')):>16}" for column in columns))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"documents": len(documents), "queries": len(queries), "top_k": args.top_k, "results": results}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
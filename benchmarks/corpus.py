@@ -0,0 +1,119 @@
+import os
+import random
+
+# Synthetic corpus generator for the benchmarks. Text is built from a fixed
+# pseudo-word vocabulary with a seeded random generator, so the same arguments
+# always produce the same corpus.
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "tas", "vo", "qui", "zen", "dor", "pha", "ul", "bri", "sen", "tor", "ga", "nex"]
+
+# Function to build a deterministic vocabulary of pseudo-words
+def build_vocabulary(rng, size=2000):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+# Function to build one sentence
+def sentence(rng, vocabulary):
+    words = [rng.choice(vocabulary) for _ in range(rng.randint(6, 18))]
+    return " ".join(words).capitalize() + "."
+
+# Function to build a paragraph of roughly the requested number of characters
+def paragraph(rng, vocabulary, characters):
+    sentences = []
+    length = 0
+    while length < characters:
+        text = sentence(rng, vocabulary)
+        sentences.append(text)
+        length += len(text) + 1
+    return " ".join(sentences)
+
+# Function to build a document body of roughly doc_chars characters
+def document_text(rng, vocabulary, doc_chars):
+    paragraphs = []
+    length = 0
+    while length < doc_chars:
+        text = paragraph(rng, vocabulary, rng.randint(300, 900))
+        paragraphs.append(text)
+        length += len(text) + 2
+    return paragraphs
+
+# Function to escape text for a PDF string literal
+def pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+# Function to write a minimal text-only PDF with one content stream per page
+def write_pdf(path, pages):
+    objects = []
+    page_ids = []
+    font_id = 3
+    next_id = 4
+    for lines in pages:
+        page_ids.append(next_id)
+        next_id += 2
+    objects.append((1, "<< /Type /Catalog /Pages 2 0 R >>"))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects.append((2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"))
+    objects.append((font_id, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"))
+    for page_id, lines in zip(page_ids, pages):
+        content = "BT /F1 10 Tf 12 TL 50 760 Td " + " ".join(f"({pdf_escape(line)}) '" for line in lines) + " ET"
+        objects.append((
+            page_id,
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {page_id + 1} 0 R >>",
+        ))
+        objects.append((page_id + 1, f"<< /Length {len(content)} >>\nstream\n{content}\nendstream"))
+    objects.sort()
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id, body in objects:
+        offsets[object_id] = len(output)
+        output += f"{object_id} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for object_id, _ in objects:
+        output += f"{offsets[object_id]:010d} 00000 n \n".encode("latin-1")
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(output)
+
+# Function to wrap a paragraph into PDF lines of at most width characters
+def wrap(text, width=90):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+# Function to generate a corpus of txt/md/pdf files under directory. Returns the
+# list of generated paths and the vocabulary (used to build benchmark queries).
+def generate_corpus(directory, documents=100, doc_chars=5000, file_types=("txt", "md", "pdf"), seed=42):
+    rng = random.Random(seed)
+    vocabulary = build_vocabulary(rng)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(documents):
+        file_type = file_types[index % len(file_types)]
+        # Spread files over a few subdirectories, like a real document share
+        subdirectory = os.path.join(directory, f"group_{index % 10:02d}")
+        os.makedirs(subdirectory, exist_ok=True)
+        path = os.path.join(subdirectory, f"doc_{index:06d}.{file_type}")
+        paragraphs = document_text(rng, vocabulary, doc_chars)
+        if file_type == "txt":
+            with open(path, "w") as f:
+                f.write("\n\n".join(paragraphs))
+        elif file_type == "md":
+            with open(path, "w") as f:
+                for number, text in enumerate(paragraphs, 1):
+                    f.write(f"## Section {number}\n\n{text}\n\n")
+        else:
+            lines = [line for text in paragraphs for line in wrap(text) + [""]]
+            write_pdf(path, [lines[start:start + 60] for start in range(0, len(lines), 60)])
+        paths.append(path)
+    return paths, vocabulary
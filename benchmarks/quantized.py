@@ -0,0 +1,162 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+import numpy as np
+from quantized_index import QuantizedIndex, quantized_index_path_for, sync_quantized_index
+
+# Benchmark of the quantized index against plain Chroma search. A Chroma collection
+# is filled with clustered synthetic vectors and the int8 and binary indexes are
+# synced from it. Each search mode is then measured in a fresh process, so its peak
+# RSS covers only that store, and recall@k is computed against exact search.
+#
+#   python -m benchmarks.quantized --vectors 100000 --dimension 384
+
+COLLECTION_NAME = "quantized_benchmark"
+
+# Largest batch Chroma accepts in one add call
+CHROMA_ADD_BATCH = 5000
+
+# Function to generate unit vectors around random cluster centres, plus queries
+# drawn near stored vectors
+def clustered_vectors(count, dimension, clusters, queries, seed):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    query_vectors = vectors[rng.integers(0, count, queries)] + 0.2 * rng.standard_normal((queries, dimension)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return vectors, query_vectors
+
+# Function to read the peak resident set size of this process, in MB. On Linux the
+# high-water mark comes from /proc, because ru_maxrss survives the exec that starts
+# a spawned worker and would report the parent's peak.
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+# Function to run the queries against one search mode; runs in its own process
+def measure(mode, db_dir, queries_path, top_k):
+    import chromadb
+
+    query_vectors = np.load(queries_path)
+    rss_before = peak_rss_mb()
+    latencies = []
+    results = []
+    if mode == "chroma":
+        collection = chromadb.PersistentClient(path=db_dir).get_collection(COLLECTION_NAME)
+        for query in query_vectors:
+            started = time.perf_counter()
+            found = collection.query(query_embeddings=[query.tolist()], n_results=top_k, include=[])
+            latencies.append(time.perf_counter() - started)
+            results.append(found["ids"][0])
+    else:
+        index = QuantizedIndex(quantized_index_path_for(db_dir, COLLECTION_NAME, mode), mode)
+        for query in query_vectors:
+            started = time.perf_counter()
+            hits = index.search(query, top_k)
+            latencies.append(time.perf_counter() - started)
+            results.append([chunk_id for chunk_id, _ in hits])
+    milliseconds = np.asarray(latencies) * 1000
+    return {
+        "results": results,
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 3),
+        "p95_ms": round(float(np.percentile(milliseconds, 95)), 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "search_rss_mb": round(peak_rss_mb() - rss_before, 1),
+    }
+
+# Function to total the size of the files under a directory, in MB
+def directory_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return round(total / (1024 * 1024), 1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare memory and recall@k of quantized search against plain Chroma.")
+    parser.add_argument("--vectors", type=int, default=50000, help="Number of stored vectors")
+    parser.add_argument("--dimension", type=int, default=384, help="Vector dimension (bge-small: 384)")
+    parser.add_argument("--clusters", type=int, default=200, help="Number of clusters the vectors are drawn around")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", dest="top_k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    import chromadb
+
+    db_dir = tempfile.mkdtemp(prefix="embedchain-quantized-bench-")
+    try:
+        vectors, query_vectors = clustered_vectors(args.vectors, args.dimension, args.clusters, args.queries, args.seed)
+        queries_path = os.path.join(db_dir, "queries.npy")
+        np.save(queries_path, query_vectors)
+
+        print(f"Loading {args.vectors} vectors into Chroma...", file=sys.stderr)
+        client = chromadb.PersistentClient(path=db_dir)
+        collection = client.get_or_create_collection(COLLECTION_NAME, metadata={"hnsw:space": "cosine"})
+        ids = [f"v{i}" for i in range(args.vectors)]
+        for start in range(0, args.vectors, CHROMA_ADD_BATCH):
+            collection.add(ids=ids[start:start + CHROMA_ADD_BATCH], embeddings=vectors[start:start + CHROMA_ADD_BATCH].tolist())
+        chroma_mb = directory_mb(db_dir)
+
+        app = SimpleNamespace(db=SimpleNamespace(collection=collection))
+        index_mb = {}
+        for mode in ("int8", "binary"):
+            print(f"Building the {mode} index...", file=sys.stderr)
+            index = QuantizedIndex(quantized_index_path_for(db_dir, COLLECTION_NAME, mode), mode)
+            sync_quantized_index(app, index)
+            sizes = index.size_on_disk()
+            index_mb[mode] = {
+                "codes_mb": round(sum(size for name, size in sizes.items() if name.startswith(("codes", "scales"))) / (1024 * 1024), 1),
+                "full_vectors_mb": round(sizes["vectors.f32"] / (1024 * 1024), 1),
+            }
+            index.close()
+        del client, collection, app
+
+        exact = np.argsort(-(query_vectors @ vectors.T), axis=1)[:, :args.top_k]
+        del vectors
+        runs = []
+        for mode in ("chroma", "int8", "binary"):
+            print(f"Measuring {mode} search...", file=sys.stderr)
+            # A fresh process per mode keeps the peak RSS of one store from hiding another
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(measure, mode, db_dir, queries_path, args.top_k).result()
+            recall = np.mean([
+                len({f"v{i}" for i in truth} & set(found)) / args.top_k
+                for truth, found in zip(exact, result.pop("results"))
+            ])
+            run = {"mode": mode, f"recall@{args.top_k}": round(float(recall), 4), **result}
+            run.update(index_mb.get(mode, {"store_mb": chroma_mb}))
+            runs.append(run)
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+    columns = ["mode", f"recall@{args.top_k}", "p50_ms", "p95_ms", "search_rss_mb", "peak_rss_mb"]
+    print(" | ".join(f"{column:>14}" for column in columns))
+    for run in runs:
+        print(" | ".join(f"{str(run[column]):>14}" for column in columns))
+    print(json.dumps({name: {key: value for key, value in run.items() if key.endswith("mb")} for name, run in ((run["mode"], run) for run in runs)}, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"vectors": args.vectors, "dimension": args.dimension, "top_k": args.top_k, "runs": runs}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
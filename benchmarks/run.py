@@ -0,0 +1,209 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.chunking import chunker_from_spec
+from benchmarks.corpus import generate_corpus
+from benchmarks.stubs import StubApp
+from pipeline import build_config, ingest_directory
+
+# Benchmark harness for ingestion, retrieval and end-to-end query latency. Runs
+# offline against a synthetic corpus with a stub embedder and LLM and a real Chroma
+# collection, and writes the results as JSON so runs can be compared.
+#
+#   python -m benchmarks.run --documents 300 --doc-chars 8000
+#   python -m benchmarks.run --compare benchmarks/results/old.json benchmarks/results/new.json
+
+# Adaptive chunking plus the three chunk_size:chunk_overlap:min_chunk_size presets
+# that embed-and-test-topics.py used to offer
+DEFAULT_CHUNK_CONFIGS = "adaptive,200:100:100,300:50:200,400:50:200"
+
+RESULTS_DIRECTORY = os.path.join("benchmarks", "results")
+
+# Function to name the chunker of a run; older result files store a dict of the triple
+def chunker_label(chunker):
+    if isinstance(chunker, dict):
+        return "{chunk_size}:{chunk_overlap}:{min_chunk_size}".format(**chunker)
+    return chunker
+
+# Function to read the peak resident set size of this process and its workers, in MB
+def peak_rss_mb():
+    import resource
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return {"main": round(own, 1), "workers": round(children, 1)}
+
+# Function to get the current git commit, if any
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Function to summarise latencies in milliseconds
+def latency_summary(seconds):
+    milliseconds = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 3),
+        "p95_ms": round(float(np.percentile(milliseconds, 95)), 3),
+        "p99_ms": round(float(np.percentile(milliseconds, 99)), 3),
+        "mean_ms": round(float(milliseconds.mean()), 3),
+    }
+
+# Function to benchmark one chunking config on a fresh collection
+def run_config(corpus_directory, vocabulary, chunk_config, args):
+    db_dir = tempfile.mkdtemp(prefix="embedchain-bench-db-")
+    try:
+        app = StubApp(db_dir, "benchmark")
+        config = build_config("benchmark", db_dir=db_dir)
+        started = time.perf_counter()
+        # The pipeline prints a line per document; keep the benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = ingest_directory(
+                app,
+                config,
+                corpus_directory,
+                workers=args.workers,
+                batch_size=args.batch_size,
+                max_tokens_per_batch=args.max_tokens_per_batch,
+                chunker=chunker_from_spec(chunk_config),
+            )
+        ingest_seconds = time.perf_counter() - started
+
+        rng = random.Random(args.seed)
+        queries = [" ".join(rng.sample(vocabulary, 5)) for _ in range(args.queries)]
+        retrieval, end_to_end = [], []
+        for query in queries:
+            started = time.perf_counter()
+            app.retrieve(query, args.top_k)
+            retrieval.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            app.query(query, args.top_k)
+            end_to_end.append(time.perf_counter() - started)
+
+        return {
+            "chunker": chunk_config,
+            "ingestion": {
+                "documents": stats.characters.count,
+                "chunks": stats.chunk_lengths.count,
+                "seconds": round(ingest_seconds, 3),
+                "docs_per_second": round(stats.characters.count / ingest_seconds, 2),
+                "chunks_per_second": round(stats.chunk_lengths.count / ingest_seconds, 2),
+                "parse_seconds": round(stats.parse_seconds, 3),
+                "embed_seconds": round(stats.embed_seconds, 3),
+            },
+            "retrieval": latency_summary(retrieval),
+            "end_to_end": latency_summary(end_to_end),
+            "collection_chunks": app.db.count(),
+        }
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+# Function to print the relative change of the main metrics between two result files
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    metrics = [
+        ("ingestion", "docs_per_second"),
+        ("ingestion", "chunks_per_second"),
+        ("retrieval", "p50_ms"),
+        ("retrieval", "p95_ms"),
+        ("retrieval", "p99_ms"),
+        ("end_to_end", "p95_ms"),
+    ]
+    print(f"{'chunker':<14} {'metric':<30} {'old':>12} {'new':>12} {'change':>9}")
+    old_runs = {chunker_label(run["chunker"]): run for run in old["runs"]}
+    for run in new["runs"]:
+        label = chunker_label(run["chunker"])
+        if label not in old_runs:
+            continue
+        for section, metric in metrics:
+            before, after = old_runs[label][section][metric], run[section][metric]
+            change = (after - before) / before * 100 if before else 0.0
+            print(f"{label:<14} {section + '.' + metric:<30} {before:>12} {after:>12} {change:>8.1f}%")
+    print(f"{'peak RSS (main)':<45} {old['peak_rss_mb']['main']:>12} {new['peak_rss_mb']['main']:>12}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and end-to-end query latency offline.")
+    parser.add_argument("--documents", type=int, default=120, help="Number of synthetic documents")
+    parser.add_argument("--doc-chars", dest="doc_chars", type=int, default=5000, help="Approximate characters per document")
+    parser.add_argument("--file-types", dest="file_types", default="txt,md,pdf", help="Comma-separated file types to generate")
+    parser.add_argument("--chunk-configs", dest="chunk_configs", default=DEFAULT_CHUNK_CONFIGS,
+                        help="Comma-separated chunker specs: adaptive, adaptive:<tokens> or chunk_size:chunk_overlap:min_chunk_size")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parsing worker processes")
+    parser.add_argument("--batch-size", dest="batch_size", type=int, default=64, help="Chunks per embedding batch")
+    parser.add_argument("--max-tokens-per-batch", dest="max_tokens_per_batch", type=int, default=16384)
+    parser.add_argument("--queries", type=int, default=200, help="Number of benchmark queries")
+    parser.add_argument("--top-k", dest="top_k", type=int, default=3, help="Chunks retrieved per query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<timestamp>.json, ignored by git)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    corpus_directory = tempfile.mkdtemp(prefix="embedchain-bench-corpus-")
+    try:
+        _, vocabulary = generate_corpus(
+            corpus_directory,
+            documents=args.documents,
+            doc_chars=args.doc_chars,
+            file_types=tuple(args.file_types.split(",")),
+            seed=args.seed,
+        )
+        runs = []
+        for chunk_config in args.chunk_configs.split(","):
+            print(f"Benchmarking chunker {chunk_config}...", file=sys.stderr)
+            runs.append(run_config(corpus_directory, vocabulary, chunk_config, args))
+    finally:
+        shutil.rmtree(corpus_directory, ignore_errors=True)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {
+            "documents": args.documents,
+            "doc_chars": args.doc_chars,
+            "file_types": args.file_types,
+            "seed": args.seed,
+        },
+        "settings": {
+            "workers": args.workers,
+            "batch_size": args.batch_size,
+            "max_tokens_per_batch": args.max_tokens_per_batch,
+            "queries": args.queries,
+            "top_k": args.top_k,
+        },
+        "runs": runs,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    output = args.output or os.path.join(RESULTS_DIRECTORY, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(runs, indent=2))
+    print(f"Results saved to {output}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
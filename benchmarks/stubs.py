@@ -0,0 +1,69 @@
+import hashlib
+import re
+from types import SimpleNamespace
+import numpy as np
+
+# Offline stand-ins for the configured embedder and LLM, so the benchmarks need no
+# model download and no Ollama server. The vector store is a real Chroma collection.
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Deterministic hashed bag-of-words embedder with the same dimension as bge-small
+class StubEmbedder:
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+        self.config = SimpleNamespace(model="stub-hashing-embedder")
+
+    def embedding_fn(self, texts):
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN_PATTERN.findall(text.lower()):
+                bucket = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest(), "little")
+                matrix[row, bucket % self.dimension] += 1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        return matrix.tolist()
+
+# LLM stand-in that answers instantly with a fixed-size reply
+class StubLlm:
+    def __init__(self, answer_words=200):
+        self.answer = " ".join(["answer"] * answer_words)
+        self.config = SimpleNamespace(number_documents=3)
+
+    def get_llm_model_answer(self, prompt):
+        return self.answer
+
+# Thin wrapper over a persistent Chroma collection with the parts of embedchain's
+# ChromaDB that the ingestion pipeline uses
+class StubDb:
+    def __init__(self, path, collection_name):
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(collection_name, metadata={"hnsw:space": "cosine"})
+
+    def count(self):
+        return self.collection.count()
+
+    def delete(self, where):
+        self.collection.delete(where=where)
+
+# App stand-in accepted by pipeline.ingest_directory and the retrieval benchmark
+class StubApp:
+    def __init__(self, db_dir, collection_name):
+        self.config = SimpleNamespace(id=None)
+        self.embedder = StubEmbedder()
+        self.llm = StubLlm()
+        self.db = StubDb(db_dir, collection_name)
+
+    # Function to retrieve the top-k chunks for a query
+    def retrieve(self, query, k=3):
+        embedding = self.embedder.embedding_fn([query])
+        result = self.db.collection.query(query_embeddings=embedding, n_results=k)
+        return result["documents"][0]
+
+    # Function to run a full query: retrieval, prompt assembly and generation
+    def query(self, query, k=3):
+        contexts = self.retrieve(query, k)
+        prompt = "Use the following context to answer the query.\n\n" + "\n\n".join(contexts) + f"\n\nQuery: {query}\nAnswer:"
+        return self.llm.get_llm_model_answer(prompt)
@@ -0,0 +1,158 @@
+import bisect
+import hashlib
+import os
+import time
+import uuid
+from tracing import tracer
+
+# Default number of chunks sent to the embedder in one call
+DEFAULT_BATCH_SIZE = 64
+
+# Default upper bound on the (estimated) tokens in one embedding batch
+DEFAULT_MAX_TOKENS_PER_BATCH = 16384
+
+# Function to estimate the token count of a chunk (about four characters per token)
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+# Function to build the path of a collection's version stamp, stored next to the
+# Chroma data; None when the app's vector store has no directory
+def version_path_for(app):
+    config = getattr(app.db, "config", None)
+    if config is None or not getattr(config, "dir", None):
+        return None
+    return os.path.join(config.dir, f"{config.collection_name}_version")
+
+# Function to read a collection's version stamp; it changes on every write, so
+# readers in other processes (a chat loop, the daemon) see that content changed
+def collection_version(app):
+    path = version_path_for(app)
+    if path is None:
+        return None
+    try:
+        with open(path) as file:
+            return file.read()
+    except OSError:
+        return None
+
+# Function to stamp a collection with a new version after its chunks changed. A fresh
+# random stamp (rather than a counter) cannot be lost to two concurrent writers.
+def bump_collection_version(app):
+    path = version_path_for(app)
+    if path is None:
+        return
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        file.write(uuid.uuid4().hex)
+    os.replace(temporary, path)
+
+# Bulk-add path that bypasses the per-document app.add call. Chunks from many
+# documents are gathered into fixed-size batches, embedded with one call to the
+# configured embedder and upserted into the Chroma collection in one write. When the
+# app has a keyword index (app.lexical_index), every upserted and deleted batch is
+# applied to it as well.
+class BulkIndexer:
+    def __init__(self, app, chunker, batch_size=DEFAULT_BATCH_SIZE,
+                 max_tokens_per_batch=DEFAULT_MAX_TOKENS_PER_BATCH, stats=None):
+        self.app = app
+        self.chunker = chunker
+        self.stats = stats
+        self.batch_size = batch_size
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.app_id = getattr(app.config, "id", None)
+        self.lexical_index = getattr(app, "lexical_index", None)
+        self.ids = []
+        self.pending_ids = set()
+        self.documents = []
+        self.metadatas = []
+        self.pending_tokens = 0
+        self.callbacks = []
+        self.chunks_indexed = 0
+
+    # Function to chunk a document and queue its chunks for embedding. on_indexed is
+    # called once every chunk of the document has been written to the collection.
+    # page_offsets (the character offset each page starts at) adds the page number
+    # and char_offset of every chunk to its metadata; char_offset counts characters
+    # of the extracted text, not bytes of the source file.
+    def add(self, text, metadata, on_indexed=None, page_offsets=None):
+        source = metadata.get("source", "")
+        doc_hash = hashlib.sha256((text + source).encode("utf-8")).hexdigest()
+        with tracer.span("chunk", source=source, characters=len(text)) as span:
+            chunks, parameters = self.chunker.split(text, source=source, page_offsets=page_offsets)
+            span.set(chunks=len(chunks), **parameters)
+        for chunk in chunks:
+            chunk_id = hashlib.sha256((chunk["text"] + source).encode("utf-8")).hexdigest()
+            if self.app_id is not None:
+                chunk_id = f"{self.app_id}--{chunk_id}"
+            chunk_metadata = dict(metadata, url=source, doc_id=doc_hash, data_type="text")
+            if self.app_id is not None:
+                chunk_metadata["app_id"] = self.app_id
+            if chunk.get("section"):
+                chunk_metadata["section"] = chunk["section"]
+            start = chunk["start"]
+            if page_offsets and start >= 0:
+                chunk_metadata["page"] = bisect.bisect_right(page_offsets, start)
+                chunk_metadata["char_offset"] = start
+            self.queue_chunk(chunk_id, chunk["text"], chunk_metadata, chunk["tokens"])
+        if on_indexed is not None:
+            self.callbacks.append(on_indexed)
+
+    # Function to add a single prepared chunk to the current batch
+    def queue_chunk(self, chunk_id, chunk, metadata, tokens=None):
+        if chunk_id in self.pending_ids:
+            return
+        tokens = tokens or estimate_tokens(chunk)
+        if self.documents and self.pending_tokens + tokens > self.max_tokens_per_batch:
+            self.flush()
+        self.ids.append(chunk_id)
+        self.pending_ids.add(chunk_id)
+        self.documents.append(chunk)
+        self.metadatas.append(metadata)
+        self.pending_tokens += tokens
+        if len(self.documents) >= self.batch_size:
+            self.flush()
+
+    # Function to embed and upsert the current batch
+    def flush(self):
+        if self.documents:
+            started = time.perf_counter()
+            embeddings = self.app.embedder.embedding_fn(self.documents)
+            if self.stats is not None:
+                self.stats.record_batch(self.documents, self.metadatas, time.perf_counter() - started)
+            with tracer.span("upsert", chunks=len(self.documents)):
+                self.app.db.collection.upsert(
+                    ids=self.ids,
+                    documents=self.documents,
+                    metadatas=self.metadatas,
+                    embeddings=embeddings,
+                )
+            if self.lexical_index is not None:
+                with tracer.span("bm25_index", chunks=len(self.documents)):
+                    self.lexical_index.add(self.ids, self.documents)
+            bump_collection_version(self.app)
+            self.chunks_indexed += len(self.documents)
+            tracer.count("chunks_indexed", len(self.documents))
+            self.ids, self.documents, self.metadatas = [], [], []
+            self.pending_ids = set()
+            self.pending_tokens = 0
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+    # Function to drop the chunks of a document from the collection
+    def delete_document(self, document_id):
+        where = {"document_id": document_id}
+        if self.lexical_index is None:
+            self.app.db.delete(where=where)
+        else:
+            ids = self.app.db.collection.get(where=where, include=[])["ids"]
+            self.app.db.delete(where=where)
+            self.lexical_index.delete(ids)
+        bump_collection_version(self.app)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
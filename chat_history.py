@@ -0,0 +1,89 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from bulk_embed import estimate_tokens
+
+# Default number of tokens the history may add to each prompt
+DEFAULT_TOKEN_BUDGET = 2048
+
+# Number of most recent messages that are always kept verbatim
+DEFAULT_MIN_RECENT_MESSAGES = 4
+
+SUMMARY_PROMPT = """
+Update the running summary of a conversation between a user and an AI assistant.
+Keep names, facts, numbers and open questions; drop pleasantries. Answer with the
+updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+"""
+
+# Token-budgeted chat history. The system instructions stay pinned and the most
+# recent messages are kept verbatim; older messages are folded into a rolling summary
+# on a background thread, so the prompt size (and per-turn latency) stays flat over
+# a long session. summarizer is a callable that answers a prompt with plain text.
+class ChatHistory:
+    def __init__(self, system_message, summarizer=None, token_budget=DEFAULT_TOKEN_BUDGET,
+                 min_recent_messages=DEFAULT_MIN_RECENT_MESSAGES):
+        self.system_message = {"role": "system", "content": system_message}
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.min_recent_messages = min_recent_messages
+        self.lock = threading.Lock()
+        self.recent = []
+        self.to_fold = []
+        self.summary = ""
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.folding = None
+
+    # Function to count the tokens of a list of messages
+    def count_tokens(self, messages):
+        return sum(estimate_tokens(message["content"] or "") for message in messages)
+
+    # Function to add a message, folding the oldest messages out once over budget
+    def append(self, message):
+        with self.lock:
+            self.recent.append(message)
+            fixed_tokens = estimate_tokens(self.system_message["content"]) + estimate_tokens(self.summary)
+            while (len(self.recent) > self.min_recent_messages
+                   and fixed_tokens + self.count_tokens(self.recent) > self.token_budget):
+                self.to_fold.append(self.recent.pop(0))
+            if self.summarizer is None:
+                self.to_fold = []
+            elif self.to_fold and (self.folding is None or self.folding.done()):
+                self.folding = self.executor.submit(self.fold)
+
+    # Function to merge folded messages into the rolling summary; runs in the background
+    def fold(self):
+        while True:
+            with self.lock:
+                if not self.to_fold:
+                    return
+                messages, self.to_fold = self.to_fold, []
+                summary = self.summary
+            max_words = max(50, self.token_budget // 4 * 3 // 4)
+            prompt = SUMMARY_PROMPT.format(
+                max_words=max_words,
+                summary=summary or "(empty)",
+                messages="\n".join(f"{message['role']}: {message['content']}" for message in messages),
+            )
+            try:
+                new_summary = self.summarizer(prompt).strip()
+            except Exception:
+                # Keep the messages so the next fold can retry
+                with self.lock:
+                    self.to_fold = messages + self.to_fold
+                return
+            with self.lock:
+                # Never let the summary take more than a quarter of the budget
+                self.summary = new_summary[: self.token_budget]
+
+    # Function to build the list of messages sent with a query
+    def messages(self):
+        with self.lock:
+            messages = [self.system_message]
+            if self.summary:
+                messages.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+            return messages + list(self.recent)
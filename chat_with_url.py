@@ -1,13 +1,20 @@
 import os
-import json
 import sys
 from embedchain import App
 from colorama import init
 from loguru import logger
-from tqdm import tqdm
 from rich.console import Console
 from rich.panel import Panel
 from rich.text import Text
+from answer_cache import AnswerCache
+from chat_history import ChatHistory
+from streaming import answer_chat_turn, generate, retrieve_contexts
+from crawler import crawl_into_app, crawl_state_path_for, read_url_list
+from topic_analysis import corpus_topics
+from grounding import GroundingScorer, topic_answer, topic_sources, topic_texts
+from embedding_cache import embedding_cache_path_for, install_embedding_cache
+from lexical_index import LexicalIndex, bootstrap_lexical_index, install_hybrid_search, lexical_index_path_for
+from tracing import instrument_app
 
 # Initialize colorama
 init(autoreset=True)
@@ -55,10 +62,44 @@ config = {
 logger.info("Initializing EmbedChain app with the configuration.")
 app = App.from_config(config=config)
 
-# Add data source (URL) to the app
-url = prompt_with_default("Enter the URL to chat with", "https://www.forbes.com/profile/elon-musk")
-logger.info(f"Adding URL to app: {url}")
-app.add(url)
+# Reuse embeddings of chunks that were embedded before, e.g. when the same URL is
+# added again to a reset collection
+install_embedding_cache(app, embedding_cache_path_for(config["vectordb"]["config"]["dir"]))
+
+# Time each stage when EMBEDCHAIN_TRACE or EMBEDCHAIN_METRICS is set (see tracing.py)
+instrument_app(app)
+
+# Fuse vector search with BM25 keyword search over the added pages, so exact names
+# and terms are retrieved even when their embeddings rank low. Crawled pages are
+# added to the keyword index as they are written.
+lexical_index = install_hybrid_search(app, LexicalIndex(
+    lexical_index_path_for(config["vectordb"]["config"]["dir"], config["vectordb"]["config"]["collection_name"])
+))
+
+# Add data source (URL, or a file with one URL per line) to the app
+url = prompt_with_default("Enter the URL (or a file of URLs) to chat with", "https://www.forbes.com/profile/elon-musk")
+crawl_depth = int(prompt_with_default("Enter crawl depth (0 adds only the given pages)", 0))
+if os.path.isfile(url) or crawl_depth > 0:
+    # Crawl concurrently and embed the fetched pages in batches
+    seeds = read_url_list(url) if os.path.isfile(url) else [url]
+    logger.info(f"Crawling {len(seeds)} seed URLs to depth {crawl_depth}")
+    crawler = crawl_into_app(
+        app,
+        seeds,
+        crawl_state_path_for(config["vectordb"]["config"]["dir"], config["vectordb"]["config"]["collection_name"]),
+        max_depth=crawl_depth,
+    )
+    logger.info(f"Crawl finished: {crawler.stats}")
+    console.print(f"[bold green]Crawl finished:[/bold green] {crawler.stats['fetched']} fetched, {crawler.stats['unchanged']} unchanged, {crawler.stats['skipped']} skipped, {crawler.stats['errors']} errors")
+else:
+    logger.info(f"Adding URL to app: {url}")
+    app.add(url)
+
+# Pages added with app.add, and collections built before the keyword index existed,
+# are indexed with a full sync
+synced = bootstrap_lexical_index(app, lexical_index)
+if synced:
+    logger.info(f"Keyword index: {synced[0]} chunks added, {synced[1]} removed")
 
 # Define system instructions
 system_instructions = """
@@ -68,48 +109,56 @@ If the data source does not contain enough information to answer a query, respon
 "The data source doesn't have enough information to answer this."
 """
 
-# Define chat history with system instructions
-chat_history = [{"role": "system", "content": system_instructions}]
+# Define chat history with system instructions; older turns are summarized to keep
+# the prompt within a fixed token budget
+chat_history = ChatHistory(system_instructions, summarizer=lambda prompt: generate(app, prompt))
+
+# Cache answers so repeated or near-duplicate questions skip retrieval and generation
+answer_cache = AnswerCache(app)
 
-# Function to query the app and handle potential errors
-def query_app(query, history=None):
+# Function to query the app and print the answer to the console as it is generated;
+# answered turns join the chat history. Returns (response, cancelled); Ctrl-C cancels
+# the generation.
+def stream_query_app(query):
     try:
-        response = app.query(query, chat_history=history)
+        response, cancelled = answer_chat_turn(
+            app, query, chat_history,
+            lambda token: console.print(token, end="", markup=False, highlight=False, soft_wrap=True),
+            answer_cache=answer_cache,
+        )
+        console.print()
         logger.debug(f"App response: {response}")
-        return response
+        return response, cancelled
     except Exception as e:
+        console.print()
         logger.error(f"Error querying app: {e}")
-        return None
+        return None, False
 
 # Function to calculate context relevance
 def calculate_context_relevance(topic):
-    # Implement your logic to calculate context relevance score
-    # You can use techniques like semantic similarity or keyword matching
-    # between the question and the retrieved context
-    return 0.8
+    return scorer.context_relevance(topic)
 
 # Function to calculate semantic similarity
 def calculate_semantic_similarity(answer, context):
-    # Implement your logic to calculate semantic similarity between answer and context
-    # You can use libraries like spaCy, NLTK, or sentence transformers
-    return 0.75
+    return scorer.semantic_similarity(answer, context)
 
 # Function to check if a source is relevant
-def is_relevant(source):
-    # Implement your logic to determine if a source is relevant
-    # You can use criteria like the presence of keywords or the source's reliability
-    return True
+def is_relevant(source, context=""):
+    return scorer.is_relevant(source, context)
 
-# Function to calculate confidence score
+# Function to calculate confidence score; averages in the model's own confidence
+# when the topic has one
 def calculate_confidence_score(topic):
     context_relevance = calculate_context_relevance(topic)
-    model_confidence = topic.get("model_confidence", 0.0)
+    model_confidence = topic.get("model_confidence")
+    if model_confidence is None:
+        return context_relevance * 100
     confidence_score = (context_relevance + model_confidence) / 2 * 100
     return confidence_score
 
 # Function to calculate grounding score
 def calculate_grounding_score(topic):
-    answer = topic.get("answer", "")
+    answer = topic_answer(topic)
     context = topic.get("context", "")
     similarity_score = calculate_semantic_similarity(answer, context)
     grounding_score = similarity_score * 100
@@ -117,42 +166,70 @@ def calculate_grounding_score(topic):
 
 # Function to calculate K Sym (Knowledge Symmetry)
 def calculate_k_sym(topic):
-    context_sources = topic.get("context_sources", [])
+    context_sources = topic_sources(topic)
     total_sources = len(context_sources)
-    relevant_sources = sum(1 for source in context_sources if is_relevant(source))
+    relevant_sources = sum(1 for source in context_sources if is_relevant(source, topic.get("context", "")))
     if total_sources == 0:
         return 0
     k_sym = relevant_sources / total_sources * 100
     return k_sym
 
-# Query the data source for top 5 topics with cited examples and grounding scores
-top_topics_query = """
-Analyze the data source and identify the top 5 topics based on frequency and relevance.
-For each topic, provide a brief description, grounding score, and cited examples from the data source, if available.
-Include metadata such as source URLs and timestamps for each example.
-If no examples are found, mention that no specific examples were found for that topic.
-"""
-
-top_topics_response = query_app(top_topics_query)
+# Find the top 5 topics across every added page: the chunk embeddings are clustered
+# and each cluster is labelled with one small LLM call. Frequencies are the true
+# cluster sizes and the examples are the chunks closest to each cluster centre.
+try:
+    corpus = corpus_topics(app)
+except Exception as e:
+    logger.error(f"Error analyzing topics: {e}")
+    corpus = {"chunks": 0, "clusters": []}
 
-# Check if the response is empty
-if not top_topics_response:
-    logger.error("Received an empty response from the query.")
-    console.print("[bold red]Received an empty response from the query.[/bold red]")
+# Check if any topics were found
+if not corpus["clusters"]:
+    logger.error("No topics were found in the data source.")
+    console.print("[bold red]No topics were found in the data source.[/bold red]")
     sys.exit(1)
 
-# Check if the response is a valid JSON string
-try:
-    top_topics_response = json.loads(top_topics_response)
-    logger.debug("Successfully parsed JSON response.")
-except json.JSONDecodeError as e:
-    logger.debug(f"Response is not a valid JSON string: {e}")
-    top_topics_response = {"response": top_topics_response}
+top_topics = corpus["clusters"][:5]
+
+# Function to retrieve the context a topic is scored against: the chunks a fresh
+# search for its label finds, minus its own examples, which would otherwise
+# trivially back themselves
+def topic_context(topic, examples):
+    try:
+        retrieved = retrieve_contexts(app, topic["label"], n_results=app.llm.config.number_documents + len(examples))
+    except Exception as e:
+        logger.error(f"Error retrieving context for scoring: {e}")
+        return []
+    return [text for text in retrieved if text not in examples][:app.llm.config.number_documents]
+
+top_topics_response = {"topics": []}
+for topic in top_topics:
+    examples = [representative["text"] for representative in topic["representatives"][:3]]
+    top_topics_response["topics"].append({
+        "title": topic["label"],
+        "description": topic["description"],
+        # Grounding compares the generated description against the topic's context
+        "answer": topic["description"],
+        "context": topic_context(topic, examples),
+        # How tightly the cluster's chunks gather around its centre
+        "model_confidence": topic["cohesion"],
+        "frequency": topic["size"],
+        "share": topic["share"],
+        "examples": [
+            {"text": representative["text"], "source_url": representative["source"]}
+            for representative in topic["representatives"][:3]
+        ],
+    })
+
+# Score every topic against its own context; embeddings are memoised and shared
+scorer = GroundingScorer(app)
 
 def format_topics_response(response):
     formatted_response = ""
     if isinstance(response, dict) and 'topics' in response:
         topics = response.get("topics", [])
+        # Embed every text the scores need in one batch
+        scorer.warm([text for topic in topics for text in topic_texts(topic)])
         for i, topic in enumerate(topics, start=1):
             title = topic.get("title", f"Topic {i}")
             description = topic.get("description", "No description available.")
@@ -164,6 +241,8 @@ def format_topics_response(response):
             formatted_response += f"[bold cyan]{'━'*100}[/bold cyan]\n"
             formatted_response += f"[bold yellow]Topic {i}: {title}[/bold yellow]\n"
             formatted_response += f"[green]{description}[/green]\n\n"
+            if "frequency" in topic:
+                formatted_response += f"[bold]Frequency:[/bold] {topic['frequency']} chunks ({topic['share']:.1%} of the data source)\n"
             formatted_response += f"[bold]Confidence Score:[/bold] {confidence_score:.1f}% | [bold]Grounding Score:[/bold] {grounding_score:.1f}% | [bold]K Sym:[/bold] {k_sym:.1f}%\n\n"
             formatted_response += f"[bold]Sources:[/bold]\n"
             if examples:
@@ -203,23 +282,16 @@ while True:
         console.print("[bold green]Goodbye![/bold green]")
         break
     else:
-        chat_history.append({"role": "user", "content": user_input})
-        app_response = query_app(user_input, history=chat_history)
-        
+        console.print("[bold magenta]Assistant:[/bold magenta] ", end="")
+        app_response, cancelled = stream_query_app(user_input)
+
+        if cancelled:
+            console.print("[bold yellow]Generation cancelled.[/bold yellow]")
+
         if not app_response:
             console.print("[bold red]Error querying app.[/bold red]")
             continue
-        
+
         if "The data source doesn't have enough information to answer this." in app_response:
-            chat_history.append({"role": "assistant", "content": app_response})
-            console.print(f"[bold red]Assistant:[/bold red] {app_response}")
-        else:
-            chat_history.append({"role": "assistant", "content": app_response})
-            console.print(f"[bold magenta]Assistant:[/bold magenta] {app_response}")
-
-# Use tqdm to monitor the embedding process
-for i in tqdm(range(100), desc="Embedding progress"):
-    import time
-    time.sleep(0.1)
-
-logger.info("Embedding process completed.")
+            console.print("[bold red]The data source could not answer this question.[/bold red]")
+
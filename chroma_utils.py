@@ -0,0 +1,24 @@
+# Helpers for reading a Chroma collection directly, shared by the indexes derived
+# from it (quantized_index.py, lexical_index.py) and by fan-out querying
+
+# Number of chunks read from Chroma per request when syncing a derived index
+SYNC_PAGE_SIZE = 2000
+
+# Function to list every chunk id in a Chroma collection, a page at a time
+def collection_ids(collection, page_size=SYNC_PAGE_SIZE):
+    ids = set()
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return ids
+        ids.update(page["ids"])
+        offset += len(page["ids"])
+
+# Function to turn embedchain's where dict into a Chroma filter
+def chroma_where(where):
+    if not where:
+        return None
+    if len(where) == 1:
+        return where
+    return {"$and": [{key: value} for key, value in where.items()]}
@@ -0,0 +1,365 @@
+import os
+import re
+import statistics
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from bulk_embed import estimate_tokens
+
+# Chunkers turn a parsed document into the chunks that get embedded. Both return a
+# list of {"text", "start", "tokens"} dicts, where start is the character offset of
+# the chunk in the document (used for PDF page numbers), plus "section" for chunks
+# under a markdown heading.
+
+# Token limit used when the embedder's own limit is unknown (bge-small and most
+# sentence-transformers models truncate at 512 tokens)
+DEFAULT_MAX_TOKENS = 512
+
+# Bounds for the automatically chosen chunk size, in embedder tokens
+MIN_TARGET_TOKENS = 96
+MAX_PROSE_TARGET_TOKENS = 256
+
+# Number of typical paragraphs an automatically sized prose chunk holds
+PARAGRAPHS_PER_CHUNK = 3
+
+# Chunks smaller than this are merged into a neighbour, in embedder tokens
+DEFAULT_MIN_TOKENS = 16
+
+MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+CODE_FENCE = re.compile(r"^\s*(```|~~~)")
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"\S+")
+
+# Counts tokens with the embedder's tokenizer, so chunk limits match what the
+# embedder actually sees. Falls back to estimate_tokens when the tokenizer cannot be
+# loaded (no transformers/tokenizers install, or the model is not cached offline).
+class TokenCounter:
+    def __init__(self, model_name=None):
+        self.model_name = model_name
+        self.max_tokens = DEFAULT_MAX_TOKENS
+        self.encode = None
+        if model_name:
+            self.load(model_name)
+
+    def load(self, model_name):
+        try:
+            from transformers import AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            if 0 < tokenizer.model_max_length <= 100000:
+                self.max_tokens = tokenizer.model_max_length
+            self.max_tokens -= tokenizer.num_special_tokens_to_add()
+            self.encode = lambda texts: [
+                len(ids) for ids in tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]
+            ]
+            return
+        except Exception:
+            pass
+        try:
+            from tokenizers import Tokenizer
+
+            tokenizer = Tokenizer.from_pretrained(model_name)
+            max_length = (tokenizer.truncation or {}).get("max_length")
+            if max_length:
+                self.max_tokens = max_length
+            self.max_tokens -= len(tokenizer.encode("").ids)
+            # Truncation would cap the counts of long texts at the model limit
+            tokenizer.no_truncation()
+            self.encode = lambda texts: [
+                len(encoding.ids) for encoding in tokenizer.encode_batch(texts, add_special_tokens=False)
+            ]
+        except Exception:
+            self.encode = None
+
+    @property
+    def exact(self):
+        return self.encode is not None
+
+    # Function to count the tokens of many texts in one call
+    def count(self, texts):
+        if not texts:
+            return []
+        if self.encode is None:
+            return [estimate_tokens(text) for text in texts]
+        return self.encode(texts)
+
+# Function to tell the chunkers which structure a document has, from its file name
+def document_kind(source):
+    extension = os.path.splitext(str(source).split("?")[0])[1].lower()
+    if extension in (".md", ".markdown"):
+        return "markdown"
+    if extension == ".pdf":
+        return "pdf"
+    return "text"
+
+# Function to split text[start:end] on a separator pattern into (start, end) spans
+# with surrounding whitespace trimmed
+def split_spans(text, start, end, pattern):
+    spans = []
+    position = start
+    for match in pattern.finditer(text, start, end):
+        spans.append((position, match.start()))
+        position = match.end()
+    spans.append((position, end))
+    trimmed = []
+    for span_start, span_end in spans:
+        segment = text[span_start:span_end]
+        stripped = segment.strip()
+        if stripped:
+            span_start += len(segment) - len(segment.lstrip())
+            trimmed.append((span_start, span_start + len(stripped)))
+    return trimmed
+
+# Function to find the markdown heading sections of a document as (start, end, title);
+# headings inside fenced code blocks are ignored
+def markdown_sections(text):
+    starts = []
+    in_fence = False
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        if CODE_FENCE.match(line):
+            in_fence = not in_fence
+        elif not in_fence:
+            match = MARKDOWN_HEADING.match(line.rstrip("\n"))
+            if match:
+                starts.append((offset, match.group(2)))
+        offset += len(line)
+    if not starts or starts[0][0] > 0:
+        starts.insert(0, (0, None))
+    return [
+        (start, starts[i + 1][0] if i + 1 < len(starts) else len(text), title)
+        for i, (start, title) in enumerate(starts)
+    ]
+
+# Function to split a document into structural sections as (start, end, title)
+def document_sections(text, kind, page_offsets=None):
+    if kind == "markdown":
+        return markdown_sections(text)
+    if page_offsets:
+        bounds = list(page_offsets) + [len(text)]
+        return [(bounds[i], bounds[i + 1], None) for i in range(len(page_offsets)) if bounds[i] < bounds[i + 1]]
+    return [(0, len(text), None)]
+
+# Fixed-size character chunker; the behaviour of the chunk_size/chunk_overlap/
+# min_chunk_size settings, kept for web pages and for comparison
+class CharacterChunker:
+    def __init__(self, chunk_size, chunk_overlap, min_chunk_size=0):
+        self.min_chunk_size = min_chunk_size
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+            add_start_index=True,
+        )
+        self.parameters = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "min_chunk_size": min_chunk_size}
+
+    # Function to describe the chunker's configuration, e.g. for the collection registry
+    def settings(self):
+        return {"strategy": "fixed", **self.parameters}
+
+    # Function to split a document; returns (chunks, parameters)
+    def split(self, text, source="", page_offsets=None):
+        chunks = [
+            {"text": document.page_content, "start": document.metadata.get("start_index", -1),
+             "tokens": estimate_tokens(document.page_content)}
+            for document in self.splitter.create_documents([text])
+            if len(document.page_content) >= self.min_chunk_size
+        ]
+        return chunks, self.parameters
+
+# Structure-aware chunker sized in embedder tokens. Documents are cut at markdown
+# headings and PDF pages, then packed from paragraphs; paragraphs that are too long
+# fall back to sentences and finally to word windows. Chunk size and overlap are
+# chosen per document unless fixed by target_tokens/overlap_tokens.
+class AdaptiveChunker:
+    def __init__(self, counter=None, max_tokens=None, target_tokens=None, overlap_tokens=None,
+                 min_tokens=DEFAULT_MIN_TOKENS):
+        self.counter = counter or TokenCounter()
+        self.max_tokens = min(max_tokens or self.counter.max_tokens, self.counter.max_tokens)
+        self.target_tokens = target_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min_tokens
+
+    # Function to describe the chunker's configuration, e.g. for the collection registry
+    def settings(self):
+        return {
+            "strategy": "adaptive",
+            "tokenizer": self.counter.model_name if self.counter.exact else "estimate",
+            "max_tokens": self.max_tokens,
+            "target_tokens": self.target_tokens,
+            "overlap_tokens": self.overlap_tokens,
+            "min_tokens": self.min_tokens,
+        }
+
+    # Function to pick the chunk size and overlap for one document from the token
+    # sizes of its sections and paragraphs
+    def choose_parameters(self, kind, section_tokens, paragraph_tokens):
+        if self.target_tokens:
+            target = min(self.target_tokens, self.max_tokens)
+            overlap = self.overlap_tokens if self.overlap_tokens is not None else target // 8
+            return {"target_tokens": target, "overlap_tokens": overlap, "max_tokens": self.max_tokens, "structure": "fixed"}
+        structured = len(section_tokens) > 1
+        median_section = statistics.median(section_tokens) if section_tokens else 0
+        if structured and median_section <= self.max_tokens:
+            # Sections are topical units that mostly fit in one chunk: align chunks
+            # with them and skip overlap
+            target = max(MIN_TARGET_TOKENS, min(int(median_section), self.max_tokens))
+            overlap = 0
+            structure = "headings" if kind == "markdown" else "pages"
+        else:
+            median_paragraph = statistics.median(paragraph_tokens) if paragraph_tokens else 0
+            target = int(median_paragraph * PARAGRAPHS_PER_CHUNK)
+            target = max(MIN_TARGET_TOKENS, min(target, MAX_PROSE_TARGET_TOKENS, self.max_tokens))
+            # Cut points inside running prose are arbitrary, so keep some context
+            overlap = target // 8
+            structure = "paragraphs"
+        if self.overlap_tokens is not None:
+            overlap = self.overlap_tokens
+        return {"target_tokens": target, "overlap_tokens": overlap, "max_tokens": self.max_tokens, "structure": structure}
+
+    # Function to break (start, end, tokens) units larger than limit into sentences,
+    # then word windows
+    def refine(self, text, units, limit):
+        if all(tokens <= limit for _, _, tokens in units):
+            return units
+        sentences = []
+        for start, end, tokens in units:
+            if tokens <= limit:
+                sentences.append([(start, end)])
+            else:
+                sentences.append(split_spans(text, start, end, SENTENCE_BREAK))
+        flat = [span for spans in sentences for span in spans if len(spans) > 1]
+        counts = iter(self.counter.count([text[start:end] for start, end in flat]))
+        refined = []
+        for (start, end, tokens), spans in zip(units, sentences):
+            if len(spans) == 1:
+                if tokens <= limit:
+                    refined.append((start, end, tokens))
+                else:
+                    refined.extend(self.word_windows(text, start, end, tokens, limit))
+                continue
+            for span_start, span_end in spans:
+                count = next(counts)
+                if count <= limit:
+                    refined.append((span_start, span_end, count))
+                else:
+                    refined.extend(self.word_windows(text, span_start, span_end, count, limit))
+        return refined
+
+    # Function to cut an over-long sentence into word windows of about limit tokens
+    def word_windows(self, text, start, end, tokens, limit):
+        words = [(match.start(), match.end()) for match in WORD.finditer(text, start, end)]
+        per_window = max(1, int(len(words) * limit / tokens))
+        windows = [(words[i][0], words[min(i + per_window, len(words)) - 1][1]) for i in range(0, len(words), per_window)]
+        return self.fit_spans(text, windows, limit)
+
+    # Function to count (start, end) spans exactly and halve any that are still over
+    # limit: between words when the span has several, else between characters, so
+    # text without whitespace (common in PDF extractions) is capped too. Returns
+    # (start, end, tokens) units in document order.
+    def fit_spans(self, text, spans, limit):
+        fitted = []
+        while spans:
+            counts = self.counter.count([text[start:end] for start, end in spans])
+            halves = []
+            for (start, end), count in zip(spans, counts):
+                if count <= limit or end - start <= 1:
+                    fitted.append((start, end, count))
+                    continue
+                words = [match.span() for match in WORD.finditer(text, start, end)]
+                if len(words) > 1:
+                    middle = len(words) // 2
+                    halves += [(start, words[middle - 1][1]), (words[middle][0], end)]
+                else:
+                    middle = (start + end) // 2
+                    halves += [(start, middle), (middle, end)]
+            spans = halves
+        return sorted(fitted)
+
+    # Function to pack units into chunks of at most target tokens, repeating up to
+    # overlap tokens of trailing units at the start of the next chunk
+    def pack(self, units, target, overlap):
+        chunks = []
+        current = []
+        current_tokens = 0
+        for unit in units:
+            if current and current_tokens + unit[2] > target:
+                chunks.append(current)
+                carried = []
+                carried_tokens = 0
+                for previous in reversed(current[1:]):
+                    if carried_tokens + previous[2] > overlap:
+                        break
+                    carried.insert(0, previous)
+                    carried_tokens += previous[2]
+                if carried_tokens + unit[2] > target:
+                    carried, carried_tokens = [], 0
+                current, current_tokens = carried, carried_tokens
+            current.append(unit)
+            current_tokens += unit[2]
+        if current:
+            chunks.append(current)
+        return [(chunk[0][0], chunk[-1][1], sum(unit[2] for unit in chunk)) for chunk in chunks]
+
+    # Function to split a document; the source path tells markdown and PDF structure
+    # apart. Returns (chunks, parameters).
+    def split(self, text, source="", page_offsets=None):
+        kind = document_kind(source)
+        sections = document_sections(text, kind, page_offsets)
+        section_paragraphs = [split_spans(text, start, end, PARAGRAPH_BREAK) for start, end, _ in sections]
+        counts = iter(self.counter.count([text[start:end] for spans in section_paragraphs for start, end in spans]))
+        section_units = [[(start, end, next(counts)) for start, end in spans] for spans in section_paragraphs]
+
+        # Sections too small to stand alone (e.g. a heading directly followed by a
+        # sub-heading) are folded into the next section
+        merged = []
+        carry_units, carry_title = [], None
+        for (start, end, title), units in zip(sections, section_units):
+            units = carry_units + units
+            if carry_title:
+                title = f"{carry_title} / {title}" if title else carry_title
+            if sum(tokens for _, _, tokens in units) < self.min_tokens:
+                carry_units, carry_title = units, title
+                continue
+            merged.append((title, units))
+            carry_units, carry_title = [], None
+        if carry_units:
+            if merged:
+                merged[-1] = (merged[-1][0], merged[-1][1] + carry_units)
+            else:
+                merged.append((carry_title, carry_units))
+
+        parameters = self.choose_parameters(
+            kind,
+            [sum(tokens for _, _, tokens in units) for _, units in merged],
+            [tokens for _, units in merged for _, _, tokens in units],
+        )
+        target, overlap = parameters["target_tokens"], parameters["overlap_tokens"]
+        chunks = []
+        for title, units in merged:
+            for start, end, tokens in self.pack(self.refine(text, units, target), target, overlap):
+                # A small tail is merged into the chunk before it when both fit
+                if chunks and tokens < self.min_tokens and chunks[-1]["tokens"] + tokens <= self.max_tokens:
+                    previous = chunks[-1]
+                    previous["text"] = text[previous["start"]:end]
+                    previous["tokens"] += tokens
+                    continue
+                chunk = {"text": text[start:end], "start": start, "tokens": tokens}
+                if title:
+                    chunk["section"] = title
+                chunks.append(chunk)
+        return self.cap_chunks(text, chunks), parameters
+
+    # Function to make sure no chunk is over max_tokens. Chunk sizes so far are sums of
+    # their units' counts, which can differ from the count of the joined text, so each
+    # chunk is counted as a whole and split again where it is over the limit.
+    def cap_chunks(self, text, chunks):
+        counts = self.counter.count([chunk["text"] for chunk in chunks])
+        capped = []
+        for chunk, count in zip(chunks, counts):
+            if count <= self.max_tokens:
+                capped.append(dict(chunk, tokens=count))
+                continue
+            start = chunk["start"]
+            for span_start, span_end, tokens in self.fit_spans(text, [(start, start + len(chunk["text"]))], self.max_tokens):
+                capped.append(dict(chunk, text=text[span_start:span_end], start=span_start, tokens=tokens))
+        return capped
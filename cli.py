@@ -0,0 +1,303 @@
+import argparse
+import atexit
+import json
+import os
+import sys
+from colorama import Fore, Style
+from tracing import tracer
+
+# Settings used when neither a flag nor the config file gives a value
+DEFAULTS = {
+    "collection": "default_collection",
+    "db_dir": "databases",
+    "chunk_size": 300,
+    "chunk_overlap": 50,
+    "min_chunk_size": 200,
+    "chunking": "adaptive",
+    "max_chunk_tokens": None,
+    "vector_search": "chroma",
+    "retrieval": "hybrid",
+    "llm_model": "llama3:latest",
+    "llm_base_url": "http://localhost:11434",
+    "embedder_model": "BAAI/bge-small-en-v1.5",
+    "workers": os.cpu_count() or 1,
+    "batch_size": 64,
+    "max_tokens_per_batch": 16384,
+    "output_dir": "output",
+    "llm_concurrency": 2,
+    "clusters": None,
+    "top_topics": 5,
+    "collections": None,
+    "fanout_workers": 8,
+    "trace": None,
+    "metrics": None,
+}
+
+# Function to add the flags shared by every command. Defaults are None so that
+# values from the config file can fill in anything not given on the command line.
+def add_common_arguments(parser):
+    parser.add_argument("--config", help="JSON file with default settings (keys match the flag names, e.g. chunk_size)")
+    parser.add_argument("--collection", help="Chroma collection name")
+    parser.add_argument("--db-dir", dest="db_dir", help="Directory holding the Chroma databases")
+    parser.add_argument("--llm-model", dest="llm_model", help="Ollama model name")
+    parser.add_argument("--llm-base-url", dest="llm_base_url", help="Ollama base URL")
+    parser.add_argument("--embedder-model", dest="embedder_model", help="HuggingFace embedding model")
+    parser.add_argument("--chunking", choices=["adaptive", "fixed"],
+                        help="adaptive sizes chunks per document in embedder tokens; fixed uses the character sizes below")
+    parser.add_argument("--max-chunk-tokens", dest="max_chunk_tokens", type=int, help="Upper bound on adaptive chunk size in tokens")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int, help="Chunk size in characters (fixed chunking)")
+    parser.add_argument("--chunk-overlap", dest="chunk_overlap", type=int, help="Chunk overlap in characters (fixed chunking)")
+    parser.add_argument("--min-chunk-size", dest="min_chunk_size", type=int, help="Minimum chunk size in characters (fixed chunking)")
+    parser.add_argument("--vector-search", dest="vector_search", choices=["chroma", "int8", "binary"],
+                        help="Search Chroma directly, or a memory-mapped int8/binary quantized index of the collection")
+    parser.add_argument("--retrieval", choices=["hybrid", "dense"],
+                        help="hybrid fuses vector search with BM25 keyword search; dense uses vector search only")
+    parser.add_argument("--trace", help="Append a JSON line per pipeline stage span to this file")
+    parser.add_argument("--metrics", help="Write per-stage histograms and counters in Prometheus text format to this file on exit")
+
+# Function to build the argument parser
+def build_parser():
+    parser = argparse.ArgumentParser(description="Ingest documents, analyze topics and chat with an EmbedChain collection.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="Embed new or changed files from a directory")
+    add_common_arguments(ingest)
+    ingest.add_argument("directory", help="Directory containing .txt, .md and .pdf files")
+    ingest.add_argument("--workers", type=int, help="Number of parsing worker processes")
+    ingest.add_argument("--batch-size", dest="batch_size", type=int, help="Chunks per embedding batch")
+    ingest.add_argument("--max-tokens-per-batch", dest="max_tokens_per_batch", type=int, help="Estimated tokens per embedding batch")
+
+    analyze = commands.add_parser("analyze", help="Cluster the collection into topics and write a report for every topic area in a file")
+    add_common_arguments(analyze)
+    analyze.add_argument("topics_file", help="File with one topic area or query per line")
+    analyze.add_argument("--output-dir", dest="output_dir", help="Directory for the reports")
+    analyze.add_argument("--llm-concurrency", dest="llm_concurrency", type=int, help="Generations sent to the LLM at once")
+    analyze.add_argument("--clusters", type=int, help="Number of topic clusters (default: chosen from the collection size)")
+    analyze.add_argument("--top-topics", dest="top_topics", type=int, help="Topics listed in each report")
+
+    chat = commands.add_parser("chat", help="Chat with a collection, or with several at once")
+    add_common_arguments(chat)
+    chat.add_argument("--collections", help="Comma-separated registered collections to search together; answers come from one generation")
+    chat.add_argument("--fanout-workers", dest="fanout_workers", type=int, help="Collections searched at the same time")
+
+    collections = commands.add_parser("collections", help="List the registered collections of a Chroma directory")
+    collections.add_argument("--config", help="JSON file with default settings")
+    collections.add_argument("--db-dir", dest="db_dir", help="Directory holding the Chroma databases")
+
+    index = commands.add_parser("index", help="Build or refresh the quantized and keyword indexes of a collection")
+    add_common_arguments(index)
+    return parser
+
+# Function to merge settings: command-line flags win over the config file, which
+# wins over DEFAULTS
+def resolve_settings(args):
+    file_settings = {}
+    if args.config:
+        with open(args.config, "r") as f:
+            file_settings = json.load(f)
+    settings = dict(DEFAULTS)
+    settings.update({key: value for key, value in file_settings.items() if value is not None})
+    settings.update({key: value for key, value in vars(args).items() if value is not None})
+    return settings
+
+# Function to load the app for a collection, with the embedding cache in front of the embedder.
+# With --vector-search int8/binary, queries go through the collection's quantized index,
+# kept as app.quantized_index (None otherwise). With --retrieval hybrid, the vector search
+# is fused with BM25 over the keyword index kept as app.lexical_index (None otherwise).
+# Heavy imports happen here so that --help stays fast.
+def load_app(settings):
+    from embedchain import App
+    from embedding_cache import embedding_cache_path_for, install_embedding_cache
+    from pipeline import build_config
+    from lexical_index import LexicalIndex, install_hybrid_search, lexical_index_path_for
+    from quantized_index import QuantizedIndex, install_quantized_search, quantized_index_is_stale, quantized_index_path_for
+    from tracing import instrument_app
+
+    config = build_config(
+        settings["collection"],
+        db_dir=settings["db_dir"],
+        chunk_size=settings["chunk_size"],
+        chunk_overlap=settings["chunk_overlap"],
+        min_chunk_size=settings["min_chunk_size"],
+        llm_model=settings["llm_model"],
+        llm_base_url=settings["llm_base_url"],
+        embedder_model=settings["embedder_model"],
+    )
+    app = App.from_config(config=config)
+    install_embedding_cache(app, embedding_cache_path_for(settings["db_dir"]))
+    app.quantized_index = None
+    mode = settings["vector_search"]
+    if mode != "chroma":
+        index = QuantizedIndex(quantized_index_path_for(settings["db_dir"], settings["collection"], mode), mode)
+        app.quantized_index = install_quantized_search(app, index)
+    app.lexical_index = None
+    if settings["retrieval"] == "hybrid":
+        app.lexical_index = install_hybrid_search(
+            app, LexicalIndex(lexical_index_path_for(settings["db_dir"], settings["collection"]))
+        )
+    # Indexes that are missing or behind the collection (never built, or written to by
+    # the interactive scripts or the daemon) are brought up to date before the first query
+    quantized_stale = app.quantized_index is not None and quantized_index_is_stale(app, app.quantized_index)
+    # The keyword index is otherwise updated as chunks are written, so only a
+    # collection built without it needs a full sync
+    lexical_stale = app.lexical_index is not None and len(app.lexical_index) != app.db.count()
+    if quantized_stale or lexical_stale:
+        sync_index(app)
+    instrument_app(app)
+    return app, config
+
+# Function to bring the quantized and keyword indexes (if any) up to date with the
+# collection. After ingestion only the quantized index needs it (lexical=False), as
+# BulkIndexer updates the keyword index with every batch it writes.
+def sync_index(app, lexical=True):
+    from lexical_index import sync_lexical_index
+    from quantized_index import sync_quantized_index
+
+    if app.quantized_index is not None:
+        added, removed = sync_quantized_index(app, app.quantized_index)
+        print(Fore.CYAN + f"Quantized index: {added} vectors added, {removed} removed, {len(app.quantized_index)} indexed." + Style.RESET_ALL)
+    if lexical and app.lexical_index is not None:
+        added, removed = sync_lexical_index(app, app.lexical_index)
+        print(Fore.CYAN + f"Keyword index: {added} chunks added, {removed} removed, {len(app.lexical_index)} indexed." + Style.RESET_ALL)
+
+# Function to switch tracing on when --trace or --metrics is given
+def configure_tracing(settings):
+    if not (settings["trace"] or settings["metrics"]):
+        return
+    tracer.enable(settings["trace"])
+    if settings["metrics"]:
+        atexit.register(tracer.write_prometheus, settings["metrics"])
+
+def run_ingest(settings):
+    from pipeline import build_chunker, ingest_directory
+
+    app, config = load_app(settings)
+    stats = ingest_directory(
+        app,
+        config,
+        settings["directory"],
+        workers=settings["workers"],
+        batch_size=settings["batch_size"],
+        max_tokens_per_batch=settings["max_tokens_per_batch"],
+        chunker=build_chunker(config, settings["chunking"], settings["max_chunk_tokens"]),
+    )
+    sync_index(app, lexical=False)
+    if stats.characters.count > 0:
+        print(stats.to_markdown())
+
+def run_analyze(settings):
+    from doc_stats import collection_statistics, collection_statistics_markdown
+    from topic_analysis import analyze_topics, read_topics, write_topic_report
+
+    topic_areas = read_topics(settings["topics_file"])
+    if not topic_areas:
+        print(Fore.RED + f"No topic areas found in {settings['topics_file']}." + Style.RESET_ALL)
+        return 1
+    app, config = load_app(settings)
+    statistics_table = collection_statistics_markdown(settings["collection"], collection_statistics(app))
+    print(Fore.CYAN + f"Clustering the collection and labelling topics with {settings['llm_concurrency']} concurrent LLM calls." + Style.RESET_ALL)
+    try:
+        results = analyze_topics(
+            app,
+            topic_areas,
+            llm_concurrency=settings["llm_concurrency"],
+            clusters=settings["clusters"],
+            top_n=settings["top_topics"],
+        )
+    except Exception as e:
+        print(Fore.RED + f"Error analyzing topics: {e}" + Style.RESET_ALL)
+        return 1
+    failures = 0
+    for topic_area, response in results.items():
+        if isinstance(response, Exception):
+            failures += 1
+            print(Fore.RED + f"Error analyzing '{topic_area}': {response}" + Style.RESET_ALL)
+            continue
+        report_path = write_topic_report(settings["output_dir"], topic_area, response, statistics_table)
+        print(Fore.CYAN + f"Report for '{topic_area}' has been saved to {report_path}" + Style.RESET_ALL)
+    return 1 if failures else 0
+
+def run_chat(settings):
+    from answer_cache import AnswerCache
+    from chat_history import ChatHistory
+    from streaming import answer_chat_turn, generate
+    from topic_analysis import SYSTEM_MESSAGE
+
+    app, config = load_app(settings)
+    chat_history = ChatHistory(SYSTEM_MESSAGE, summarizer=lambda prompt: generate(app, prompt))
+    fanout = open_fanout(app, settings)
+    # The answer cache only tracks changes to the app's own collection
+    answer_cache = AnswerCache(app) if fanout is None else None
+    try:
+        while True:
+            user_query = input("Enter your query (or type 'exit' to end): ")
+            if user_query.lower() == 'exit':
+                break
+
+            print(Fore.GREEN + "Response:" + Style.RESET_ALL)
+            # Print tokens as they are generated; Ctrl-C cancels the generation
+            _, cancelled = answer_chat_turn(
+                app, user_query, chat_history, lambda token: print(token, end="", flush=True),
+                answer_cache=answer_cache, fanout=fanout,
+            )
+            print()
+            if cancelled:
+                print(Fore.YELLOW + "Generation cancelled." + Style.RESET_ALL)
+    finally:
+        if fanout is not None:
+            fanout.close()
+
+# Function to open a fan-out query over the collections given with --collections
+# (None when the chat uses the app's collection only)
+def open_fanout(app, settings):
+    from fanout import FanOutQuery, open_collections
+    from registry import CollectionRegistry, registry_path_for
+
+    if not settings["collections"]:
+        return None
+    names = [name.strip() for name in settings["collections"].split(",") if name.strip()]
+    registry = CollectionRegistry(registry_path_for(settings["db_dir"]))
+    try:
+        collections = open_collections(app, registry, names)
+    finally:
+        registry.close()
+    print(Fore.CYAN + f"Searching {len(collections)} collections: {', '.join(collections)}." + Style.RESET_ALL)
+    return FanOutQuery(app, collections, workers=settings["fanout_workers"])
+
+def run_collections(settings):
+    from registry import CollectionRegistry, registry_markdown, registry_path_for
+
+    path = registry_path_for(settings["db_dir"])
+    entries = []
+    if os.path.exists(path):
+        registry = CollectionRegistry(path)
+        entries = registry.entries()
+        registry.close()
+    if not entries:
+        print(Fore.YELLOW + f"No collections are registered in {settings['db_dir']}." + Style.RESET_ALL)
+        return 0
+    print(registry_markdown(entries))
+
+def run_index(settings):
+    if settings["vector_search"] == "chroma" and settings["retrieval"] == "dense":
+        print(Fore.RED + "Nothing to index: choose --vector-search int8/binary or --retrieval hybrid." + Style.RESET_ALL)
+        return 1
+    app, config = load_app(settings)
+    sync_index(app)
+
+COMMANDS = {
+    "ingest": run_ingest,
+    "analyze": run_analyze,
+    "chat": run_chat,
+    "index": run_index,
+    "collections": run_collections,
+}
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    settings = resolve_settings(args)
+    configure_tracing(settings)
+    return COMMANDS[args.command](settings) or 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+# Thin client for daemon.py. Only the standard library is imported, so a one-off
+# query costs no model or vector store start-up.
+DEFAULT_URL = "http://127.0.0.1:8765"
+
+# Function to POST a JSON request to the daemon and return the open response
+def post(url, path, body, timeout=None):
+    request = urllib.request.Request(
+        url.rstrip("/") + path,
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    return urllib.request.urlopen(request, timeout=timeout)
+
+# Function to send a query and print the answer as it streams in
+def run_query(url, query):
+    with post(url, "/query", {"query": query}) as response:
+        for line in response:
+            message = json.loads(line)
+            if "token" in message:
+                sys.stdout.write(message["token"])
+                sys.stdout.flush()
+            elif "error" in message:
+                print(f"\nError: {message['error']}", file=sys.stderr)
+                return 1
+    print()
+    return 0
+
+# Function to ask the daemon to ingest a directory and print the summary
+def run_ingest(url, directory, workers=None):
+    with post(url, "/ingest", {"directory": os.path.abspath(directory), "workers": workers}) as response:
+        print(json.dumps(json.load(response), indent=2))
+    return 0
+
+def run_health(url):
+    with urllib.request.urlopen(url.rstrip("/") + "/health", timeout=5) as response:
+        print(json.dumps(json.load(response), indent=2))
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send requests to a running daemon.py.")
+    parser.add_argument("--url", default=DEFAULT_URL, help="Daemon address")
+    commands = parser.add_subparsers(dest="command", required=True)
+    query = commands.add_parser("query", help="Ask a question")
+    query.add_argument("query")
+    ingest = commands.add_parser("ingest", help="Embed new or changed files from a directory")
+    ingest.add_argument("directory")
+    ingest.add_argument("--workers", type=int)
+    commands.add_parser("health", help="Check that the daemon is up")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "query":
+            return run_query(args.url, args.query)
+        if args.command == "ingest":
+            return run_ingest(args.url, args.directory, args.workers)
+        return run_health(args.url)
+    except urllib.error.HTTPError as e:
+        print(f"Error: {e.read().decode('utf-8', errors='replace')}", file=sys.stderr)
+        return 1
+    except urllib.error.URLError as e:
+        print(f"Could not reach the daemon at {args.url}: {e.reason}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+from urllib.parse import urldefrag, urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+import aiohttp
+from bs4 import BeautifulSoup
+from tqdm import tqdm
+from bulk_embed import BulkIndexer
+from chunking import CharacterChunker
+from manifest import document_id_for
+
+# Default number of pages fetched at the same time
+DEFAULT_CONCURRENCY = 16
+
+# Default number of pooled connections per host
+DEFAULT_CONNECTIONS_PER_HOST = 4
+
+# Number of fetched pages allowed to wait for the embedding stage
+DEFAULT_QUEUE_SIZE = 32
+
+# Chunk settings for web pages, matching embedchain's web page chunker
+WEB_CHUNK_SIZE = 2000
+WEB_CHUNK_OVERLAP = 0
+
+USER_AGENT = "embedchain-starter-crawler"
+
+# Function to build the crawl state path for a collection, stored next to the Chroma data
+def crawl_state_path_for(db_dir, collection_name):
+    return os.path.join(db_dir, f"{collection_name}_crawl.sqlite3")
+
+# Function to read a URL list file (one URL per line, # starts a comment)
+def read_url_list(path):
+    with open(path, 'r') as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if line and not line.startswith("#")]
+
+# Function to extract the title, visible text and links of an HTML page
+def html_to_text(html):
+    soup = BeautifulSoup(html, "html.parser")
+    links = [a["href"] for a in soup.find_all("a", href=True)]
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    for tag in soup(["script", "style", "noscript", "nav", "header", "footer", "aside"]):
+        tag.decompose()
+    lines = (line.strip() for line in soup.get_text("\n").splitlines())
+    return title, "\n".join(line for line in lines if line), links
+
+# Persistent per-collection record of crawled pages, used for ETag/Last-Modified
+# conditional requests and to skip pages whose content did not change
+class CrawlState:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT NOT NULL,
+                links TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    # Function to look up the stored state of a URL
+    def get(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, content_hash, links FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "content_hash": row[2], "links": json.loads(row[3])}
+
+    # Function to record a URL as indexed, with its outgoing links so that an
+    # unchanged page can still be crawled through on the next run
+    def record(self, url, etag, last_modified, content_hash, links):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, links) VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash, json.dumps(links)),
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# Concurrent crawler. Pages are fetched by a fixed number of asyncio workers over a
+# pooled aiohttp session, limited per host, restricted to the seed hosts and a link
+# depth, and checked against each host's robots.txt.
+class Crawler:
+    def __init__(self, seeds, max_depth=0, same_domain=True, concurrency=DEFAULT_CONCURRENCY,
+                 connections_per_host=DEFAULT_CONNECTIONS_PER_HOST, state=None, timeout=30):
+        self.seeds = seeds
+        self.max_depth = max_depth
+        self.same_domain = same_domain
+        self.concurrency = concurrency
+        self.connections_per_host = connections_per_host
+        self.state = state
+        self.timeout = timeout
+        self.allowed_hosts = {urlparse(seed).netloc for seed in seeds}
+        self.robots = {}
+        self.seen = set()
+        self.stopped = False
+        self.stats = {"fetched": 0, "unchanged": 0, "skipped": 0, "errors": 0}
+
+    # Function to check whether a link is inside the crawl scope
+    def in_scope(self, url):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https"):
+            return False
+        return not self.same_domain or parsed.netloc in self.allowed_hosts
+
+    # Function to download and parse a host's robots.txt; a missing file allows everything
+    async def fetch_robots(self, session, root):
+        parser = RobotFileParser()
+        try:
+            async with session.get(root + "/robots.txt") as response:
+                if response.status >= 400:
+                    parser.allow_all = True
+                else:
+                    parser.parse((await response.text(errors="replace")).splitlines())
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            parser.allow_all = True
+        return parser
+
+    # Function to check a URL against its host's robots.txt (fetched once per host)
+    async def allowed_by_robots(self, session, url):
+        parsed = urlparse(url)
+        root = f"{parsed.scheme}://{parsed.netloc}"
+        if root not in self.robots:
+            self.robots[root] = asyncio.ensure_future(self.fetch_robots(session, root))
+        parser = await self.robots[root]
+        return parser.can_fetch(USER_AGENT, url)
+
+    # Function to fetch one page with a conditional request. Returns None for pages
+    # that are not HTML/text or failed to load, and {"not_modified": True} on a 304.
+    async def fetch(self, session, url, previous):
+        headers = {}
+        if previous and previous["etag"]:
+            headers["If-None-Match"] = previous["etag"]
+        if previous and previous["last_modified"]:
+            headers["If-Modified-Since"] = previous["last_modified"]
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                self.stats["unchanged"] += 1
+                return {"not_modified": True}
+            if response.status != 200:
+                self.stats["skipped"] += 1
+                return None
+            content_type = response.headers.get("Content-Type", "")
+            if "html" not in content_type and "text/plain" not in content_type:
+                self.stats["skipped"] += 1
+                return None
+            body = await response.text(errors="replace")
+            self.stats["fetched"] += 1
+            if "html" in content_type:
+                title, text, links = html_to_text(body)
+            else:
+                title, text, links = "", body, []
+            return {
+                "text": text,
+                "links": links,
+                "metadata": {"source": url, "title": title},
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "content_hash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+                "previously_indexed": previous is not None,
+            }
+
+    # Function to visit one URL: fetch it, queue its in-scope links and hand it on
+    async def visit(self, session, frontier, url, depth, on_page):
+        if not await self.allowed_by_robots(session, url):
+            self.stats["skipped"] += 1
+            return
+        previous = self.state.get(url) if self.state else None
+        page = await self.fetch(session, url, previous)
+        if page is None:
+            return
+        if page.get("not_modified"):
+            links = previous["links"] if previous else []
+        else:
+            links = page["links"]
+        if depth < self.max_depth:
+            for link in links:
+                link = urldefrag(urljoin(url, link))[0]
+                if link not in self.seen and self.in_scope(link):
+                    self.seen.add(link)
+                    frontier.put_nowait((link, depth + 1))
+        if page.get("not_modified"):
+            return
+        if previous and previous["content_hash"] == page["content_hash"]:
+            # Same content behind new validators; refresh them without re-embedding
+            self.stats["unchanged"] += 1
+            self.state.record(url, page["etag"], page["last_modified"], page["content_hash"], page["links"])
+            return
+        await on_page(page)
+
+    async def worker(self, session, frontier, on_page):
+        while True:
+            url, depth = await frontier.get()
+            try:
+                if not self.stopped:
+                    await self.visit(session, frontier, url, depth, on_page)
+            except Exception:
+                # A failed page must not stop the worker, or the crawl would never finish
+                self.stats["errors"] += 1
+            finally:
+                frontier.task_done()
+
+    # Function to crawl from the seeds, awaiting on_page(page) for every new or changed page
+    async def run(self, on_page):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.connections_per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers={"User-Agent": USER_AGENT}) as session:
+            frontier = asyncio.Queue()
+            for seed in self.seeds:
+                seed = urldefrag(seed)[0]
+                if seed not in self.seen:
+                    self.seen.add(seed)
+                    frontier.put_nowait((seed, 0))
+            workers = [asyncio.create_task(self.worker(session, frontier, on_page)) for _ in range(self.concurrency)]
+            try:
+                await frontier.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+# Function to stream crawled pages to synchronous code. The crawl runs on its own
+# event loop in a background thread; a bounded queue feeds the embedding stage.
+def iter_crawled_pages(crawler, queue_size=DEFAULT_QUEUE_SIZE):
+    pages = queue.Queue(maxsize=queue_size)
+    crawl_errors = []
+
+    async def on_page(page):
+        loop = asyncio.get_running_loop()
+        while not crawler.stopped:
+            try:
+                await loop.run_in_executor(None, lambda: pages.put(page, timeout=0.1))
+                return
+            except queue.Full:
+                continue
+
+    def run():
+        try:
+            asyncio.run(crawler.run(on_page))
+        except Exception as e:
+            crawl_errors.append(e)
+        finally:
+            pages.put(None)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            page = pages.get()
+            if page is None:
+                break
+            yield page
+        if crawl_errors:
+            raise crawl_errors[0]
+    finally:
+        # Unblock the crawler if the consumer stopped early
+        crawler.stopped = True
+        while thread.is_alive():
+            try:
+                pages.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+# Function to crawl the seeds and embed new or changed pages into the app's collection
+# in batches. Returns the crawler, whose stats summarise the run.
+def crawl_into_app(app, seeds, state_path, max_depth=0, same_domain=True, concurrency=DEFAULT_CONCURRENCY,
+                   connections_per_host=DEFAULT_CONNECTIONS_PER_HOST, batch_size=None):
+    state = CrawlState(state_path)
+    crawler = Crawler(
+        seeds,
+        max_depth=max_depth,
+        same_domain=same_domain,
+        concurrency=concurrency,
+        connections_per_host=connections_per_host,
+        state=state,
+    )
+    indexer_options = {"batch_size": batch_size} if batch_size else {}
+    try:
+        with BulkIndexer(app, CharacterChunker(WEB_CHUNK_SIZE, WEB_CHUNK_OVERLAP), **indexer_options) as indexer:
+            for page in tqdm(iter_crawled_pages(crawler), desc="Crawling pages"):
+                url = page["metadata"]["source"]
+                document_id = document_id_for(url)
+                page["metadata"]["document_id"] = document_id
+                if page["previously_indexed"]:
+                    indexer.delete_document(document_id)
+                indexer.add(
+                    page["text"],
+                    page["metadata"],
+                    on_indexed=lambda page=page, url=url: state.record(
+                        url, page["etag"], page["last_modified"], page["content_hash"], page["links"]
+                    ),
+                )
+    finally:
+        state.close()
+    return crawler
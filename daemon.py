@@ -0,0 +1,151 @@
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cli import add_common_arguments, configure_tracing, load_app, resolve_settings, sync_index
+from tracing import tracer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Long-lived service state: the loaded App (embedder and vector store stay warm),
+# its answer cache, and a lock so only one ingestion runs at a time
+class Service:
+    def __init__(self, settings):
+        from answer_cache import AnswerCache
+        from pipeline import build_chunker
+
+        self.settings = settings
+        self.app, self.config = load_app(settings)
+        self.chunker = build_chunker(self.config, settings["chunking"], settings["max_chunk_tokens"])
+        # Run one embedding so the model is fully loaded before the first request
+        self.app.embedder.embedding_fn(["warm up"])
+        self.answer_cache = AnswerCache(self.app)
+        self.ingest_lock = threading.Lock()
+
+    # Function to answer a query; yields the answer tokens as they are generated
+    def query(self, query, history=None):
+        from streaming import stream_answer
+
+        with tracer.span("query", streamed=True) as span:
+            cached_response, cache_key = self.answer_cache.lookup(query, history)
+            span.set(cached=cached_response is not None)
+            if cached_response is not None:
+                yield cached_response
+                return
+            parts = []
+            for token in stream_answer(self.app, query, history=history):
+                parts.append(token)
+                yield token
+        if parts:
+            self.answer_cache.store(cache_key, "".join(parts))
+
+    # Function to ingest a directory into the collection
+    def ingest(self, directory, workers=None):
+        from pipeline import ingest_directory
+
+        with self.ingest_lock:
+            stats = ingest_directory(
+                self.app,
+                self.config,
+                directory,
+                workers=workers or self.settings["workers"],
+                batch_size=self.settings["batch_size"],
+                max_tokens_per_batch=self.settings["max_tokens_per_batch"],
+                chunker=self.chunker,
+            )
+            sync_index(self.app, lexical=False)
+        return {
+            "documents": stats.characters.count,
+            "chunks": stats.chunk_lengths.count,
+            "parse_seconds": stats.parse_seconds,
+            "embed_seconds": stats.embed_seconds,
+        }
+
+# Request handler. Queries stream newline-delimited JSON ({"token": ...} lines, then
+# {"done": true}); ingest and health answer with a single JSON object, and /metrics
+# serves the stage metrics in Prometheus text format when tracing is enabled.
+class RequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", "collection": self.service.settings["collection"]})
+        elif self.path == "/metrics":
+            payload = tracer.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            request = self.read_json()
+        except ValueError:
+            self.send_json(400, {"error": "invalid JSON"})
+            return
+        if self.path == "/query":
+            if not request.get("query"):
+                self.send_json(400, {"error": "missing query"})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            try:
+                for token in self.service.query(request["query"], history=request.get("history")):
+                    self.wfile.write(json.dumps({"token": token}).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+                self.wfile.write(b'{"done": true}\n')
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            except Exception as e:
+                self.wfile.write(json.dumps({"error": str(e)}).encode("utf-8") + b"\n")
+        elif self.path == "/ingest":
+            if not request.get("directory"):
+                self.send_json(400, {"error": "missing directory"})
+                return
+            try:
+                self.send_json(200, self.service.ingest(request["directory"], workers=request.get("workers")))
+            except Exception as e:
+                self.send_json(500, {"error": str(e)})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep an EmbedChain collection loaded and serve ingest and query requests on localhost.")
+    add_common_arguments(parser)
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("--workers", type=int, help="Number of parsing worker processes for ingestion")
+    args = parser.parse_args(argv)
+    settings = resolve_settings(args)
+    configure_tracing(settings)
+
+    print(f"Loading collection {settings['collection']}...")
+    RequestHandler.service = Service(settings)
+    server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import json
+import os
+from bulk_embed import estimate_tokens
+
+# Upper bounds (in characters) of the chunk length histogram buckets
+CHUNK_LENGTH_BUCKETS = [100, 200, 300, 400, 500, 750, 1000, 1500, 2000]
+
+# Number of collection records read per page when counting documents
+COLLECTION_PAGE_SIZE = 5000
+
+# Running count, total, minimum and maximum of one metric
+class RunningStat:
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+# Single-pass statistics collector fed during ingestion. Only numbers are kept, per
+# file and in aggregate, so the report can be produced without holding any text.
+class IngestionStats:
+    def __init__(self):
+        self.files = {}
+        self.characters = RunningStat()
+        self.tokens = RunningStat()
+        self.chunk_lengths = RunningStat()
+        self.parse_seconds = 0.0
+        self.embed_seconds = 0.0
+        self.histogram = [0] * (len(CHUNK_LENGTH_BUCKETS) + 1)
+        self.file_types = {}
+
+    # Function to record a parsed document
+    def record_document(self, source, text, parse_seconds=0.0):
+        file_type = os.path.splitext(source)[1].lower() or "(none)"
+        tokens = estimate_tokens(text)
+        self.files[source] = {
+            "file_type": file_type,
+            "characters": len(text),
+            "tokens": tokens,
+            "chunks": 0,
+            "parse_seconds": parse_seconds,
+            "embed_seconds": 0.0,
+        }
+        self.characters.add(len(text))
+        self.tokens.add(tokens)
+        self.parse_seconds += parse_seconds
+        breakdown = self.file_types.setdefault(
+            file_type, {"documents": 0, "characters": 0, "tokens": 0, "chunks": 0}
+        )
+        breakdown["documents"] += 1
+        breakdown["characters"] += len(text)
+        breakdown["tokens"] += tokens
+
+    # Function to record an embedded batch; the batch time is shared out over the
+    # files in proportion to their chunks
+    def record_batch(self, documents, metadatas, seconds):
+        self.embed_seconds += seconds
+        share = seconds / len(documents) if documents else 0.0
+        for chunk, metadata in zip(documents, metadatas):
+            self.chunk_lengths.add(len(chunk))
+            bucket = 0
+            while bucket < len(CHUNK_LENGTH_BUCKETS) and len(chunk) > CHUNK_LENGTH_BUCKETS[bucket]:
+                bucket += 1
+            self.histogram[bucket] += 1
+            file_stats = self.files.get(metadata.get("source"))
+            if file_stats is not None:
+                file_stats["chunks"] += 1
+                file_stats["embed_seconds"] += share
+                self.file_types[file_stats["file_type"]]["chunks"] += 1
+
+    # Function to write the per-file statistics as JSON
+    def write_per_file(self, path):
+        with open(path, "w") as f:
+            json.dump(self.files, f, indent=2)
+
+    # Function to render the aggregate statistics as Markdown tables
+    def to_markdown(self):
+        report = f"""
+## Ingestion Statistics
+
+| Metric                  | Value              |
+|-------------------------|--------------------|
+| Documents Embedded      | {self.characters.count} |
+| Total Characters        | {self.characters.total} |
+| Average Document Length | {self.characters.mean:.2f} characters |
+| Maximum Document Length | {self.characters.maximum or 0} characters |
+| Minimum Document Length | {self.characters.minimum or 0} characters |
+| Total Tokens (estimated)| {self.tokens.total} |
+| Chunks Embedded         | {self.chunk_lengths.count} |
+| Average Chunk Length    | {self.chunk_lengths.mean:.2f} characters |
+| Parse Time              | {self.parse_seconds:.2f} s |
+| Embedding Time          | {self.embed_seconds:.2f} s |
+
+### By File Type
+
+| File Type | Documents | Characters | Tokens | Chunks |
+|-----------|-----------|------------|--------|--------|
+"""
+        for file_type, breakdown in sorted(self.file_types.items()):
+            report += f"| {file_type} | {breakdown['documents']} | {breakdown['characters']} | {breakdown['tokens']} | {breakdown['chunks']} |\n"
+        report += """
+### Chunk Length Histogram
+
+| Chunk Length (characters) | Chunks |
+|---------------------------|--------|
+"""
+        lower = 0
+        for upper, count in zip(CHUNK_LENGTH_BUCKETS + [None], self.histogram):
+            label = f"{lower + 1}-{upper}" if upper is not None else f">{lower}"
+            report += f"| {label} | {count} |\n"
+            lower = upper
+        return report
+
+# Function to read the real chunk and document counts from the vector store.
+# Metadata is paged through so large collections are never loaded at once.
+def collection_statistics(app):
+    collection = app.db.collection
+    chunks = collection.count()
+    documents = set()
+    for offset in range(0, chunks, COLLECTION_PAGE_SIZE):
+        page = collection.get(include=["metadatas"], limit=COLLECTION_PAGE_SIZE, offset=offset)
+        for metadata in page["metadatas"]:
+            metadata = metadata or {}
+            documents.add(metadata.get("document_id") or metadata.get("doc_id") or metadata.get("url"))
+    documents.discard(None)
+    return {"chunks": chunks, "documents": len(documents)}
+
+# Function to render the vector store counts as a Markdown table
+def collection_statistics_markdown(collection_name, statistics):
+    return f"""
+## Chroma Database Statistics
+
+| Metric                 | Value              |
+|------------------------|--------------------|
+| Collection             | {collection_name}  |
+| Documents in Collection| {statistics['documents']} |
+| Chunks in Collection   | {statistics['chunks']} |
+| Average Chunks/Document| {statistics['chunks'] / statistics['documents'] if statistics['documents'] else 0:.2f} |
+"""
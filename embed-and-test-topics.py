@@ -1,35 +1,32 @@
 import os
-import json
-import shutil
-import sys
-import markdown
-import PyPDF2
 from embedchain import App
-from tqdm import tqdm
 from colorama import Fore, Style
+from answer_cache import AnswerCache
+from chat_history import ChatHistory
+from streaming import answer_chat_turn, generate
+from embedding_cache import embedding_cache_path_for, install_embedding_cache
+from bulk_embed import DEFAULT_BATCH_SIZE, DEFAULT_MAX_TOKENS_PER_BATCH
+from lexical_index import LexicalIndex, bootstrap_lexical_index, install_hybrid_search, lexical_index_path_for
+from doc_stats import collection_statistics, collection_statistics_markdown
+from pipeline import build_chunker, build_config, ingest_directory
+from registry import CollectionRegistry, registry_markdown, registry_path_for
+from fanout import FanOutQuery, open_collections
+from topic_analysis import SYSTEM_MESSAGE, analyze_topics
+from tracing import instrument_app
 
 # Function to prompt user for input with a default value
 def prompt_with_default(prompt, default):
     user_input = input(f"{prompt} (default: {default}): ")
     return user_input.strip() or default
 
-# Function to list existing databases
-def list_existing_databases(directory):
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-        print(Fore.YELLOW + f"Directory '{directory}' created as it did not exist." + Style.RESET_ALL)
-    databases = [name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))]
-    if databases:
-        print(Fore.CYAN + "Existing databases:" + Style.RESET_ALL)
-        for db in databases:
-            print(Fore.CYAN + f"- {db}" + Style.RESET_ALL)
+# Function to list the collections recorded in the registry
+def list_existing_collections(registry):
+    entries = registry.entries()
+    if entries:
+        print(Fore.CYAN + "Existing collections:" + Style.RESET_ALL)
+        print(Fore.CYAN + registry_markdown(entries) + Style.RESET_ALL)
     else:
-        print(Fore.YELLOW + "No existing databases found." + Style.RESET_ALL)
-
-# Function to save database creation names in a JSON file
-def save_database_names(database_names):
-    with open("database_names.json", "w") as f:
-        json.dump(database_names, f)
+        print(Fore.YELLOW + "No existing collections found." + Style.RESET_ALL)
 
 # Function to validate collection name
 def valid_collection_name(name):
@@ -38,239 +35,166 @@ def valid_collection_name(name):
         return True
     return False
 
-# Load existing database names from JSON file
-if os.path.exists("database_names.json"):
-    with open("database_names.json", "r") as f:
-        existing_database_names = json.load(f)
-else:
-    existing_database_names = []
-
-# Prompt user for database name
-database_name = prompt_with_default("Enter database name", "default_database")
-
-# Check if database name already exists
-if database_name in existing_database_names:
-    print(Fore.RED + "Database name already exists. Please choose a different name." + Style.RESET_ALL)
-    sys.exit(1)
+# Main interactive flow; kept under a function so parser worker processes can
+# import this script without re-running the prompts
+def main():
+    # Collections already built in the database directory, with their settings and sizes
+    db_dir = "databases"
+    registry = CollectionRegistry(registry_path_for(db_dir))
+    list_existing_collections(registry)
 
-# Prompt user for collection name and ensure it meets the criteria
-collection_name = prompt_with_default("Enter collection name", "default_collection")
+    # Prompt user for database name; it is recorded as the collection's label
+    database_name = prompt_with_default("Enter database name", "default_database")
 
-while not valid_collection_name(collection_name):
-    print(Fore.RED + "Invalid collection name. Please choose a valid name (3-63 characters, alphanumeric, underscores, hyphens, no consecutive periods)." + Style.RESET_ALL)
+    # Prompt user for collection name and ensure it meets the criteria
     collection_name = prompt_with_default("Enter collection name", "default_collection")
 
-# Prompt user for chunking strategy
-print(Fore.MAGENTA + "Determine chunking strategy:" + Style.RESET_ALL)
-is_text = input("Is the data type text? [yes/no] (default: yes): ").strip().lower() or "yes"
-is_text = is_text == "yes"
-
-if is_text:
-    strategy_message = "Using default embedding method for text data."
-    chunk_size = 300
-    chunk_overlap = 50
-    min_chunk_size = 200
-else:
-    fine_grained_analysis = input("Are the analysis objectives fine-grained? (yes/no): ").strip().lower() == "yes"
-    high_detail_needed = input("Is high detail needed for analysis? (yes/no): ").strip().lower() == "yes"
-    limited_resources = input("Are computational resources limited? (yes/no): ").strip().lower() == "yes"
-    domain_specific = input("Are there any domain-specific considerations? (yes/no): ").strip().lower() == "yes"
-
-    if fine_grained_analysis or high_detail_needed:
-        strategy_message = "Use smaller chunk sizes with more overlap to capture semantic meaning."
-        chunk_size = 200
-        chunk_overlap = 100
-        min_chunk_size = 100
-    else:
-        strategy_message = "Use larger chunk sizes with less overlap for broader analysis."
-        chunk_size = 400
-        chunk_overlap = 50
-        min_chunk_size = 200
-
-print(Fore.GREEN + strategy_message + Style.RESET_ALL)
-
-# EmbedChain configuration
-config = {
-    "llm": {
-        "provider": "ollama",
-        "config": {
-            "base_url": "http://localhost:11434",
-            "model": "llama3:latest",
-            "temperature": 0.2,
-            "top_p": 1,
-            "stream": True
-        }
-    },
-    "embedder": {
-        "provider": "huggingface",
-        "config": {
-            "model": "BAAI/bge-small-en-v1.5"
-        }
-    },
-    "vectordb": {
-        "provider": "chroma",
-        "config": {
-            "collection_name": collection_name,  # Ensure this is a valid collection name
-            "dir": "databases",  # Ensure this directory exists
-            "allow_reset": True
-        }
-    },
-    "chunker": {
-        "chunk_size": chunk_size,
-        "chunk_overlap": chunk_overlap,
-        "length_function": "len",
-        "min_chunk_size": min_chunk_size
-    }
-}
-
-# Initialize EmbedChain app
-app = App.from_config(config=config)
-
-# List existing databases
-list_existing_databases(config["vectordb"]["config"]["dir"])
-
-# Save database name in the list of existing databases
-existing_database_names.append(database_name)
-save_database_names(existing_database_names)
-
-# Path to the directory containing various file types
-directory_path = input("Please enter the full path to the directory containing files to embed: ")
-
-# Function to read text from various file types, including subdirectories
-def read_files_from_directory(directory):
-    file_data = []
-    for root, _, files in os.walk(directory):
-        for filename in files:
-            filepath = os.path.join(root, filename)
-            if filename.endswith(".txt"):
-                with open(filepath, 'r') as file:
-                    text_content = file.read()
-                    metadata = {"source": filepath, "document_id": f"doc_{len(file_data)}", "file_name": filename}
-                    file_data.append({"text": text_content, "metadata": metadata})
-            elif filename.endswith(".md"):
-                with open(filepath, 'r') as file:
-                    md_content = file.read()
-                    html_content = markdown.markdown(md_content)
-                    metadata = {"source": filepath, "document_id": f"doc_{len(file_data)}", "file_name": filename}
-                    file_data.append({"text": html_content, "metadata": metadata})
-            elif filename.endswith(".pdf"):
-                with open(filepath, 'rb') as file:
-                    reader = PyPDF2.PdfReader(file)
-                    pdf_text = ''
-                    for page in range(len(reader.pages)):
-                        pdf_text += reader.pages[page].extract_text()
-                    metadata = {"source": filepath, "document_id": f"doc_{len(file_data)}", "file_name": filename}
-                    file_data.append({"text": pdf_text, "metadata": metadata})
-    return file_data
-
-# Read text data from directory
-file_data = read_files_from_directory(directory_path)
-
-# Embed the data and add it to the collection
-num_documents = len(file_data)
-for idx, data in enumerate(tqdm(file_data, desc="Embedding Documents")):
+    while not valid_collection_name(collection_name):
+        print(Fore.RED + "Invalid collection name. Please choose a valid name (3-63 characters, alphanumeric, underscores, hyphens, no consecutive periods)." + Style.RESET_ALL)
+        collection_name = prompt_with_default("Enter collection name", "default_collection")
+
+    # An existing collection is updated in place: only new or changed files are embedded
+    if registry.get(collection_name) is not None:
+        print(Fore.YELLOW + f"Collection '{collection_name}' already exists; new or changed files will be added to it." + Style.RESET_ALL)
+
+    # Chunks are sized in embedder tokens and cut at headings, pages and paragraphs,
+    # with the chunk size chosen per document
+    print(Fore.GREEN + "Using adaptive chunking: chunk sizes are chosen per document from its structure." + Style.RESET_ALL)
+
+    # EmbedChain configuration
+    config = build_config(collection_name, db_dir=db_dir)
+
+    # Initialize EmbedChain app
+    app = App.from_config(config=config)
+
+    # Reuse embeddings of chunks that were embedded before, e.g. when a collection is
+    # rebuilt with a different chunking strategy
+    install_embedding_cache(app, embedding_cache_path_for(config["vectordb"]["config"]["dir"]))
+
+    # Time each stage when EMBEDCHAIN_TRACE or EMBEDCHAIN_METRICS is set (see tracing.py)
+    instrument_app(app)
+
+    # Fuse vector search with BM25 keyword search over the ingested chunks; the keyword
+    # index is updated as chunks are written
+    lexical_index = install_hybrid_search(app, LexicalIndex(
+        lexical_index_path_for(config["vectordb"]["config"]["dir"], collection_name)
+    ))
+
+    # Path to the directory containing various file types
+    directory_path = input("Please enter the full path to the directory containing files to embed: ")
+
+    # Number of worker processes used to parse files
+    parse_workers = int(prompt_with_default("Enter number of parsing workers", os.cpu_count() or 1))
+
+    # Size of the embedding batches built from the chunks of many documents
+    batch_size = int(prompt_with_default("Enter embedding batch size", DEFAULT_BATCH_SIZE))
+    max_tokens_per_batch = int(prompt_with_default("Enter max tokens per embedding batch", DEFAULT_MAX_TOKENS_PER_BATCH))
+    stats = ingest_directory(
+        app,
+        config,
+        directory_path,
+        workers=parse_workers,
+        batch_size=batch_size,
+        max_tokens_per_batch=max_tokens_per_batch,
+        chunker=build_chunker(config),
+        label=database_name,
+    )
+    num_documents = stats.characters.count
+
+    # A collection built before the keyword index existed is indexed in full once
+    bootstrap_lexical_index(app, lexical_index)
+
+    # Prompt user to enter the topic area
+    topic_area = input("Please enter the topic area for analysis: ")
+
+    # Define the system instruction message
+    system_message = SYSTEM_MESSAGE
+
+    # Process the query and generate the report
+    report_content = ""
+    chat_history = ChatHistory(system_message, summarizer=lambda prompt: generate(app, prompt))
+
+    # Top Topics Identification: cluster every stored chunk and label each cluster
+    # with one small LLM call, so topic frequencies cover the whole collection
+    print(Fore.CYAN + "Clustering the collection into topics..." + Style.RESET_ALL)
     try:
-        # Check if document with the same metadata already exists
-        if not app.exists(data["metadata"]["document_id"]):
-            app.add(data["text"], metadata=data["metadata"])
-            print(Fore.GREEN + f"Added document {data['metadata']['document_id']} to collection with source {data['metadata']['source']}." + Style.RESET_ALL)
-        else:
-            print(Fore.YELLOW + f"Document {data['metadata']['document_id']} already exists in collection. Skipping insertion." + Style.RESET_ALL)
-        sys.stdout.flush()
-    except AttributeError as e:
-        # Database does not exist, proceed with insertion without checking for existence
-        app.add(data["text"], metadata=data["metadata"])
-        print(Fore.GREEN + f"Added document {data['metadata']['document_id']} to collection with source {data['metadata']['source']}." + Style.RESET_ALL)
-        sys.stdout.flush()
-
-# Prompt user to enter the topic area
-topic_area = input("Please enter the topic area for analysis: ")
-
-# Define queries for analyzing the top topics
-queries = [
-    {
-        "query": f"""
-        Analyze the embedded content and identify the top 5 topics related to {topic_area}. For each topic, provide the following details:
-        - Topic Name
-        - A brief description of the topic as a sentence
-        - Frequency (the number of times the topic appears)
-        - Importance (a score indicating the relevance or significance of the topic)
-        - Example Mentions (examples of sentences or paragraphs where the topic is mentioned)
-        - Related topics within in the content sources
-        - Source (the source of the example mentions, including file name or URL)
-
-        Focus your analysis solely on the content embedded within the EmbedChain database, without referring to any external sources. If the data does not exist, say that you don't have the information.
-        """,
-        "name": "top_topics"
-    }
-]
-
-# Define the system instruction message
-system_message = "You are an AI assistant that helps users find information from the indexed documents. Please verify that the question can be answered using the available data. If the data is not present, inform the user that the question cannot be answered using the available data."
-
-# Process the query and generate the report
-report_content = ""
-chat_history = [{"role": "system", "content": system_message}]
-
-# Top Topics Identification
-query_data = queries[0]
-query = query_data["query"]
-chat_history.append({"role": "user", "content": query})
-app_response = app.query(query, chat_history=chat_history)
-chat_history.append({"role": "assistant", "content": app_response})
-
-if num_documents > 0:
-    # Generate statistics table for Chroma database in Markdown format
-    chroma_statistics_table = f"""
-    ## Chroma Database Statistics
-
-    | Metric                 | Value              |
-    |------------------------|--------------------|
-    | Number of Documents    | {num_documents}    |
-    | Average Document Length| {sum(len(data['text']) for data in file_data) / num_documents:.2f} characters |
-    | Maximum Document Length| {max(len(data['text']) for data in file_data)} characters |
-    | Minimum Document Length| {min(len(data['text']) for data in file_data)} characters |
-    """
-
-    # Generate statistics table for EmbedChain database in Markdown format
-    statistics_table = f"""
-    ## EmbedChain Database Statistics
-
-    | Metric                 | Value              |
-    |------------------------|--------------------|
-    | Number of Documents    | {num_documents}    |
-    """
-
-    # Combine report content with statistics tables
-    report_content = app_response + statistics_table + chroma_statistics_table
-
-    # Display statistics in the terminal
-    print(chroma_statistics_table)
-    print(statistics_table)
-else:
-    print(Fore.RED + "No documents were found or embedded." + Style.RESET_ALL)
-    report_content = app_response
-
-# Save the report content along with the statistics table
-output_directory = "output"
-os.makedirs(output_directory, exist_ok=True)
-report_path = os.path.join(output_directory, "topic_analysis_report.md")
-try:
-    with open(report_path, "w") as report_file:
-        report_file.write(report_content)
-    print(Fore.CYAN + f"Report with statistics table has been saved to {report_path}" + Style.RESET_ALL)
-except Exception as e:
-    print(Fore.RED + "Error writing report:" + Style.RESET_ALL, e)
+        app_response = analyze_topics(app, [topic_area])[topic_area]
+    except Exception as e:
+        app_response = e
+    if isinstance(app_response, Exception):
+        print(Fore.RED + "Error analyzing topics:" + Style.RESET_ALL, app_response)
+        app_response = ""
+    chat_history.append({"role": "user", "content": f"What are the top topics related to {topic_area}?"})
+    chat_history.append({"role": "assistant", "content": app_response})
 
-# Continual chat loop
-while True:
-    user_query = input("Enter your query (or type 'exit' to end): ")
-    if user_query.lower() == 'exit':
-        break
+    # Generate statistics tables in Markdown format from the real vector store counts
+    # and the statistics collected during ingestion
+    chroma_statistics_table = collection_statistics_markdown(collection_name, collection_statistics(app))
+    if num_documents > 0:
+        statistics_table = stats.to_markdown()
 
-    chat_history.append({"role": "user", "content": user_query})
-    app_response = app.query(user_query, chat_history=chat_history)
-    chat_history.append({"role": "assistant", "content": app_response})
+        # Combine report content with statistics tables
+        report_content = app_response + statistics_table + chroma_statistics_table
 
-    print(Fore.GREEN + "Response:" + Style.RESET_ALL)
-    print(app_response)
+        # Display statistics in the terminal
+        print(chroma_statistics_table)
+        print(statistics_table)
+    else:
+        print(Fore.RED + "No new or changed documents were found or embedded." + Style.RESET_ALL)
+        report_content = app_response + chroma_statistics_table
+        print(chroma_statistics_table)
+
+    # Save the report content along with the statistics table
+    output_directory = "output"
+    os.makedirs(output_directory, exist_ok=True)
+    report_path = os.path.join(output_directory, "topic_analysis_report.md")
+    try:
+        with open(report_path, "w") as report_file:
+            report_file.write(report_content)
+        print(Fore.CYAN + f"Report with statistics table has been saved to {report_path}" + Style.RESET_ALL)
+        if num_documents > 0:
+            stats_path = os.path.join(output_directory, "ingestion_stats.json")
+            stats.write_per_file(stats_path)
+            print(Fore.CYAN + f"Per-file statistics have been saved to {stats_path}" + Style.RESET_ALL)
+    except Exception as e:
+        print(Fore.RED + "Error writing report:" + Style.RESET_ALL, e)
+
+    # Chat with this collection, or with several registered collections at once; the
+    # top chunks of all of them are merged into one answer
+    chat_collections = [
+        name.strip()
+        for name in prompt_with_default("Collections to chat with (comma-separated)", collection_name).split(",")
+        if name.strip()
+    ]
+    fanout = None
+    if chat_collections != [collection_name]:
+        try:
+            fanout = FanOutQuery(app, open_collections(app, registry, chat_collections))
+        except ValueError as e:
+            print(Fore.RED + f"{e}; chatting with '{collection_name}' only." + Style.RESET_ALL)
+    registry.close()
+
+    # Continual chat loop; repeated or near-duplicate questions are answered from the
+    # cache, which only tracks changes to this collection
+    answer_cache = AnswerCache(app) if fanout is None else None
+    try:
+        while True:
+            user_query = input("Enter your query (or type 'exit' to end): ")
+            if user_query.lower() == 'exit':
+                break
+
+            print(Fore.GREEN + "Response:" + Style.RESET_ALL)
+            # Print tokens as they are generated; Ctrl-C cancels the generation
+            _, cancelled = answer_chat_turn(
+                app, user_query, chat_history, lambda token: print(token, end="", flush=True),
+                answer_cache=answer_cache, fanout=fanout,
+            )
+            print()
+            if cancelled:
+                print(Fore.YELLOW + "Generation cancelled." + Style.RESET_ALL)
+    finally:
+        if fanout is not None:
+            fanout.close()
+
+if __name__ == "__main__":
+    main()
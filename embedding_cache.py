@@ -0,0 +1,117 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from tracing import tracer
+
+# Default number of cached embeddings kept before the least recently used are evicted
+DEFAULT_MAX_ENTRIES = 100000
+
+# Function to build the cache path, shared by every collection under a Chroma directory
+def embedding_cache_path_for(db_dir):
+    return os.path.join(db_dir, "embedding_cache.sqlite3")
+
+# Function to build the cache key for a chunk: the embedder model plus a hash of the
+# whitespace-normalized text
+def cache_key(model_name, text):
+    normalized = " ".join(text.split())
+    return model_name + ":" + hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+# Disk-backed embedding cache. Vectors are stored as float32 blobs in SQLite, keyed
+# by (model, chunk hash), with a size cap and least-recently-used eviction.
+class EmbeddingCache:
+    def __init__(self, path, model_name, max_entries=DEFAULT_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    # Function to look up cached vectors; returns a list with None for every miss
+    def get_many(self, texts):
+        keys = [cache_key(self.model_name, text) for text in texts]
+        found = {}
+        with self.lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, vector in self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ):
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self.conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        tracer.count("embedding_cache_hits", len(found))
+        tracer.count("embedding_cache_misses", len(keys) - len(found))
+        return [found.get(key) for key in keys]
+
+    # Function to store vectors and evict the least recently used entries over the cap
+    def put_many(self, texts, vectors):
+        now = time.time()
+        rows = [
+            (cache_key(self.model_name, text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            (count,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# Embedding function that answers from the cache and only sends misses to the
+# wrapped embedder. Follows Chroma's EmbeddingFunction interface.
+class CachedEmbeddingFunction:
+    def __init__(self, embedding_fn, cache):
+        self.embedding_fn = embedding_fn
+        self.cache = cache
+
+    def __call__(self, input):
+        texts = list(input)
+        embeddings = self.cache.get_many(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            computed = self.embedding_fn([texts[i] for i in missing])
+            self.cache.put_many([texts[i] for i in missing], computed)
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = list(embedding)
+        return embeddings
+
+# Function to put the embedding cache in front of an app's configured embedder.
+# The Chroma collection is reopened so app.add and app.query use the cache too.
+def install_embedding_cache(app, path, max_entries=DEFAULT_MAX_ENTRIES):
+    cache = EmbeddingCache(path, app.embedder.config.model, max_entries=max_entries)
+    app.embedder.set_embedding_fn(CachedEmbeddingFunction(app.embedder.embedding_fn, cache))
+    app.db.set_collection_name(app.db.config.collection_name)
+    return cache
@@ -0,0 +1,115 @@
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from chroma_utils import chroma_where
+from streaming import format_history, stream_generate
+from tracing import tracer
+
+# Query several collections as one corpus. The question is embedded once, every
+# collection is searched at the same time on a thread pool, and the top-k chunks of
+# all collections are merged by cosine similarity into the context of a single
+# generation. Scores are only comparable between collections embedded with the same
+# model, which the collection registry is used to check.
+
+# Default number of collections searched at the same time
+DEFAULT_FANOUT_WORKERS = 8
+
+PROMPT_TEMPLATE = """You are a Q&A expert system. Your responses must always be rooted in the context provided for each query. The context comes from several document collections; each piece is tagged with its collection and source.
+
+Context information:
+----------------------
+{context}
+----------------------
+{history}
+Query: {query}
+
+Answer:"""
+
+# Function to open registered collections for a fan-out query. Collections missing
+# from the registry, or embedded with a different model than the app, are rejected,
+# since their scores could not be merged.
+def open_collections(app, registry, names):
+    import chromadb
+
+    # Chroma refuses a second client with other settings on the same directory, so
+    # the app's own client is reused for its directory
+    clients = {os.path.abspath(app.db.config.dir): app.db.client}
+    collections = {}
+    model = app.embedder.config.model
+    for name in names:
+        entry = registry.get(name)
+        if entry is None:
+            raise ValueError(f"Collection {name!r} is not registered; ingest into it first")
+        if entry["embedder_model"] != model:
+            raise ValueError(f"Collection {name!r} was embedded with {entry['embedder_model']}, not {model}")
+        db_dir = os.path.abspath(entry["db_dir"])
+        if db_dir not in clients:
+            clients[db_dir] = chromadb.PersistentClient(path=db_dir)
+        collections[name] = clients[db_dir].get_collection(name)
+    return collections
+
+class FanOutQuery:
+    def __init__(self, app, collections, workers=DEFAULT_FANOUT_WORKERS):
+        self.app = app
+        self.collections = collections
+        self.executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(collections))))
+
+    # Function to search one collection; returns (similarity, text, metadata, collection) tuples
+    def search_collection(self, name, query_vector, k, where):
+        with tracer.span("retrieve", collection=name):
+            found = self.collections[name].query(
+                query_embeddings=[query_vector.tolist()],
+                n_results=k,
+                where=chroma_where(where),
+                include=["documents", "metadatas", "embeddings"],
+            )
+        if not found["ids"] or not found["ids"][0]:
+            return []
+        embeddings = np.asarray(found["embeddings"][0], dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1)
+        similarities = embeddings @ query_vector / np.where(norms == 0, 1, norms)
+        return [
+            (float(similarity), document, metadata or {}, name)
+            for similarity, document, metadata in zip(similarities, found["documents"][0], found["metadatas"][0])
+        ]
+
+    # Function to find the k chunks most similar to a query across every collection.
+    # Scores are cosine similarities computed from the stored embeddings, so they do
+    # not depend on each collection's distance function.
+    def retrieve(self, query, k, where=None):
+        with tracer.span("fanout", collections=len(self.collections), k=k):
+            query_vector = np.asarray(self.app.embedder.embedding_fn([query])[0], dtype=np.float32)
+            query_vector /= np.linalg.norm(query_vector) or 1
+            futures = [
+                self.executor.submit(self.search_collection, name, query_vector, k, where)
+                for name in self.collections
+            ]
+            results = [hit for future in futures for hit in future.result()]
+        return heapq.nlargest(k, results, key=lambda hit: hit[0])
+
+    # Function to build the prompt for a query from the merged chunks
+    def prompt(self, query, hits, history=None):
+        context = "\n\n".join(
+            f"[{name} | {metadata.get('url') or metadata.get('source', '')}] {document}"
+            for _, document, metadata, name in hits
+        )
+        return PROMPT_TEMPLATE.format(context=context, history=format_history(history), query=query)
+
+    # Function to answer a query from every collection with a single generation;
+    # yields the answer tokens as they are generated
+    def stream_answer(self, query, k=None, history=None, where=None):
+        k = k or self.app.llm.config.number_documents
+        with tracer.span("prompt", collections=len(self.collections)):
+            prompt = self.prompt(query, self.retrieve(query, k, where), history)
+        yield from stream_generate(self.app, prompt)
+
+    # Function to stop the search threads; queued searches are dropped
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
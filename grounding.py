@@ -0,0 +1,116 @@
+import re
+import numpy as np
+
+# Cosine similarity at which a cited source counts as backed by the retrieved context
+DEFAULT_RELEVANCE_THRESHOLD = 0.65
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+# Function to split text into sentences
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text or "") if sentence.strip()]
+
+# Function to get the text of a cited source, which the LLM may give as a string or a dict
+def source_text(source):
+    if isinstance(source, dict):
+        return source.get("text") or source.get("content") or ""
+    return str(source or "")
+
+# Function to get the title and description a topic is judged by
+def topic_summary(topic):
+    return f"{topic.get('title', '')}. {topic.get('description', '')}".strip(". ")
+
+# Function to get the answer text of a topic; falls back to its description and examples
+def topic_answer(topic):
+    if topic.get("answer"):
+        return topic["answer"]
+    examples = " ".join(source_text(example) for example in topic.get("examples", []))
+    return f"{topic.get('description', '')} {examples}".strip()
+
+# Function to get the sources a topic cites; falls back to its examples
+def topic_sources(topic):
+    return topic.get("context_sources") or topic.get("examples", [])
+
+# Function to get the context a topic supplies itself, as a list of sentences
+def context_sentences(context):
+    if isinstance(context, (list, tuple)):
+        return [sentence for item in context for sentence in split_sentences(source_text(item))]
+    return split_sentences(source_text(context))
+
+# Function to get the context a topic supplies itself, as a list of chunk texts
+def context_chunks(context):
+    if isinstance(context, (list, tuple)):
+        return [source_text(item) for item in context]
+    return [source_text(context)]
+
+# Function to list every text the topic scores will embed, so they can be embedded in one batch
+def topic_texts(topic):
+    texts = [topic_summary(topic)]
+    texts += split_sentences(topic_answer(topic))
+    texts += context_sentences(topic.get("context", ""))
+    texts += context_chunks(topic.get("context", ""))
+    texts += [source_text(source) for source in topic_sources(topic)]
+    return [text for text in texts if text]
+
+# Embedding-based scorer for grounding, relevance and K-Sym. Texts are embedded with
+# the app's configured embedder; the retrieved context chunks are embedded once and
+# every other text is memoised, so all topics share one context matrix and scores
+# are plain NumPy cosine-similarity matrix products. A topic may also bring its own
+# context (its "context" field), which is scored alongside the shared chunks.
+class GroundingScorer:
+    def __init__(self, app, contexts=(), relevance_threshold=DEFAULT_RELEVANCE_THRESHOLD):
+        self.app = app
+        self.relevance_threshold = relevance_threshold
+        self.vectors = {}
+        self.contexts = [context for context in contexts if context]
+        self.context_matrix = self.embed(self.contexts)
+
+    # Function to embed any texts that are not memoised yet, in a single embedder call
+    def warm(self, texts):
+        missing = list(dict.fromkeys(text for text in texts if text and text not in self.vectors))
+        if not missing:
+            return
+        matrix = np.asarray(self.app.embedder.embedding_fn(missing), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+        for text, vector in zip(missing, matrix):
+            self.vectors[text] = vector
+
+    # Function to get the unit embeddings of texts as a matrix (one row per text)
+    def embed(self, texts):
+        texts = [text for text in texts if text]
+        if not texts:
+            return None
+        self.warm(texts)
+        return np.stack([self.vectors[text] for text in texts])
+
+    # Function to score each text by its best cosine similarity to the context rows
+    def best_similarities(self, texts, extra_context=()):
+        matrix = self.embed(texts)
+        context = self.context_matrix
+        extra = self.embed(list(extra_context))
+        if extra is not None:
+            context = extra if context is None else np.vstack([context, extra])
+        if matrix is None or context is None:
+            return np.zeros(len(texts), dtype=np.float32)
+        return np.clip((matrix @ context.T).max(axis=1), 0.0, 1.0)
+
+    # Function to score how well the retrieved context covers a topic (0-1)
+    def context_relevance(self, topic):
+        return float(self.best_similarities([topic_summary(topic)], context_chunks(topic.get("context", "")))[0])
+
+    # Function to score how grounded an answer is: the mean over its sentences of the
+    # best similarity to any context chunk (0-1)
+    def semantic_similarity(self, answer, context=""):
+        sentences = split_sentences(answer)
+        if not sentences:
+            return 0.0
+        return float(self.best_similarities(sentences, context_sentences(context)).mean())
+
+    # Function to check whether a cited source is backed by the retrieved context. The
+    # context must not contain the source itself, or it trivially matches.
+    def is_relevant(self, source, context=""):
+        text = source_text(source)
+        if not text:
+            return False
+        return bool(self.best_similarities([text], context_chunks(context))[0] >= self.relevance_threshold)
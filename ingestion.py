@@ -0,0 +1,319 @@
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+import PyPDF2
+from colorama import Fore, Style
+from tracing import tracer
+
+# File types that can be embedded
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".pdf")
+
+# Number of parsed documents allowed to wait for the embedding stage
+DEFAULT_QUEUE_SIZE = 8
+
+# Number of PDF pages extracted by one worker task; larger PDFs are split across workers
+PDF_PAGES_PER_TASK = 50
+
+# Upper bound on the page text kept in the PDF page cache, in characters; the least
+# recently used PDFs are evicted beyond it
+DEFAULT_PDF_CACHE_MAX_CHARACTERS = 256 * 1024 * 1024
+
+# Function to build the PDF page cache path, shared by every collection under a Chroma directory
+def pdf_cache_path_for(db_dir):
+    return os.path.join(db_dir, "pdf_page_cache.sqlite3")
+
+# Function to walk a directory tree (in a stable order) and yield supported file paths
+def iter_file_paths(directory):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.endswith(SUPPORTED_EXTENSIONS):
+                yield os.path.join(root, filename)
+
+# Function to hash the contents of a file without reading it into memory at once
+def hash_file(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to open the per-page PDF text cache; several worker processes share it
+def open_pdf_cache(cache_path):
+    conn = sqlite3.connect(cache_path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pdf_pages (
+            file_hash TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (file_hash, page)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pdf_files (
+            file_hash TEXT PRIMARY KEY,
+            page_count INTEGER NOT NULL,
+            characters INTEGER NOT NULL DEFAULT 0,
+            last_used REAL NOT NULL
+        )
+        """
+    )
+    conn.commit()
+    return conn
+
+# Function to evict the least recently used PDFs from the page cache until the cached
+# text is within max_characters
+def evict_pdf_cache(conn, max_characters=DEFAULT_PDF_CACHE_MAX_CHARACTERS):
+    (total,) = conn.execute("SELECT COALESCE(SUM(characters), 0) FROM pdf_files").fetchone()
+    if total <= max_characters:
+        return
+    for file_hash, characters in conn.execute("SELECT file_hash, characters FROM pdf_files ORDER BY last_used").fetchall():
+        if total <= max_characters:
+            break
+        conn.execute("DELETE FROM pdf_pages WHERE file_hash = ?", (file_hash,))
+        conn.execute("DELETE FROM pdf_files WHERE file_hash = ?", (file_hash,))
+        total -= characters
+    conn.commit()
+
+# Function to get the text of pages [start, end) of a PDF from the cache, extracting
+# the missing ones with reader (opened here when not given)
+def read_pdf_pages(conn, filepath, content_hash, start, end, reader=None):
+    pages = {}
+    if conn is not None:
+        pages = dict(conn.execute(
+            "SELECT page, text FROM pdf_pages WHERE file_hash = ? AND page >= ? AND page < ?",
+            (content_hash, start, end),
+        ).fetchall())
+    missing = [page for page in range(start, end) if page not in pages]
+    if missing:
+        reader = reader or PyPDF2.PdfReader(filepath)
+        extracted = [(page, reader.pages[page].extract_text() or "") for page in missing]
+        pages.update(extracted)
+        # Pages of a PDF evicted while it was being extracted are not cached again
+        if conn is not None and conn.execute("SELECT 1 FROM pdf_files WHERE file_hash = ?", (content_hash,)).fetchone():
+            # Pages extracted by another worker in the meantime are not counted twice
+            added = 0
+            for page, text in extracted:
+                if conn.execute(
+                    "INSERT OR IGNORE INTO pdf_pages (file_hash, page, text) VALUES (?, ?, ?)", (content_hash, page, text)
+                ).rowcount:
+                    added += len(text)
+            conn.execute("UPDATE pdf_files SET characters = characters + ? WHERE file_hash = ?", (added, content_hash))
+            conn.commit()
+            evict_pdf_cache(conn)
+    return [pages[page] for page in range(start, end)]
+
+# Function to read the size, mtime, content hash and page count of a PDF, together
+# with the text of its first PDF_PAGES_PER_TASK pages; runs inside a worker process.
+# The reader that counts the pages also extracts them, so a PDF of up to that many
+# pages is parsed once, and a cached PDF is not parsed at all. Planning marks the PDF
+# as recently used in the cache; newly cached pages evict the least recently used PDFs.
+def plan_pdf(filepath, cache_path=None):
+    started = time.perf_counter()
+    stat = os.stat(filepath)
+    content_hash = hash_file(filepath)
+    conn = open_pdf_cache(cache_path) if cache_path else None
+    try:
+        row = conn.execute("SELECT page_count FROM pdf_files WHERE file_hash = ?", (content_hash,)).fetchone() if conn else None
+        reader = None
+        if row is None:
+            reader = PyPDF2.PdfReader(filepath)
+            page_count = len(reader.pages)
+        else:
+            page_count = row[0]
+        if conn is not None:
+            conn.execute(
+                "INSERT INTO pdf_files (file_hash, page_count, last_used) VALUES (?, ?, ?) "
+                "ON CONFLICT (file_hash) DO UPDATE SET last_used = excluded.last_used",
+                (content_hash, page_count, time.time()),
+            )
+            conn.commit()
+        first_pages = read_pdf_pages(conn, filepath, content_hash, 0, min(PDF_PAGES_PER_TASK, page_count), reader)
+    finally:
+        if conn is not None:
+            conn.close()
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "content_hash": content_hash,
+        "page_count": page_count,
+        "first_pages": first_pages,
+        "parse_seconds": time.perf_counter() - started,
+    }
+
+# Function to extract the text of pages [start, end) of a PDF; runs inside a worker
+# process. Pages found in the cache (keyed by file hash and page) are not extracted again.
+def extract_pdf_pages(filepath, content_hash, start, end, cache_path=None):
+    started = time.perf_counter()
+    conn = open_pdf_cache(cache_path) if cache_path else None
+    try:
+        pages = read_pdf_pages(conn, filepath, content_hash, start, end)
+    finally:
+        if conn is not None:
+            conn.close()
+    return pages, time.perf_counter() - started
+
+# Function to list the page ranges of a PDF left after the pages its plan extracted
+def remaining_page_ranges(plan):
+    return [
+        (start, min(start + PDF_PAGES_PER_TASK, plan["page_count"]))
+        for start in range(PDF_PAGES_PER_TASK, plan["page_count"], PDF_PAGES_PER_TASK)
+    ]
+
+# Function to join extracted PDF pages into one document. page_offsets holds the
+# character offset in the joined text (not a byte offset in the PDF file) at which
+# each page starts, so chunks can carry page numbers.
+def assemble_pdf(filepath, plan, page_texts, parse_seconds):
+    page_offsets = []
+    offset = 0
+    for text in page_texts:
+        page_offsets.append(offset)
+        offset += len(text) + 1
+    return {
+        "text": "\n".join(page_texts),
+        "metadata": {"source": filepath, "file_name": os.path.basename(filepath)},
+        "size": plan["size"],
+        "mtime": plan["mtime"],
+        "content_hash": plan["content_hash"],
+        "parse_seconds": parse_seconds,
+        "page_offsets": page_offsets,
+    }
+
+# Function to read the text of a single non-PDF file; runs inside a worker process.
+# PDFs go through plan_pdf and extract_pdf_pages instead. The size, mtime and
+# content hash are returned alongside the text so the caller can keep an index
+# manifest up to date.
+def parse_file(filepath):
+    started = time.perf_counter()
+    filename = os.path.basename(filepath)
+    stat = os.stat(filepath)
+    with open(filepath, 'rb') as file:
+        raw_content = file.read()
+    # Markdown is kept as source text so the chunker can split on its headings
+    text_content = raw_content.decode("utf-8", errors="replace")
+    metadata = {"source": filepath, "file_name": filename}
+    return {
+        "text": text_content,
+        "metadata": metadata,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "content_hash": hashlib.sha256(raw_content).hexdigest(),
+        "parse_seconds": time.perf_counter() - started,
+        "page_offsets": None,
+    }
+
+# Function to stream parsed documents for the given file paths. Files are parsed
+# by a process pool; a bounded queue of in-flight parses keeps memory flat however
+# large the corpus is, while the pool keeps parsing ahead of the consumer. PDFs are
+# split into page ranges so one large document is extracted by several workers.
+# Documents are yielded in the order of file_paths.
+def read_files(file_paths, workers=None, queue_size=DEFAULT_QUEUE_SIZE, pdf_cache_path=None):
+    pending = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    feeder_errors = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Function to plan a PDF in a worker without waiting for it. Its remaining
+        # page ranges are submitted as soon as the plan completes; batches resolves
+        # to their futures.
+        def submit_pdf(filepath):
+            plan = executor.submit(plan_pdf, filepath, pdf_cache_path)
+            batches = Future()
+
+            def submit_batches(done):
+                try:
+                    content_hash = done.result()["content_hash"]
+                    batches.set_result([
+                        executor.submit(extract_pdf_pages, filepath, content_hash, start, end, pdf_cache_path)
+                        for start, end in remaining_page_ranges(done.result())
+                    ])
+                except BaseException as e:
+                    # A failed or cancelled plan, or a pool that is shutting down
+                    batches.set_exception(e)
+
+            plan.add_done_callback(submit_batches)
+            return plan, batches
+
+        # Function to cancel the parses of a queued document that will not be read
+        def cancel(item):
+            _, future, batches = item
+            future.cancel()
+            if batches is not None:
+                batches.add_done_callback(
+                    lambda done: None if done.exception() else [batch.cancel() for batch in done.result()]
+                )
+
+        def feed():
+            try:
+                for filepath in file_paths:
+                    if stop.is_set():
+                        return
+                    if filepath.endswith(".pdf"):
+                        plan, batches = submit_pdf(filepath)
+                        pending.put((filepath, plan, batches))
+                    else:
+                        pending.put((filepath, executor.submit(parse_file, filepath), None))
+            except Exception as e:
+                feeder_errors.append(e)
+            finally:
+                pending.put(None)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        try:
+            while True:
+                item = pending.get()
+                if item is None:
+                    break
+                filepath, future, batches = item
+                try:
+                    if batches is None:
+                        data = future.result()
+                    else:
+                        plan = future.result()
+                        page_texts = list(plan["first_pages"])
+                        parse_seconds = plan["parse_seconds"]
+                        for batch in batches.result():
+                            texts, seconds = batch.result()
+                            page_texts.extend(texts)
+                            parse_seconds += seconds
+                        data = assemble_pdf(filepath, plan, page_texts, parse_seconds)
+                except Exception as e:
+                    print(Fore.RED + f"Error reading {filepath}: {e}" + Style.RESET_ALL)
+                    tracer.count("parse_errors")
+                    continue
+                # Parsing ran in a worker process; record the time it measured there
+                tracer.record("parse", data["parse_seconds"], source=filepath, size=data["size"])
+                tracer.count("documents_parsed")
+                yield data
+            if feeder_errors:
+                raise feeder_errors[0]
+        finally:
+            # Unblock the feeder if the consumer stopped early
+            stop.set()
+            while feeder.is_alive():
+                try:
+                    item = pending.get(timeout=0.1)
+                    if item is not None:
+                        cancel(item)
+                except queue.Empty:
+                    pass
+            while True:
+                try:
+                    item = pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    cancel(item)
+
+# Function to stream parsed documents from a directory, including subdirectories
+def read_files_from_directory(directory, workers=None, queue_size=DEFAULT_QUEUE_SIZE, pdf_cache_path=None):
+    return read_files(iter_file_paths(directory), workers=workers, queue_size=queue_size, pdf_cache_path=pdf_cache_path)
@@ -0,0 +1,249 @@
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from chroma_utils import SYNC_PAGE_SIZE, chroma_where, collection_ids
+from tracing import tracer
+
+# Sparse lexical index for hybrid retrieval. Chunk texts are tokenized into an
+# inverted index kept in SQLite next to the Chroma collection, so exact terms such as
+# part numbers, file names and people's names can be found even when the embedding
+# ranks them low. Chunks are added and removed incrementally as the collection
+# changes. Queries score chunks with BM25, and the BM25 ranking is fused with the
+# vector ranking by reciprocal rank fusion.
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Rank offset of reciprocal rank fusion; larger values flatten the weight of the top ranks
+RRF_K = 60
+
+# Candidates taken from each ranking per requested result
+CANDIDATE_FACTOR = 4
+
+# Smallest number of candidates taken from each ranking
+MIN_CANDIDATES = 20
+
+# Terms found in more than this fraction of chunks are skipped when rarer query
+# terms exist; they add little to the score and have the longest posting lists
+COMMON_TERM_FRACTION = 0.5
+
+# Words too common to index
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the their "
+    "there this to was were which will with".split()
+)
+
+# Words, plus identifiers joined by ".", "-" or "/" such as "report-2023.pdf" or "x-100"
+TOKEN = re.compile(r"\w+(?:[.\-/]\w+)*")
+PART = re.compile(r"[^\W_]+")
+
+# Function to build the lexical index path for a collection under a Chroma directory
+def lexical_index_path_for(db_dir, collection_name):
+    return os.path.join(db_dir, f"{collection_name}_lexical.sqlite3")
+
+# Function to split text into lowercase index terms. Compound identifiers are kept
+# whole and also split into their parts, so "ABC-123" matches "abc-123", "abc" and "123".
+def tokenize(text):
+    terms = []
+    for match in TOKEN.finditer(text.lower()):
+        token = match.group()
+        parts = PART.findall(token)
+        if len(parts) > 1:
+            terms.append(token)
+        terms.extend(part for part in parts if part not in STOPWORDS)
+    return terms
+
+class LexicalIndex:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, length INTEGER NOT NULL)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, id TEXT NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term, id)) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS postings_id ON postings (id)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.execute("INSERT OR IGNORE INTO info (key, value) VALUES ('chunks', 0), ('total_length', 0)")
+        self.conn.commit()
+
+    # Function to count the indexed chunks
+    def __len__(self):
+        (count,) = self.conn.execute("SELECT value FROM info WHERE key = 'chunks'").fetchone()
+        return count
+
+    # Function to list the indexed chunk ids
+    def ids(self):
+        return {chunk_id for (chunk_id,) in self.conn.execute("SELECT id FROM chunks")}
+
+    # Function to index chunk texts; a chunk id that is already indexed is replaced
+    def add(self, ids, texts):
+        if not ids:
+            return
+        postings = []
+        lengths = []
+        document_frequencies = Counter()
+        for chunk_id, text in zip(ids, texts):
+            term_counts = Counter(tokenize(text or ""))
+            lengths.append((chunk_id, sum(term_counts.values())))
+            postings.extend((term, chunk_id, tf) for term, tf in term_counts.items())
+            document_frequencies.update(term_counts.keys())
+        with self.lock:
+            self.delete_ids(ids)
+            self.conn.executemany("INSERT INTO chunks (id, length) VALUES (?, ?)", lengths)
+            self.conn.executemany("INSERT INTO postings (term, id, tf) VALUES (?, ?, ?)", postings)
+            self.conn.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT (term) DO UPDATE SET df = df + excluded.df",
+                document_frequencies.items(),
+            )
+            self.update_totals(len(lengths), sum(length for _, length in lengths))
+            self.conn.commit()
+
+    def update_totals(self, chunks, total_length):
+        self.conn.executemany(
+            "UPDATE info SET value = value + ? WHERE key = ?",
+            [(chunks, "chunks"), (total_length, "total_length")],
+        )
+
+    def delete_ids(self, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            removed = self.conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE id IN ({placeholders})", batch
+            ).fetchone()
+            if not removed[0]:
+                continue
+            terms = Counter(term for (term,) in self.conn.execute(
+                f"SELECT term FROM postings WHERE id IN ({placeholders})", batch
+            ))
+            self.conn.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(count, term) for term, count in terms.items()])
+            self.conn.execute("DELETE FROM terms WHERE df <= 0")
+            self.conn.execute(f"DELETE FROM postings WHERE id IN ({placeholders})", batch)
+            self.conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+            self.update_totals(-removed[0], -removed[1])
+
+    # Function to remove chunk ids from the index
+    def delete(self, ids):
+        with self.lock:
+            self.delete_ids(ids)
+            self.conn.commit()
+
+    # Function to find the chunks that best match a query by BM25. Returns a list of
+    # (chunk_id, score), best first.
+    def search(self, query, k):
+        query_terms = set(tokenize(query))
+        if not query_terms or k <= 0:
+            return []
+        with self.lock:
+            info = dict(self.conn.execute("SELECT key, value FROM info"))
+            chunks = info["chunks"]
+            if chunks == 0:
+                return []
+            average_length = info["total_length"] / chunks or 1
+            placeholders = ",".join("?" * len(query_terms))
+            frequencies = dict(self.conn.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({placeholders})", list(query_terms)
+            ))
+            rare = {term: df for term, df in frequencies.items() if df <= COMMON_TERM_FRACTION * chunks}
+            scores = Counter()
+            for term, df in (rare or frequencies).items():
+                idf = math.log(1 + (chunks - df + 0.5) / (df + 0.5))
+                for chunk_id, tf, length in self.conn.execute(
+                    "SELECT p.id, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.id WHERE p.term = ?", (term,)
+                ):
+                    scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (
+                        tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    )
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# Function to bring the index in line with the app's Chroma collection: texts of new
+# chunks are indexed and removed chunks are dropped. Reads every id of the collection,
+# so it is only used to build the index for an existing collection or to repair it;
+# ingestion keeps the index current through BulkIndexer. Returns (added, removed).
+def sync_lexical_index(app, index, page_size=SYNC_PAGE_SIZE):
+    collection = app.db.collection
+    current_ids = collection_ids(collection, page_size)
+    indexed_ids = index.ids()
+    removed = indexed_ids - current_ids
+    index.delete(removed)
+    missing = sorted(current_ids - indexed_ids)
+    for start in range(0, len(missing), page_size):
+        page = collection.get(ids=missing[start:start + page_size], include=["documents"])
+        index.add(page["ids"], page["documents"])
+    return len(missing), len(removed)
+
+# Function to sync the index only when it lags behind the collection, e.g. for a
+# collection built before the index existed or written through app.add. Returns
+# (added, removed), or None when the index already holds every chunk.
+def bootstrap_lexical_index(app, index, page_size=SYNC_PAGE_SIZE):
+    if len(index) == app.db.count():
+        return None
+    return sync_lexical_index(app, index, page_size)
+
+# Function to fetch the best BM25 matches that pass a Chroma filter, as
+# (document, metadata) pairs
+def lexical_matches(app, index, text, count, where_filter):
+    limit = count
+    while True:
+        hits = index.search(text, limit)
+        if not hits:
+            return []
+        found = app.db.collection.get(
+            ids=[chunk_id for chunk_id, _ in hits], where=where_filter, include=["documents", "metadatas"]
+        )
+        # Filters can thin out the hits; widen until enough remain or every match was seen
+        if len(found["ids"]) >= count or len(hits) < limit:
+            break
+        limit *= 8
+    records = {
+        chunk_id: (document, metadata)
+        for chunk_id, document, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+    }
+    return [records[chunk_id] for chunk_id, _ in hits if chunk_id in records][:count]
+
+# Function to fuse the app's vector search with BM25 search over a lexical index.
+# Both rankings return a few times more candidates than requested, and each chunk is
+# scored by the sum of 1 / (RRF_K + rank) over the rankings it appears in. Results
+# follow embedchain's ChromaDB.query: texts, or (text, metadata) pairs with citations.
+# The index is kept as app.lexical_index, where BulkIndexer finds it.
+def install_hybrid_search(app, index):
+    dense_query = app.db.query
+    app.lexical_index = index
+
+    def query(input_query, n_results, where=None, citations=False, raw_filter=None, **kwargs):
+        text = input_query[0] if isinstance(input_query, (list, tuple)) else input_query
+        candidates = max(n_results * CANDIDATE_FACTOR, MIN_CANDIDATES)
+        if raw_filter is not None:
+            kwargs["raw_filter"] = raw_filter
+        dense = dense_query(input_query, candidates, where=where, citations=True, **kwargs)
+        with tracer.span("bm25", candidates=candidates) as span:
+            lexical = lexical_matches(app, index, text, candidates, raw_filter or chroma_where(where))
+            span.set(matches=len(lexical))
+
+        fused = {}
+        for ranking in (dense, lexical):
+            for rank, (document, metadata) in enumerate(ranking, start=1):
+                key = (document, (metadata or {}).get("url"))
+                score, _, first_metadata = fused.get(key, (0.0, document, metadata))
+                fused[key] = (score + 1 / (RRF_K + rank), document, first_metadata)
+        best = sorted(fused.values(), key=lambda entry: entry[0], reverse=True)[:n_results]
+        if citations:
+            return [(document, dict(metadata or {})) for _, document, metadata in best]
+        return [document for _, document, _ in best]
+
+    app.db.query = query
+    return index
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import sqlite3
+from ingestion import iter_file_paths
+
+# Function to build the manifest path for a collection, stored next to the Chroma data
+def manifest_path_for(db_dir, collection_name):
+    return os.path.join(db_dir, f"{collection_name}_manifest.sqlite3")
+
+# Function to derive a stable document id from a file path, independent of walk order
+def document_id_for(path):
+    return "doc_" + hashlib.sha1(path.encode("utf-8")).hexdigest()[:16]
+
+# Persistent record of which files are embedded in a collection. Each indexed path
+# maps to its size, mtime, content hash and document id, so re-runs only parse and
+# embed files that are new or changed and can drop the vectors of deleted ones.
+class IndexManifest:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                content_hash TEXT NOT NULL,
+                document_id TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    # Function to look up the manifest entry for a path
+    def get(self, path):
+        row = self.conn.execute(
+            "SELECT size, mtime, content_hash, document_id FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"size": row[0], "mtime": row[1], "content_hash": row[2], "document_id": row[3]}
+
+    # Function to compare a directory against the manifest. Returns the absolute paths
+    # whose size or mtime differ from the manifest (or are new) and the paths that
+    # are in the manifest but no longer on disk. Only stat() is needed, so an
+    # unchanged corpus is scanned without reading any file contents.
+    def scan(self, directory):
+        known = {
+            path: (size, mtime)
+            for path, size, mtime in self.conn.execute("SELECT path, size, mtime FROM files")
+        }
+        changed_paths = []
+        seen = set()
+        for filepath in iter_file_paths(directory):
+            filepath = os.path.abspath(filepath)
+            seen.add(filepath)
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            if known.get(filepath) != (stat.st_size, stat.st_mtime):
+                changed_paths.append(filepath)
+        directory = os.path.abspath(directory)
+        deleted_paths = [
+            path for path in known
+            if path not in seen and os.path.commonpath([path, directory]) == directory
+        ]
+        return changed_paths, deleted_paths
+
+    # Function to check whether the parsed content matches what is already embedded
+    def is_unchanged(self, path, content_hash):
+        entry = self.get(path)
+        return entry is not None and entry["content_hash"] == content_hash
+
+    # Function to record a file as embedded
+    def record(self, path, size, mtime, content_hash, document_id):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime, content_hash, document_id) VALUES (?, ?, ?, ?, ?)",
+            (path, size, mtime, content_hash, document_id),
+        )
+        self.conn.commit()
+
+    # Function to count the files recorded as embedded
+    def __len__(self):
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM files").fetchone()
+        return count
+
+    # Function to forget a file
+    def remove(self, path):
+        self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,132 @@
+import sys
+from colorama import Fore, Style
+from tqdm import tqdm
+from bulk_embed import BulkIndexer, DEFAULT_BATCH_SIZE, DEFAULT_MAX_TOKENS_PER_BATCH
+from chunking import AdaptiveChunker, CharacterChunker, TokenCounter
+from doc_stats import IngestionStats
+from ingestion import pdf_cache_path_for, read_files
+from manifest import IndexManifest, document_id_for, manifest_path_for
+from registry import CollectionRegistry, registry_path_for
+
+# Function to build the EmbedChain configuration shared by the scripts and the CLI
+def build_config(collection_name, db_dir="databases", chunk_size=300, chunk_overlap=50, min_chunk_size=200,
+                 llm_model="llama3:latest", llm_base_url="http://localhost:11434",
+                 embedder_model="BAAI/bge-small-en-v1.5"):
+    return {
+        "llm": {
+            "provider": "ollama",
+            "config": {
+                "base_url": llm_base_url,
+                "model": llm_model,
+                "temperature": 0.2,
+                "top_p": 1,
+                "stream": True
+            }
+        },
+        "embedder": {
+            "provider": "huggingface",
+            "config": {
+                "model": embedder_model
+            }
+        },
+        "vectordb": {
+            "provider": "chroma",
+            "config": {
+                "collection_name": collection_name,  # Ensure this is a valid collection name
+                "dir": db_dir,  # Ensure this directory exists
+                "allow_reset": True
+            }
+        },
+        "chunker": {
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "length_function": "len",
+            "min_chunk_size": min_chunk_size
+        }
+    }
+
+# Chunking strategies: "adaptive" sizes chunks per document in embedder tokens;
+# "fixed" uses the chunk_size/chunk_overlap/min_chunk_size characters of the config
+CHUNKING_STRATEGIES = ("adaptive", "fixed")
+
+# Function to build the chunker for a config. max_tokens caps adaptive chunks below
+# the embedder's own limit.
+def build_chunker(config, strategy="adaptive", max_tokens=None):
+    if strategy == "fixed":
+        chunker_config = config["chunker"]
+        return CharacterChunker(
+            chunker_config["chunk_size"],
+            chunker_config["chunk_overlap"],
+            chunker_config["min_chunk_size"],
+        )
+    return AdaptiveChunker(TokenCounter(config["embedder"]["config"]["model"]), max_tokens=max_tokens)
+
+# Function to embed a directory into the app's collection. Only files that are new or
+# changed since the last run are parsed and embedded, and the vectors of deleted files
+# are dropped. The collection, its settings and its new counts are recorded in the
+# registry of the Chroma directory (with label, when given). Returns the
+# IngestionStats of the run.
+def ingest_directory(app, config, directory_path, workers=None, batch_size=DEFAULT_BATCH_SIZE,
+                     max_tokens_per_batch=DEFAULT_MAX_TOKENS_PER_BATCH, chunker=None, label=None):
+    db_dir = config["vectordb"]["config"]["dir"]
+    collection_name = config["vectordb"]["config"]["collection_name"]
+    stats = IngestionStats()
+    indexer = BulkIndexer(
+        app,
+        chunker or build_chunker(config),
+        batch_size=batch_size,
+        max_tokens_per_batch=max_tokens_per_batch,
+        stats=stats,
+    )
+
+    # Compare the directory against the collection's manifest so only new or
+    # changed files are parsed and embedded
+    manifest = IndexManifest(manifest_path_for(db_dir, collection_name))
+    changed_paths, deleted_paths = manifest.scan(directory_path)
+
+    # Drop the vectors of files that were removed from the directory
+    for path in deleted_paths:
+        entry = manifest.get(path)
+        indexer.delete_document(entry["document_id"])
+        manifest.remove(path)
+        print(Fore.YELLOW + f"Removed document {entry['document_id']} for deleted source {path}." + Style.RESET_ALL)
+
+    # Parse files in the background and embed them as they arrive. Only statistics
+    # are kept for the report, so memory stays flat for large corpora.
+    # PDF page texts are cached by file hash, so rebuilt collections skip re-extraction
+    documents = read_files(changed_paths, workers=workers, pdf_cache_path=pdf_cache_path_for(db_dir))
+    for data in tqdm(documents, total=len(changed_paths), desc="Embedding Documents"):
+        path = data["metadata"]["source"]
+        document_id = document_id_for(path)
+        data["metadata"]["document_id"] = document_id
+        if manifest.is_unchanged(path, data["content_hash"]):
+            # Only the mtime changed; the embedded content is still current
+            manifest.record(path, data["size"], data["mtime"], data["content_hash"], document_id)
+            print(Fore.YELLOW + f"Document {document_id} is unchanged. Skipping insertion." + Style.RESET_ALL)
+            sys.stdout.flush()
+            continue
+        if manifest.get(path) is not None:
+            # The file was edited; replace its old vectors
+            indexer.delete_document(document_id)
+        stats.record_document(path, data["text"], data["parse_seconds"])
+        # The manifest entry is written only once the document's chunks are stored
+        indexer.add(
+            data["text"],
+            data["metadata"],
+            on_indexed=lambda path=path, size=data["size"], mtime=data["mtime"], content_hash=data["content_hash"], document_id=document_id: manifest.record(
+                path, size, mtime, content_hash, document_id
+            ),
+            page_offsets=data["page_offsets"],
+        )
+        print(Fore.GREEN + f"Queued document {document_id} with source {path}." + Style.RESET_ALL)
+        sys.stdout.flush()
+    indexer.flush()
+
+    registry = CollectionRegistry(registry_path_for(db_dir))
+    registry.register(collection_name, db_dir, config["embedder"]["config"]["model"], indexer.chunker.settings(), label=label)
+    registry.update_counts(collection_name, len(manifest), app.db.count())
+    registry.close()
+    manifest.close()
+    print(Fore.GREEN + f"Embedded {indexer.chunks_indexed} chunks into collection {collection_name}." + Style.RESET_ALL)
+    print(Fore.CYAN + f"{len(changed_paths)} new or modified files, {len(deleted_paths)} removed." + Style.RESET_ALL)
+    return stats
@@ -0,0 +1,353 @@
+import os
+import shutil
+import sqlite3
+import threading
+import numpy as np
+from bulk_embed import collection_version
+from chroma_utils import SYNC_PAGE_SIZE, chroma_where, collection_ids
+
+# Compact vector search for large collections. Chunk vectors are kept on disk as
+# full-precision float32 rows next to memory-mapped int8 (one byte per dimension) or
+# binary (one bit per dimension) codes. A query scans the codes for a shortlist of
+# candidates and reads only those rows of the full vectors to rescore them, so the
+# working set is the code file instead of Chroma's in-memory float32 HNSW index.
+# Chroma still stores the documents and metadata; the index is derived from the
+# collection and can be deleted and rebuilt at any time.
+
+QUANTIZATION_MODES = ("int8", "binary")
+
+# Candidates rescored per requested result; binary codes are coarser and need more
+DEFAULT_RESCORE_FACTORS = {"int8": 4, "binary": 32}
+
+# Smallest shortlist rescored against the full vectors
+MIN_SHORTLIST = 32
+
+# Rows decoded per step of the scan; small enough for the decoded block to stay in CPU cache
+SCAN_BLOCK_ROWS = 4096
+
+# Fraction of replaced or deleted rows above which a sync rewrites the index
+COMPACT_THRESHOLD = 0.25
+
+# The +1/-1 signs of the eight bits of every byte value, in np.packbits order
+BYTE_SIGNS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).astype(np.float32) * 2 - 1
+
+# Function to build the index directory for a collection under a Chroma directory
+def quantized_index_path_for(db_dir, collection_name, mode):
+    return os.path.join(db_dir, f"{collection_name}.{mode}-index")
+
+# Function to scale vectors to unit length as float32
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+class QuantizedIndex:
+    def __init__(self, path, mode="int8"):
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode {mode!r}; expected one of {QUANTIZATION_MODES}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        # Bumped whenever compact() renumbers the rows
+        self.generation = 0
+        self.vectors_file = None
+        self.connect()
+
+    def connect(self):
+        path, mode = self.path, self.mode
+        self.conn = sqlite3.connect(os.path.join(path, "rows.sqlite3"), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows (row INTEGER PRIMARY KEY, id TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS rows_id ON rows (id)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+        info = dict(self.conn.execute("SELECT key, value FROM info"))
+        if info.get("mode", mode) != mode:
+            raise ValueError(f"Index at {path} was built with {info['mode']} codes, not {mode}")
+        self.dimension = int(info["dimension"]) if "dimension" in info else None
+        self.open_arrays()
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    # Function to (re)map the array files; rows past the committed row count (left
+    # by an interrupted write) are ignored and cut off before the next append
+    def open_arrays(self):
+        (rows,) = self.conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()
+        self.rows = rows
+        self.codes = self.scales = None
+        if self.dimension is None or rows == 0:
+            return
+        # The full vectors are read row by row rather than mapped: mapping them would
+        # fault in whole pages around every shortlisted row
+        if self.vectors_file is None:
+            self.vectors_file = os.open(self.file("vectors.f32"), os.O_RDONLY)
+        if self.mode == "int8":
+            self.codes = np.memmap(self.file("codes.i8"), dtype=np.int8, mode="r", shape=(rows, self.dimension))
+            self.scales = np.memmap(self.file("scales.f32"), dtype=np.float32, mode="r", shape=(rows,))
+        else:
+            width = (self.dimension + 7) // 8
+            self.codes = np.memmap(self.file("codes.bits"), dtype=np.uint8, mode="r", shape=(rows, width))
+
+    def array_files(self):
+        if self.mode == "int8":
+            return {"vectors.f32": 4 * self.dimension, "codes.i8": self.dimension, "scales.f32": 4}
+        return {"vectors.f32": 4 * self.dimension, "codes.bits": (self.dimension + 7) // 8}
+
+    # Function to count the rows that are still live
+    def __len__(self):
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM rows WHERE deleted = 0").fetchone()
+        return count
+
+    # Function to read the collection version the index was last synced to
+    def synced_version(self):
+        row = self.conn.execute("SELECT value FROM info WHERE key = 'collection_version'").fetchone()
+        return row[0] if row else None
+
+    # Function to record the collection version the index is now in sync with
+    def mark_synced(self, version):
+        with self.lock:
+            if version is None:
+                self.conn.execute("DELETE FROM info WHERE key = 'collection_version'")
+            else:
+                self.conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('collection_version', ?)", (version,))
+            self.conn.commit()
+
+    # Function to map chunk ids to their live rows
+    def live_ids(self):
+        return {chunk_id for (chunk_id,) in self.conn.execute("SELECT id FROM rows WHERE deleted = 0")}
+
+    # Function to append vectors; a chunk id that is already indexed has its old row
+    # replaced
+    def add(self, ids, vectors):
+        if not ids:
+            return
+        vectors = normalize(vectors)
+        with self.lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+                    [("dimension", str(self.dimension)), ("mode", self.mode)],
+                )
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Expected {self.dimension}-dimensional vectors, got {vectors.shape[1]}")
+            # Release the maps before growing the files
+            self.codes = self.scales = None
+            if self.mode == "int8":
+                scales = np.abs(vectors).max(axis=1) / 127
+                scales[scales == 0] = 1
+                arrays = {
+                    "vectors.f32": vectors,
+                    "codes.i8": np.rint(vectors / scales[:, None]).astype(np.int8),
+                    "scales.f32": scales.astype(np.float32),
+                }
+            else:
+                arrays = {"vectors.f32": vectors, "codes.bits": np.packbits(vectors > 0, axis=1)}
+            row_bytes = self.array_files()
+            for name, array in arrays.items():
+                with open(self.file(name), "ab") as f:
+                    f.truncate(self.rows * row_bytes[name])
+                    f.seek(0, os.SEEK_END)
+                    f.write(np.ascontiguousarray(array).tobytes())
+            self.delete_ids(ids)
+            self.conn.executemany(
+                "INSERT INTO rows (row, id) VALUES (?, ?)",
+                [(self.rows + i, chunk_id) for i, chunk_id in enumerate(ids)],
+            )
+            self.conn.commit()
+            self.open_arrays()
+
+    def delete_ids(self, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            self.conn.execute(f"UPDATE rows SET deleted = 1 WHERE deleted = 0 AND id IN ({placeholders})", batch)
+
+    # Function to drop chunk ids from search results
+    def delete(self, ids):
+        with self.lock:
+            self.delete_ids(ids)
+            self.conn.commit()
+
+    # Function to read full-precision rows; the caller holds the lock
+    def read_vectors(self, rows):
+        row_bytes = 4 * self.dimension
+        data = b"".join(os.pread(self.vectors_file, row_bytes, int(row) * row_bytes) for row in rows)
+        return np.frombuffer(data, dtype=np.float32).reshape(len(rows), self.dimension)
+
+    # Function to compute approximate scores for one block of rows. Binary codes are
+    # scored against the full-precision query through a per-byte lookup table, which
+    # ranks far better than Hamming distance between two binary codes.
+    def approximate_scores(self, codes, scales, query, byte_table, start, end):
+        if self.mode == "int8":
+            return (codes[start:end].astype(np.float32) @ query) * scales[start:end]
+        block = codes[start:end]
+        return byte_table[np.arange(block.shape[1]), block].sum(axis=1)
+
+    # Function to build the (bytes per code, 256) table of query partial dot products
+    def byte_table(self, query):
+        padded = np.zeros(((self.dimension + 7) // 8) * 8, dtype=np.float32)
+        padded[:self.dimension] = query
+        return padded.reshape(-1, 8) @ BYTE_SIGNS.T
+
+    # Function to find the k nearest chunks to a query vector. Returns a list of
+    # (chunk_id, cosine similarity), best first.
+    def search(self, query, k, shortlist=None):
+        if k <= 0:
+            return []
+        query = normalize([query])[0]
+        while True:
+            # The scan works on a snapshot of the maps, so queries run in parallel with
+            # each other and with appends
+            with self.lock:
+                rows, codes, scales = self.rows, self.codes, self.scales
+                generation = self.generation
+            if rows == 0:
+                return []
+            byte_table = self.byte_table(query) if self.mode == "binary" else None
+            size = min(rows, shortlist or max(k * DEFAULT_RESCORE_FACTORS[self.mode], MIN_SHORTLIST))
+
+            # Approximate scan over the codes, keeping the best shortlist rows
+            best_rows = np.empty(0, dtype=np.int64)
+            best_scores = np.empty(0, dtype=np.float32)
+            for start in range(0, rows, SCAN_BLOCK_ROWS):
+                end = min(start + SCAN_BLOCK_ROWS, rows)
+                scores = np.concatenate([best_scores, self.approximate_scores(codes, scales, query, byte_table, start, end)])
+                candidates = np.concatenate([best_rows, np.arange(start, end, dtype=np.int64)])
+                if len(scores) > size:
+                    keep = np.argpartition(-scores, size - 1)[:size]
+                    scores, candidates = scores[keep], candidates[keep]
+                best_scores, best_rows = scores, candidates
+
+            # Skip replaced or deleted rows, then rescore against the full vectors
+            placeholders = ",".join("?" * len(best_rows))
+            with self.lock:
+                # A compaction during the scan renumbered the rows; scan again once
+                # the lock is released
+                stale = self.generation != generation
+                if not stale:
+                    live = dict(self.conn.execute(
+                        f"SELECT row, id FROM rows WHERE deleted = 0 AND row IN ({placeholders})",
+                        [int(row) for row in best_rows],
+                    ))
+                    live_rows = sorted(live)
+                    full_vectors = self.read_vectors(live_rows) if live else None
+            if not stale:
+                break
+        if not live:
+            return []
+        exact = full_vectors @ query
+        order = np.argsort(-exact)[:k]
+        return [(live[live_rows[i]], float(exact[i])) for i in order]
+
+    # Function to report the on-disk size of the index files, in bytes
+    def size_on_disk(self):
+        return {
+            name: os.path.getsize(self.file(name))
+            for name in os.listdir(self.path)
+            if os.path.isfile(self.file(name))
+        }
+
+    # Function to rewrite the index with only its live rows
+    def compact(self):
+        with self.lock:
+            live = self.conn.execute("SELECT row, id FROM rows WHERE deleted = 0 ORDER BY row").fetchall()
+            rebuilt_path = self.path + ".rebuild"
+            shutil.rmtree(rebuilt_path, ignore_errors=True)
+            rebuilt = QuantizedIndex(rebuilt_path, self.mode)
+            for start in range(0, len(live), SCAN_BLOCK_ROWS):
+                block = live[start:start + SCAN_BLOCK_ROWS]
+                rebuilt.add([chunk_id for _, chunk_id in block], self.read_vectors([row for row, _ in block]))
+            rebuilt.close()
+            # Searches still holding the old maps keep reading the retired files
+            self.close_files()
+            retired_path = self.path + ".old"
+            shutil.rmtree(retired_path, ignore_errors=True)
+            os.rename(self.path, retired_path)
+            os.rename(rebuilt_path, self.path)
+            shutil.rmtree(retired_path, ignore_errors=True)
+            self.generation += 1
+            self.connect()
+
+    def close_files(self):
+        self.codes = self.scales = None
+        if self.vectors_file is not None:
+            os.close(self.vectors_file)
+            self.vectors_file = None
+        self.conn.close()
+
+    def close(self):
+        with self.lock:
+            self.close_files()
+
+# Function to bring the index in line with the app's Chroma collection: vectors of
+# new chunks are copied over, removed chunks are dropped, and the files are rewritten
+# once enough rows are stale. Returns (added, removed).
+def sync_quantized_index(app, index, page_size=SYNC_PAGE_SIZE):
+    # Read before listing the ids, so a write during the sync leaves the index stale
+    version = collection_version(app)
+    collection = app.db.collection
+    current_ids = collection_ids(collection, page_size)
+    indexed_ids = index.live_ids()
+    removed = indexed_ids - current_ids
+    index.delete(removed)
+    missing = sorted(current_ids - indexed_ids)
+    for start in range(0, len(missing), page_size):
+        page = collection.get(ids=missing[start:start + page_size], include=["embeddings"])
+        index.add(page["ids"], page["embeddings"])
+
+    if index.rows and 1 - len(index) / index.rows > COMPACT_THRESHOLD:
+        index.compact()
+    index.mark_synced(version)
+    return len(missing), len(removed)
+
+# Function to check whether the index lags behind the app's collection: it holds a
+# different number of chunks, or the collection was written since the last sync
+def quantized_index_is_stale(app, index):
+    return len(index) != app.db.count() or index.synced_version() != collection_version(app)
+
+# Function to route an app's vector store queries through a quantized index. Chunk
+# texts and metadata are read from Chroma by id, so the collection's HNSW index is
+# never loaded for queries. Results follow embedchain's ChromaDB.query: texts, or
+# (text, metadata) pairs with the cosine distance as "score" when citations is set.
+def install_quantized_search(app, index):
+    def query(input_query, n_results, where=None, citations=False, raw_filter=None, **kwargs):
+        text = input_query[0] if isinstance(input_query, (list, tuple)) else input_query
+        embedding = app.embedder.embedding_fn([text])[0]
+        where_filter = raw_filter or chroma_where(where)
+        candidates = n_results
+        while True:
+            hits = index.search(embedding, candidates)
+            if not hits:
+                return []
+            found = app.db.collection.get(
+                ids=[chunk_id for chunk_id, _ in hits], where=where_filter, include=["documents", "metadatas"]
+            )
+            # Filters and chunks deleted from the collection can thin out the hits;
+            # widen the search until enough remain or the whole index was covered
+            if len(found["ids"]) >= n_results or len(hits) < candidates:
+                break
+            candidates *= 8
+        records = {
+            chunk_id: (document, metadata)
+            for chunk_id, document, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        }
+        contexts = []
+        for chunk_id, similarity in hits:
+            if chunk_id not in records:
+                continue
+            document, metadata = records[chunk_id]
+            if citations:
+                contexts.append((document, dict(metadata or {}, score=1 - similarity)))
+            else:
+                contexts.append(document)
+            if len(contexts) == n_results:
+                break
+        return contexts
+
+    app.db.query = query
+    return index
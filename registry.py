@@ -0,0 +1,181 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from lexical_index import lexical_index_path_for
+from manifest import manifest_path_for
+from quantized_index import QUANTIZATION_MODES, quantized_index_path_for
+
+# Registry of the collections under a Chroma directory. Each collection is recorded
+# with the embedder and chunker settings it was built with, its document and chunk
+# counts and its size on disk, so collections can be listed, and only collections
+# embedded with the same model are searched together.
+
+# Chroma's own database file, shared by every collection in the directory
+CHROMA_DATABASE = "chroma.sqlite3"
+
+# Function to build the registry path for a Chroma directory
+def registry_path_for(db_dir):
+    return os.path.join(db_dir, "collections.sqlite3")
+
+# Function to total the size of a file or directory tree, in bytes
+def path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+# Function to list the files kept next to the Chroma data for one collection
+def collection_files(db_dir, collection_name):
+    paths = [
+        manifest_path_for(db_dir, collection_name),
+        lexical_index_path_for(db_dir, collection_name),
+        # crawler.crawl_state_path_for; not imported to keep the crawler's HTTP stack out
+        os.path.join(db_dir, f"{collection_name}_crawl.sqlite3"),
+    ]
+    paths += [quantized_index_path_for(db_dir, collection_name, mode) for mode in QUANTIZATION_MODES]
+    return [path for path in paths if os.path.exists(path)]
+
+# Function to estimate a collection's size on disk: its vector index segments, the
+# files kept next to it, and its share (by chunk count) of Chroma's shared database.
+# Chroma has no API for this, so its internal SQLite schema (the segments,
+# collections and embeddings tables of chroma 0.5 to 1.x) is read directly; a Chroma
+# upgrade that changes it makes the lookup fail, and the size is then None (unknown)
+# rather than a misleading partial figure.
+def collection_size_on_disk(db_dir, collection_name):
+    size = sum(path_size(path) for path in collection_files(db_dir, collection_name))
+    database = os.path.join(db_dir, CHROMA_DATABASE)
+    if not os.path.exists(database):
+        return size
+    try:
+        conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+        try:
+            segments = [segment for (segment,) in conn.execute(
+                "SELECT s.id FROM segments s JOIN collections c ON c.id = s.collection WHERE c.name = ?",
+                (collection_name,),
+            )]
+            counts = dict(conn.execute(
+                "SELECT c.name, COUNT(e.id) FROM collections c "
+                "JOIN segments s ON s.collection = c.id "
+                "JOIN embeddings e ON e.segment_id = s.id GROUP BY c.name"
+            ))
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    size += sum(path_size(os.path.join(db_dir, segment)) for segment in segments if os.path.isdir(os.path.join(db_dir, segment)))
+    total = sum(counts.values())
+    if total:
+        size += os.path.getsize(database) * counts.get(collection_name, 0) // total
+    return size
+
+class CollectionRegistry:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS collections (
+                name TEXT PRIMARY KEY,
+                label TEXT,
+                db_dir TEXT NOT NULL,
+                embedder_model TEXT NOT NULL,
+                chunker TEXT NOT NULL,
+                documents INTEGER NOT NULL DEFAULT 0,
+                chunks INTEGER NOT NULL DEFAULT 0,
+                size_bytes INTEGER,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    # Function to record a collection and the settings it is built with; an existing
+    # entry keeps its label unless a new one is given
+    def register(self, name, db_dir, embedder_model, chunker_settings, label=None):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO collections (name, label, db_dir, embedder_model, chunker, created, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    label = COALESCE(excluded.label, label),
+                    db_dir = excluded.db_dir,
+                    embedder_model = excluded.embedder_model,
+                    chunker = excluded.chunker,
+                    updated = excluded.updated
+                """,
+                (name, label, db_dir, embedder_model, json.dumps(chunker_settings, sort_keys=True), now, now),
+            )
+            self.conn.commit()
+
+    # Function to refresh a collection's document count, chunk count and size on disk
+    # (NULL when it cannot be determined)
+    def update_counts(self, name, documents, chunks):
+        with self.lock:
+            row = self.conn.execute("SELECT db_dir FROM collections WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                raise KeyError(f"Collection {name!r} is not registered")
+            self.conn.execute(
+                "UPDATE collections SET documents = ?, chunks = ?, size_bytes = ?, updated = ? WHERE name = ?",
+                (documents, chunks, collection_size_on_disk(row[0], name), time.time(), name),
+            )
+            self.conn.commit()
+
+    def row_to_entry(self, row):
+        name, label, db_dir, embedder_model, chunker, documents, chunks, size_bytes, created, updated = row
+        return {
+            "name": name,
+            "label": label,
+            "db_dir": db_dir,
+            "embedder_model": embedder_model,
+            "chunker": json.loads(chunker),
+            "documents": documents,
+            "chunks": chunks,
+            "size_bytes": size_bytes,
+            "created": created,
+            "updated": updated,
+        }
+
+    # Function to look up one collection; returns None when it is not registered
+    def get(self, name):
+        row = self.conn.execute("SELECT * FROM collections WHERE name = ?", (name,)).fetchone()
+        return self.row_to_entry(row) if row else None
+
+    # Function to list every registered collection, by name
+    def entries(self):
+        return [self.row_to_entry(row) for row in self.conn.execute("SELECT * FROM collections ORDER BY name")]
+
+    # Function to forget a collection (its Chroma data is left alone)
+    def remove(self, name):
+        with self.lock:
+            self.conn.execute("DELETE FROM collections WHERE name = ?", (name,))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# Function to format a size in bytes as megabytes for the registry table
+def size_megabytes(size_bytes):
+    return "unknown" if size_bytes is None else f"{size_bytes / (1024 * 1024):.1f}"
+
+# Function to render the registry as a Markdown table
+def registry_markdown(entries):
+    lines = [
+        "| Collection | Label | Embedder | Chunking | Documents | Chunks | Size (MB) |",
+        "|------------|-------|----------|----------|-----------|--------|-----------|",
+    ]
+    for entry in entries:
+        lines.append(
+            f"| {entry['name']} | {entry['label'] or ''} | {entry['embedder_model']} | {entry['chunker'].get('strategy', '')} "
+            f"| {entry['documents']} | {entry['chunks']} | {size_megabytes(entry['size_bytes'])} |"
+        )
+    return "\n".join(lines)
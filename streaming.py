@@ -0,0 +1,129 @@
+import json
+import time
+import requests
+from tracing import tracer
+
+# Function to stream a generation for a complete prompt from the Ollama HTTP API,
+# using the model settings of the app's configured LLM
+def stream_generate(app, prompt):
+    llm_config = app.llm.config
+    base_url = getattr(llm_config, "base_url", None) or "http://localhost:11434"
+    payload = {
+        "model": llm_config.model,
+        "prompt": prompt,
+        "stream": True,
+        "options": {"temperature": llm_config.temperature, "top_p": llm_config.top_p},
+    }
+    system_prompt = getattr(llm_config, "system_prompt", None)
+    if system_prompt:
+        payload["system"] = system_prompt
+    with tracer.span("generate", model=llm_config.model, prompt_characters=len(prompt)) as span:
+        started = time.perf_counter()
+        tokens = 0
+        with requests.post(f"{base_url.rstrip('/')}/api/generate", json=payload, stream=True, timeout=(5, None)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("response"):
+                    if tokens == 0:
+                        tracer.record("ttft", time.perf_counter() - started, model=llm_config.model)
+                    tokens += 1
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    break
+        span.set(tokens=tokens)
+        tracer.count("tokens_generated", tokens)
+
+# Function to generate a complete answer for a prompt without printing anything
+def generate(app, prompt):
+    return "".join(stream_generate(app, prompt))
+
+# Prompt for answers from the app's collection: embedchain's default Q&A template
+# with the chat history (pinned instructions, rolling summary and recent turns) added
+PROMPT_TEMPLATE = """You are a Q&A expert system. Your responses must always be rooted in the context provided for each query. Here are some guidelines to follow:
+
+1. Refrain from explicitly mentioning the context provided in your response.
+2. The context should silently guide your answers without being directly acknowledged.
+3. Do not use phrases such as 'According to the context provided', 'Based on the context, ...' etc.
+
+Context information:
+----------------------
+{context}
+----------------------
+{history}
+Query: {query}
+
+Answer:"""
+
+# Function to render chat messages ({"role", "content"} dicts) for the prompt
+def format_history(history):
+    lines = [f"{message['role']}: {message['content']}" for message in history or [] if message.get("content")]
+    return "\nConversation history:\n" + "\n".join(lines) + "\n" if lines else ""
+
+# Function to retrieve the context chunks for a query the way embedchain's App.query
+# does, through app.db.query (so installed hybrid or quantized search is used)
+def retrieve_contexts(app, query, where=None, n_results=None):
+    where = dict(where or {})
+    if getattr(app.config, "id", None) is not None:
+        where["app_id"] = app.config.id
+    n_results = n_results or app.llm.config.number_documents
+    return app.db.query(input_query=query, n_results=n_results, where=where, citations=False)
+
+# Function to stream an answer token by token. The prompt is assembled here rather
+# than by an embedchain dry run, which ignores the chat history; generation is
+# streamed straight from the Ollama HTTP API so tokens can be shown as they arrive.
+# history should hold the earlier turns only, not the query itself. The prompt span
+# covers query embedding and retrieval, which get their own spans on an
+# instrumented app.
+def stream_answer(app, query, history=None, where=None):
+    with tracer.span("prompt"):
+        contexts = retrieve_contexts(app, query, where)
+        prompt = PROMPT_TEMPLATE.format(context=" | ".join(contexts), history=format_history(history), query=query)
+    yield from stream_generate(app, prompt)
+
+# Function to write streamed tokens as they arrive and assemble the full answer.
+# Ctrl-C stops the generation; returns (answer, cancelled).
+def render_stream(tokens, write):
+    parts = []
+    try:
+        for token in tokens:
+            write(token)
+            parts.append(token)
+    except KeyboardInterrupt:
+        tokens.close()
+        return "".join(parts), True
+    return "".join(parts), False
+
+# Function to answer one chat turn: from the answer cache when it holds the question,
+# otherwise streamed from the app's collection (or from a FanOutQuery when fanout is
+# given) and cached once complete. Tokens, or the cached answer, are passed to write;
+# Ctrl-C cancels the generation. The turn joins chat_history only after it is
+# answered, so the question is not sent twice in its own prompt. Returns
+# (answer, cancelled).
+def answer_chat_turn(app, query, chat_history, write, answer_cache=None, fanout=None):
+    history = chat_history.messages()
+    with tracer.span("query", streamed=True) as span:
+        answer = cache_key = None
+        if answer_cache is not None:
+            answer, cache_key = answer_cache.lookup(query, history)
+        span.set(cached=answer is not None)
+        cancelled = False
+        if answer is not None:
+            write(answer)
+        else:
+            if fanout is not None:
+                tokens = fanout.stream_answer(query, history=history)
+            else:
+                tokens = stream_answer(app, query, history=history)
+            answer, cancelled = render_stream(tokens, write)
+            span.set(cancelled=cancelled)
+            if answer and not cancelled and answer_cache is not None:
+                answer_cache.store(cache_key, answer)
+    if answer:
+        chat_history.append({"role": "user", "content": query})
+        chat_history.append({"role": "assistant", "content": answer})
+    return answer, cancelled
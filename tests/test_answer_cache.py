@@ -0,0 +1,55 @@
+import pytest
+import streaming
+from answer_cache import AnswerCache, is_follow_up
+from chat_history import ChatHistory
+
+@pytest.fixture
+def app(tmp_path):
+    from benchmarks.stubs import StubApp
+
+    return StubApp(str(tmp_path / "db"), "coll")
+
+# Function to run one turn of the chat loops, with generation replaced by a fixed
+# answer; returns (answer, cached)
+def chat_turn(cache, history, query, answer, monkeypatch):
+    generated = []
+
+    def stream_answer(app, query, history=None):
+        generated.append(query)
+        yield answer
+
+    monkeypatch.setattr(streaming, "stream_answer", stream_answer)
+    response, _ = streaming.answer_chat_turn(cache.app, query, history, lambda token: None, answer_cache=cache)
+    return response, not generated
+
+def test_repeated_question_in_a_running_chat_is_cached(app, monkeypatch):
+    cache = AnswerCache(app)
+    history = ChatHistory("Answer from the data source.")
+    question = "What does the report say about revenue growth?"
+    assert chat_turn(cache, history, question, "Revenue grew 10%.", monkeypatch) == ("Revenue grew 10%.", False)
+    assert chat_turn(cache, history, question, "unused", monkeypatch) == ("Revenue grew 10%.", True)
+    chat_turn(cache, history, "Which regions are covered by the survey?", "Europe and Asia.", monkeypatch)
+    assert chat_turn(cache, history, question, "unused", monkeypatch) == ("Revenue grew 10%.", True)
+
+def test_follow_up_depends_on_the_previous_turn(app, monkeypatch):
+    cache = AnswerCache(app)
+    history = ChatHistory("Answer from the data source.")
+    chat_turn(cache, history, "What does the report say about revenue growth?", "Revenue grew 10%.", monkeypatch)
+    assert chat_turn(cache, history, "Tell me more about it", "More on revenue.", monkeypatch) == ("More on revenue.", False)
+    chat_turn(cache, history, "Which regions are covered by the survey?", "Europe and Asia.", monkeypatch)
+    assert chat_turn(cache, history, "Tell me more about it", "More on regions.", monkeypatch) == ("More on regions.", False)
+
+def test_collection_writes_invalidate_answers(app):
+    cache = AnswerCache(app)
+    _, key = cache.lookup("What does the report say about revenue growth?")
+    cache.store(key, "Revenue grew 10%.")
+    app.db.collection.add(ids=["new"], embeddings=[[1.0] * 384], documents=["new text"])
+    assert cache.lookup("What does the report say about revenue growth?")[0] is None
+
+@pytest.mark.parametrize("query, follow_up", [
+    ("Why?", True),
+    ("Can you elaborate on that", True),
+    ("What are the main findings of the survey?", False),
+])
+def test_is_follow_up(query, follow_up):
+    assert is_follow_up(query) is follow_up
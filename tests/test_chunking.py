@@ -0,0 +1,29 @@
+import pytest
+from chunking import AdaptiveChunker, TokenCounter
+
+# Counter with one token per character, so limits are exact without a tokenizer download
+class CharacterCounter(TokenCounter):
+    def __init__(self, max_tokens=512):
+        super().__init__()
+        self.max_tokens = max_tokens
+        self.encode = lambda texts: [len(text) for text in texts]
+
+@pytest.mark.parametrize("counter", [TokenCounter(), CharacterCounter()], ids=["estimate", "exact"])
+@pytest.mark.parametrize("text, source", [
+    ("x" * 10000, "scan.pdf"),
+    ("word " * 3000, "notes.txt"),
+    ("# Intro\n\n" + "y" * 3000 + "\n\n# Details\n\nA short paragraph.\n\n" + "z " * 900, "guide.md"),
+])
+def test_every_chunk_fits_the_token_limit(counter, text, source):
+    chunker = AdaptiveChunker(counter)
+    chunks, _ = chunker.split(text, source=source)
+    assert chunks
+    assert max(counter.count([chunk["text"] for chunk in chunks])) <= chunker.max_tokens
+    for chunk in chunks:
+        assert text[chunk["start"]:chunk["start"] + len(chunk["text"])] == chunk["text"]
+
+def test_text_without_whitespace_is_cut_between_characters():
+    chunker = AdaptiveChunker(CharacterCounter(max_tokens=100), target_tokens=100, overlap_tokens=0)
+    chunks, _ = chunker.split("x" * 1000, source="scan.pdf")
+    assert all(chunk["tokens"] <= 100 for chunk in chunks)
+    assert "".join(chunk["text"] for chunk in chunks) == "x" * 1000
@@ -0,0 +1,159 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from crawler import Crawler, CrawlState, crawl_into_app, iter_crawled_pages
+
+LAST_MODIFIED = "Mon, 05 Oct 2026 10:00:00 GMT"
+
+# Local stand-in for a website: serves HTML pages from a dict with ETag and
+# Last-Modified validators (Last-Modified only for the paths in dated_only), answers
+# conditional requests with 304 and logs every request it receives
+class Site:
+    def __init__(self, pages, robots="", dated_only=()):
+        self.pages = dict(pages)
+        self.robots = robots
+        self.dated_only = set(dated_only)
+        self.requests = []
+        self.versions = {path: 1 for path in pages}
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.requests.append(self.path)
+                if self.path == "/robots.txt":
+                    self.respond(200, site.robots, "text/plain")
+                    return
+                if self.path not in site.pages:
+                    self.respond(404, "missing", "text/plain")
+                    return
+                if self.path in site.dated_only:
+                    validators = {"Last-Modified": LAST_MODIFIED}
+                    not_modified = self.headers.get("If-Modified-Since") == LAST_MODIFIED
+                else:
+                    validators = {"ETag": f'"{site.versions[self.path]}"', "Last-Modified": LAST_MODIFIED}
+                    not_modified = self.headers.get("If-None-Match") == validators["ETag"]
+                if not_modified:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.respond(200, site.pages[self.path], "text/html", validators)
+
+            def respond(self, status, body, content_type, headers=None):
+                payload = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    # Function to change a page, giving it a new ETag
+    def edit(self, path, html):
+        self.pages[path] = html
+        self.versions[path] += 1
+
+    def page_requests(self):
+        return [path for path in self.requests if path != "/robots.txt"]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def page(title, body, *links):
+    anchors = "".join(f'<a href="{link}">{link}</a>' for link in links)
+    return f"<html><head><title>{title}</title></head><body><p>{body}</p>{anchors}</body></html>"
+
+@pytest.fixture
+def sites():
+    other = Site({"/": page("Other", "A page on another host.")})
+    site = Site(
+        {
+            "/": page("Home", "The home page.", "/a", "/b", "/private/secret", other.url + "/"),
+            "/a": page("A", "Page A about apples.", "/a/deep"),
+            "/b": page("B", "Page B about bananas.", "/"),
+            "/a/deep": page("Deep", "A deeper page about dates.", "/a/deeper"),
+            "/a/deeper": page("Deeper", "The deepest page."),
+            "/private/secret": page("Secret", "Not for crawlers."),
+        },
+        robots="User-agent: *\nDisallow: /private/\n",
+        dated_only={"/b"},
+    )
+    yield site, other
+    site.close()
+    other.close()
+
+def crawled_paths(site, max_depth, state=None):
+    crawler = Crawler([site.url + "/"], max_depth=max_depth, concurrency=4, state=state)
+    return {page["metadata"]["source"][len(site.url):] for page in iter_crawled_pages(crawler)}, crawler
+
+def test_seed_only_at_depth_zero(sites):
+    site, _ = sites
+    paths, _ = crawled_paths(site, 0)
+    assert paths == {"/"}
+
+def test_depth_limits_the_crawl(sites):
+    site, _ = sites
+    paths, _ = crawled_paths(site, 1)
+    assert paths == {"/", "/a", "/b"}
+    paths, _ = crawled_paths(site, 2)
+    assert paths == {"/", "/a", "/b", "/a/deep"}
+
+def test_robots_disallow_is_respected(sites):
+    site, _ = sites
+    paths, crawler = crawled_paths(site, 3)
+    assert "/private/secret" not in paths
+    assert "/private/secret" not in site.requests
+    assert crawler.stats["skipped"] >= 1
+
+def test_links_to_other_hosts_are_not_followed(sites):
+    site, other = sites
+    paths, _ = crawled_paths(site, 3)
+    assert paths == {"/", "/a", "/b", "/a/deep", "/a/deeper"}
+    assert other.requests == []
+
+def test_recrawl_skips_unchanged_pages(sites, tmp_path):
+    from benchmarks.stubs import StubApp
+
+    site, _ = sites
+    app = StubApp(str(tmp_path / "db"), "crawl-test")
+    state_path = str(tmp_path / "crawl.sqlite3")
+
+    first = crawl_into_app(app, [site.url + "/"], state_path, max_depth=1, concurrency=4)
+    assert first.stats["fetched"] == 3
+    chunks = app.db.count()
+    assert chunks > 0
+
+    # Unchanged pages are answered with 304 from their ETag (or, for /b, their
+    # Last-Modified date), and nothing is re-embedded
+    site.requests.clear()
+    second = crawl_into_app(app, [site.url + "/"], state_path, max_depth=1, concurrency=4)
+    assert second.stats["fetched"] == 0
+    assert second.stats["unchanged"] == 3
+    assert app.db.count() == chunks
+    # Links of unchanged pages come from the crawl state, so the crawl still reaches them
+    assert sorted(site.page_requests()) == ["/", "/a", "/b"]
+
+    # Only the edited page is fetched in full and replaced
+    site.edit("/a", page("A", "Page A is now about apricots.", "/a/deep"))
+    third = crawl_into_app(app, [site.url + "/"], state_path, max_depth=1, concurrency=4)
+    assert third.stats["fetched"] == 1
+    assert third.stats["unchanged"] == 2
+    documents = app.db.collection.get(where={"url": site.url + "/a"}, include=["documents"])["documents"]
+    assert len(documents) == 1 and "apricots" in documents[0]
+
+def test_crawl_state_round_trip(tmp_path):
+    state = CrawlState(str(tmp_path / "crawl.sqlite3"))
+    state.record("http://example.test/", '"1"', LAST_MODIFIED, "hash", ["/a"])
+    assert state.get("http://example.test/") == {
+        "etag": '"1"', "last_modified": LAST_MODIFIED, "content_hash": "hash", "links": ["/a"],
+    }
+    assert state.get("http://example.test/missing") is None
+    state.close()
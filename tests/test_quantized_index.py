@@ -0,0 +1,90 @@
+import threading
+import numpy as np
+import pytest
+from quantized_index import QUANTIZATION_MODES, QuantizedIndex, quantized_index_is_stale, sync_quantized_index
+
+DIMENSION = 64
+
+def random_vectors(count, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+@pytest.fixture(params=QUANTIZATION_MODES)
+def index(request, tmp_path):
+    index = QuantizedIndex(str(tmp_path / "index"), request.param)
+    yield index
+    index.close()
+
+def ids_for(count, prefix="chunk"):
+    return [f"{prefix}-{i}" for i in range(count)]
+
+def test_search_finds_each_stored_vector(index):
+    vectors = random_vectors(200)
+    index.add(ids_for(200), vectors)
+    assert len(index) == 200
+    for i in (0, 57, 199):
+        chunk_id, similarity = index.search(vectors[i], 1)[0]
+        assert chunk_id == f"chunk-{i}"
+        assert similarity == pytest.approx(1.0, abs=1e-5)
+
+def test_deleted_and_replaced_rows_are_not_returned(index):
+    vectors = random_vectors(50)
+    index.add(ids_for(50), vectors)
+    index.delete(["chunk-3"])
+    assert "chunk-3" not in [chunk_id for chunk_id, _ in index.search(vectors[3], 5)]
+    # Re-adding an id replaces its old row
+    index.add(["chunk-4"], vectors[5:6])
+    assert len(index) == 49
+    hits = dict(index.search(vectors[5], 2))
+    assert hits.keys() == {"chunk-4", "chunk-5"}
+
+def test_compact_keeps_only_live_rows(index):
+    vectors = random_vectors(100)
+    index.add(ids_for(100), vectors)
+    index.delete(ids_for(60))
+    index.compact()
+    assert index.rows == 40 and len(index) == 40
+    assert index.search(vectors[80], 1)[0][0] == "chunk-80"
+
+def test_compact_during_a_search_rescans(index, monkeypatch):
+    vectors = random_vectors(100)
+    index.add(ids_for(100), vectors)
+    index.delete(ids_for(50))
+    approximate_scores = index.approximate_scores
+    compactions = []
+
+    # Compact once, in the middle of the first scan, as an ingest would between queries
+    def compacting_scores(*args):
+        if not compactions:
+            compactions.append(True)
+            index.compact()
+        return approximate_scores(*args)
+
+    monkeypatch.setattr(index, "approximate_scores", compacting_scores)
+    results = []
+    search = threading.Thread(target=lambda: results.append(index.search(vectors[70], 1)), daemon=True)
+    search.start()
+    search.join(timeout=10)
+    assert not search.is_alive(), "search deadlocked after a concurrent compaction"
+    assert compactions and index.generation == 1
+    assert results[0][0][0] == "chunk-70"
+
+def test_sync_follows_the_collection(tmp_path):
+    from benchmarks.stubs import StubApp
+
+    app = StubApp(str(tmp_path / "db"), "coll")
+    vectors = random_vectors(30)
+    app.db.collection.add(ids=ids_for(30), embeddings=vectors.tolist(), documents=[f"text {i}" for i in range(30)])
+    index = QuantizedIndex(str(tmp_path / "index"), "int8")
+    assert quantized_index_is_stale(app, index)
+    assert sync_quantized_index(app, index) == (30, 0)
+    assert not quantized_index_is_stale(app, index)
+
+    app.db.collection.delete(ids=ids_for(10))
+    app.db.collection.add(ids=["new"], embeddings=random_vectors(1, seed=1).tolist(), documents=["new text"])
+    assert quantized_index_is_stale(app, index)
+    assert sync_quantized_index(app, index) == (1, 10)
+    # A third of the rows were stale, so the sync compacted the files
+    assert index.rows == len(index) == 21
+    assert index.search(vectors[20], 1)[0][0] == "chunk-20"
+    index.close()
@@ -0,0 +1,156 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from streaming import generate
+from topic_clusters import cluster_collection, load_representatives, related_clusters
+from tracing import tracer
+
+# Topic analysis over the whole collection: chunk embeddings are clustered (see
+# topic_clusters.py), every cluster is named by one short LLM call, and reports give
+# each topic its true frequency and its most central chunks as example mentions.
+
+# Default number of LLM generations allowed to run at the same time
+DEFAULT_LLM_CONCURRENCY = 2
+
+# Number of topics in a report
+DEFAULT_TOP_TOPICS = 5
+
+# Characters of each representative chunk shown to the LLM when labelling a cluster
+LABEL_EXCERPT_CHARS = 400
+
+# Example mentions listed per topic, and their length in characters
+EXAMPLES_PER_TOPIC = 3
+EXAMPLE_CHARS = 240
+
+LABEL_LINE = re.compile(r"^\W*label\W*:\s*(.+)$", re.IGNORECASE | re.MULTILINE)
+DESCRIPTION_LINE = re.compile(r"^\W*description\W*:\s*(.+)$", re.IGNORECASE | re.MULTILINE)
+
+# Define the system instruction message
+SYSTEM_MESSAGE = "You are an AI assistant that helps users find information from the indexed documents. Please verify that the question can be answered using the available data. If the data is not present, inform the user that the question cannot be answered using the available data."
+
+# Function to read a topics file (one topic area or query per line, # starts a comment)
+def read_topics(path):
+    with open(path, 'r') as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if line and not line.startswith("#")]
+
+# Function to turn a topic area into a safe report file name
+def report_filename(topic_area):
+    slug = re.sub(r"[^a-zA-Z0-9]+", "_", topic_area).strip("_").lower()[:80]
+    return f"topic_analysis_{slug or 'report'}.md"
+
+# Function to build the prompt that names one cluster from its representative chunks
+def label_prompt(cluster):
+    excerpts = "\n\n".join(
+        f"Excerpt {i}: {excerpt(representative['text'], LABEL_EXCERPT_CHARS)}"
+        for i, representative in enumerate(cluster["representatives"], start=1)
+    )
+    return f"""The excerpts below come from one group of related passages in a document collection.
+Name the topic they share.
+
+{excerpts}
+
+Reply with exactly two lines:
+Label: <a topic name of at most six words>
+Description: <one sentence describing the topic>"""
+
+# Function to shorten a chunk to a one-line excerpt
+def excerpt(text, limit):
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + "..."
+
+# Function to read the label and description out of a labelling answer
+def parse_label(response, fallback):
+    label = LABEL_LINE.search(response or "")
+    description = DESCRIPTION_LINE.search(response or "")
+    return (
+        label.group(1).strip(" *\"'") if label else fallback,
+        description.group(1).strip(" *") if description else "",
+    )
+
+# Function to label every cluster with one small LLM call each; the calls run in
+# parallel, at most llm_concurrency at a time
+def label_clusters(app, clusters, llm_concurrency=DEFAULT_LLM_CONCURRENCY):
+    def label(cluster):
+        with tracer.span("label", cluster=cluster["cluster"], size=cluster["size"]):
+            response = generate(app, label_prompt(cluster))
+        fallback = next((r["section"] for r in cluster["representatives"] if r.get("section")), f"Topic {cluster['cluster'] + 1}")
+        cluster["label"], cluster["description"] = parse_label(response, fallback)
+
+    with ThreadPoolExecutor(max_workers=max(1, llm_concurrency)) as executor:
+        for future in [executor.submit(label, cluster) for cluster in clusters]:
+            future.result()
+    return clusters
+
+# Function to find the topics of a whole collection: every stored chunk embedding is
+# clustered, and each cluster is labelled from its most central chunks. Returns
+# {"chunks": total chunks, "clusters": [...]}, largest cluster first, where each
+# cluster also lists its related clusters by label.
+def corpus_topics(app, clusters=None, llm_concurrency=DEFAULT_LLM_CONCURRENCY):
+    with tracer.span("corpus_topics") as span:
+        found, chunks = cluster_collection(app.db.collection, clusters)
+        load_representatives(app.db.collection, found)
+        label_clusters(app, found, llm_concurrency)
+        by_id = {cluster["cluster"]: cluster for cluster in found}
+        for cluster_id, related in related_clusters(found).items():
+            by_id[cluster_id]["related"] = [by_id[i]["label"] for i in related]
+        span.set(chunks=chunks, clusters=len(found))
+    return {"chunks": chunks, "clusters": found}
+
+# Function to rank a collection's topics by their relevance to a topic area (cosine
+# similarity between the topic area and the cluster centroid)
+def rank_topics(app, corpus, topic_area, top_n=DEFAULT_TOP_TOPICS):
+    query = np.asarray(app.embedder.embedding_fn([topic_area])[0], dtype=np.float32)
+    query /= np.linalg.norm(query) or 1
+    ranked = [dict(cluster, relevance=float(cluster["centroid"] @ query)) for cluster in corpus["clusters"]]
+    ranked.sort(key=lambda cluster: cluster["relevance"], reverse=True)
+    return ranked[:top_n]
+
+# Function to render topics as a markdown report. Frequencies are the true cluster
+# sizes; example mentions are the chunks closest to each cluster centre.
+def topics_markdown(corpus, topics, topic_area=None):
+    scope = f" The topics most related to \"{topic_area}\" are listed first." if topic_area else ""
+    lines = [f"{len(corpus['clusters'])} topics were found across the {corpus['chunks']} chunks of the collection.{scope}\n"]
+    for rank, topic in enumerate(topics, start=1):
+        lines.append(f"## {rank}. {topic['label']}\n")
+        if topic["description"]:
+            lines.append(f"{topic['description']}\n")
+        lines.append(f"- **Frequency:** {topic['size']} chunks ({topic['share']:.1%} of the collection) in {topic['documents']} documents")
+        if topic_area:
+            lines.append(f"- **Importance:** {topic['relevance']:.2f} similarity to \"{topic_area}\"")
+        if topic.get("related"):
+            lines.append(f"- **Related topics:** {', '.join(topic['related'])}")
+        lines.append("- **Example mentions:**")
+        for representative in topic["representatives"][:EXAMPLES_PER_TOPIC]:
+            lines.append(f"  - \"{excerpt(representative['text'], EXAMPLE_CHARS)}\" ({representative['source'] or 'unknown source'})")
+        lines.append("")
+    lines.append("## All topics\n")
+    lines.append("| Topic | Chunks | Share | Documents |")
+    lines.append("|-------|--------|-------|-----------|")
+    for cluster in corpus["clusters"]:
+        lines.append(f"| {cluster['label']} | {cluster['size']} | {cluster['share']:.1%} | {cluster['documents']} |")
+    return "\n".join(lines) + "\n\n"
+
+# Function to analyze many topic areas against one loaded app. The collection is
+# clustered and labelled once; each topic area then only ranks the clusters, so the
+# LLM cost depends on the number of clusters, not on the number of topic areas or
+# chunks. Returns a dict of topic area to report markdown (or exception).
+def analyze_topics(app, topic_areas, llm_concurrency=DEFAULT_LLM_CONCURRENCY, clusters=None, top_n=DEFAULT_TOP_TOPICS):
+    corpus = corpus_topics(app, clusters, llm_concurrency)
+    results = {}
+    for topic_area in topic_areas:
+        with tracer.span("analyze", topic_area=topic_area):
+            try:
+                results[topic_area] = topics_markdown(corpus, rank_topics(app, corpus, topic_area, top_n), topic_area)
+            except Exception as e:
+                results[topic_area] = e
+    return results
+
+# Function to write one topic report and return its path
+def write_topic_report(output_directory, topic_area, response, statistics_markdown=""):
+    os.makedirs(output_directory, exist_ok=True)
+    report_path = os.path.join(output_directory, report_filename(topic_area))
+    with open(report_path, "w") as report_file:
+        report_file.write(f"# Topic Analysis: {topic_area}\n\n" + response + statistics_markdown)
+    return report_path
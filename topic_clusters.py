@@ -0,0 +1,195 @@
+import math
+import numpy as np
+from tracing import tracer
+
+# Corpus-wide topic clustering. Chunk embeddings are streamed from the Chroma
+# collection a page at a time and clustered with mini-batch spherical k-means, so
+# memory stays bounded by the page size and the number of clusters. A final pass
+# assigns every chunk to its nearest centroid, which gives each cluster its true
+# size, the documents it spans and the chunks closest to its centroid.
+
+# Chunk embeddings read from Chroma per request
+STREAM_PAGE_SIZE = 2000
+
+# Rows per k-means update step
+MINI_BATCH_SIZE = 512
+
+# Passes over the collection before the final assignment pass
+DEFAULT_EPOCHS = 3
+
+# Rows kept (by reservoir sampling) to seed the centroids with k-means++
+SEED_SAMPLE_SIZE = 10000
+
+# Upper bound on the number of clusters chosen from the collection size
+MAX_AUTO_CLUSTERS = 20
+
+# Chunks closest to the centroid kept per cluster
+DEFAULT_REPRESENTATIVES = 5
+
+# Function to pick a cluster count for a collection: about sqrt(chunks / 2), capped
+def auto_cluster_count(chunks):
+    return max(1, min(MAX_AUTO_CLUSTERS, round(math.sqrt(chunks / 2))))
+
+# Function to read a collection's chunk embeddings a page at a time. Yields
+# (ids, unit vectors, metadatas); metadatas is None unless requested.
+def stream_embeddings(collection, page_size=STREAM_PAGE_SIZE, metadatas=False):
+    include = ["embeddings", "metadatas"] if metadatas else ["embeddings"]
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        offset += len(page["ids"])
+        vectors = np.asarray(page["embeddings"], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        yield page["ids"], vectors / np.where(norms == 0, 1, norms), page["metadatas"] if metadatas else None
+
+# Function to pick k well-spread starting centroids from a sample (k-means++ seeding)
+def seed_centroids(sample, k, rng):
+    centroids = [sample[rng.integers(len(sample))]]
+    distances = 1 - sample @ centroids[0]
+    for _ in range(1, k):
+        weights = np.clip(distances, 0, None) ** 2
+        total = weights.sum()
+        index = rng.choice(len(sample), p=weights / total) if total > 0 else rng.integers(len(sample))
+        centroids.append(sample[index])
+        distances = np.minimum(distances, 1 - sample @ sample[index])
+    return np.stack(centroids)
+
+# Function to scale centroids back onto the unit sphere
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+# Function to fit k centroids to a collection's embeddings. The first pass counts the
+# chunks and keeps a reservoir sample for seeding; every epoch then streams the
+# collection again and moves each centroid towards the mean of the rows assigned
+# to it, with a per-centroid step size of 1 / (rows seen so far).
+# Returns (centroids, chunk count).
+def fit_centroids(collection, clusters=None, epochs=DEFAULT_EPOCHS, seed=42,
+                  page_size=STREAM_PAGE_SIZE, batch_size=MINI_BATCH_SIZE):
+    rng = np.random.default_rng(seed)
+    sample = None
+    seen = 0
+    with tracer.span("cluster_sample") as span:
+        for _, vectors, _ in stream_embeddings(collection, page_size):
+            if sample is None:
+                sample = np.empty((SEED_SAMPLE_SIZE, vectors.shape[1]), dtype=np.float32)
+            # Reservoir sampling: the i-th row replaces a random kept row with
+            # probability SEED_SAMPLE_SIZE / i once the sample is full
+            fill = max(0, min(SEED_SAMPLE_SIZE - seen, len(vectors)))
+            sample[seen:seen + fill] = vectors[:fill]
+            positions = np.arange(seen + fill + 1, seen + len(vectors) + 1)
+            slots = (rng.random(len(positions)) * positions).astype(np.int64)
+            replaced = slots < SEED_SAMPLE_SIZE
+            sample[slots[replaced]] = vectors[fill:][replaced]
+            seen += len(vectors)
+        span.set(chunks=seen)
+    if not seen:
+        return None, 0
+    sample = sample[:min(seen, SEED_SAMPLE_SIZE)]
+
+    k = min(clusters or auto_cluster_count(seen), seen)
+    centroids = seed_centroids(sample, k, rng)
+    counts = np.zeros(k, dtype=np.float64)
+    for epoch in range(epochs):
+        with tracer.span("cluster_epoch", epoch=epoch, clusters=k):
+            for _, vectors, _ in stream_embeddings(collection, page_size):
+                vectors = vectors[rng.permutation(len(vectors))]
+                for start in range(0, len(vectors), batch_size):
+                    batch = vectors[start:start + batch_size]
+                    assignments = np.argmax(batch @ centroids.T, axis=1)
+                    batch_counts = np.bincount(assignments, minlength=k)
+                    sums = np.zeros_like(centroids)
+                    np.add.at(sums, assignments, batch)
+                    moved = batch_counts > 0
+                    counts[moved] += batch_counts[moved]
+                    step = (batch_counts[moved] / counts[moved])[:, None]
+                    centroids[moved] += step * (sums[moved] / batch_counts[moved][:, None] - centroids[moved])
+                    centroids = normalize_rows(centroids)
+    return centroids.astype(np.float32), seen
+
+# Function to cluster a collection and summarise every cluster. Each cluster is a
+# dict with its centroid, size (chunks), documents (distinct sources), share of the
+# collection, cohesion (mean cosine similarity to the centroid) and the ids and
+# similarities of the chunks closest to the centroid. Returns (clusters, chunk
+# count), clusters largest first.
+def cluster_collection(collection, clusters=None, representatives=DEFAULT_REPRESENTATIVES,
+                       epochs=DEFAULT_EPOCHS, seed=42, page_size=STREAM_PAGE_SIZE):
+    centroids, chunks = fit_centroids(collection, clusters, epochs=epochs, seed=seed, page_size=page_size)
+    if centroids is None:
+        return [], 0
+    k = len(centroids)
+    sizes = np.zeros(k, dtype=np.int64)
+    similarity_sums = np.zeros(k, dtype=np.float64)
+    sources = [set() for _ in range(k)]
+    best = [(np.empty(0, dtype=np.float32), []) for _ in range(k)]
+    with tracer.span("cluster_assign", clusters=k, chunks=chunks):
+        for ids, vectors, metadatas in stream_embeddings(collection, page_size, metadatas=True):
+            similarities = vectors @ centroids.T
+            assignments = np.argmax(similarities, axis=1)
+            nearest = similarities[np.arange(len(vectors)), assignments]
+            sizes += np.bincount(assignments, minlength=k)
+            similarity_sums += np.bincount(assignments, weights=nearest, minlength=k)
+            for row, cluster in enumerate(assignments):
+                metadata = metadatas[row] or {}
+                sources[cluster].add(metadata.get("url") or metadata.get("source") or metadata.get("doc_id") or ids[row])
+            for cluster in np.unique(assignments):
+                rows = np.flatnonzero(assignments == cluster)
+                scores = np.concatenate([best[cluster][0], nearest[rows]])
+                candidates = best[cluster][1] + [ids[row] for row in rows]
+                keep = np.argsort(-scores)[:representatives]
+                best[cluster] = (scores[keep], [candidates[i] for i in keep])
+
+    summaries = [
+        {
+            "cluster": cluster,
+            "centroid": centroids[cluster],
+            "size": int(sizes[cluster]),
+            "documents": len(sources[cluster]),
+            "share": float(sizes[cluster] / chunks),
+            "cohesion": float(similarity_sums[cluster] / sizes[cluster]) if sizes[cluster] else 0.0,
+            "representative_ids": best[cluster][1],
+            "representative_similarities": [float(score) for score in best[cluster][0]],
+        }
+        for cluster in range(k)
+        if sizes[cluster] > 0
+    ]
+    summaries.sort(key=lambda summary: summary["size"], reverse=True)
+    return summaries, chunks
+
+# Function to attach the text and metadata of every cluster's representative chunks
+# (one collection read for all clusters)
+def load_representatives(collection, clusters):
+    ids = [chunk_id for cluster in clusters for chunk_id in cluster["representative_ids"]]
+    if not ids:
+        return clusters
+    found = collection.get(ids=ids, include=["documents", "metadatas"])
+    records = {
+        chunk_id: (document, metadata or {})
+        for chunk_id, document, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+    }
+    for cluster in clusters:
+        cluster["representatives"] = [
+            {
+                "text": records[chunk_id][0],
+                "source": records[chunk_id][1].get("url") or records[chunk_id][1].get("source", ""),
+                "section": records[chunk_id][1].get("section"),
+                "similarity": similarity,
+            }
+            for chunk_id, similarity in zip(cluster["representative_ids"], cluster["representative_similarities"])
+            if chunk_id in records
+        ]
+    return clusters
+
+# Function to list, for every cluster, the other clusters with the closest centroids
+def related_clusters(clusters, count=2):
+    if len(clusters) < 2:
+        return {cluster["cluster"]: [] for cluster in clusters}
+    centroids = np.stack([cluster["centroid"] for cluster in clusters])
+    similarities = centroids @ centroids.T
+    np.fill_diagonal(similarities, -np.inf)
+    return {
+        cluster["cluster"]: [clusters[i]["cluster"] for i in np.argsort(-similarities[row])[:count]]
+        for row, cluster in enumerate(clusters)
+    }
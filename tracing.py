@@ -0,0 +1,272 @@
+import atexit
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+# Lightweight tracing for the ingestion and query hot paths. Spans time the stages
+# (parse, chunk, embed, upsert, retrieve, prompt, generate, ttft) and feed per-stage
+# histograms and counters, which can be written as JSON lines (one per span) or in
+# the Prometheus text format. Tracing is off by default; a disabled tracer hands out
+# one shared no-op span, so instrumented code costs a method call per stage.
+#
+#   EMBEDCHAIN_TRACE=trace.jsonl EMBEDCHAIN_METRICS=metrics.prom python chat_with_url.py
+
+# Environment variables that switch tracing on for any script
+TRACE_ENV = "EMBEDCHAIN_TRACE"
+METRICS_ENV = "EMBEDCHAIN_METRICS"
+
+# Prefix of every exported metric name
+METRIC_PREFIX = "embedchain"
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Cumulative histogram of stage durations
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+# Span handed out while tracing is disabled
+class NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+NOOP_SPAN = NoopSpan()
+
+# One timed stage. Spans opened inside another span on the same thread share its
+# trace id and record it as their parent.
+class Span:
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(tracer.span_ids)
+        self.parent_id = None
+        self.trace_id = None
+
+    def __enter__(self):
+        stack = self.tracer.stack()
+        if stack:
+            self.parent_id = stack[-1].span_id
+            self.trace_id = stack[-1].trace_id
+        else:
+            self.trace_id = self.span_id
+        stack.append(self)
+        self.wall_start = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        stack = self.tracer.stack()
+        # Generators can close their span after other spans were opened on the thread
+        if self in stack:
+            stack.remove(self)
+        error = None
+        if exc_type is GeneratorExit:
+            error = "cancelled"
+        elif exc_type is not None:
+            error = exc_type.__name__
+        self.tracer.finish(self, seconds, error)
+        return False
+
+    # Function to attach attributes known only once the stage has run, e.g. a chunk count
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.trace_path = None
+        self.trace_file = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.span_ids = itertools.count(1)
+        self.histograms = {}
+        self.counters = {}
+
+    # Function to switch tracing on; spans are appended to trace_path as JSON lines
+    # when it is given, and always feed the in-memory metrics
+    def enable(self, trace_path=None):
+        with self.lock:
+            self.trace_path = trace_path
+            self.enabled = True
+
+    def disable(self):
+        with self.lock:
+            self.enabled = False
+            if self.trace_file is not None:
+                self.trace_file.close()
+                self.trace_file = None
+
+    # Function to enable tracing from EMBEDCHAIN_TRACE / EMBEDCHAIN_METRICS. The metrics
+    # file is written when the main process exits.
+    def configure_from_environment(self):
+        trace_path = os.environ.get(TRACE_ENV)
+        metrics_path = os.environ.get(METRICS_ENV)
+        if not (trace_path or metrics_path):
+            return
+        self.enable(trace_path or None)
+        # Parsing worker processes import this module too; only the parent reports
+        if metrics_path and multiprocessing.parent_process() is None:
+            atexit.register(self.write_prometheus, metrics_path)
+
+    def stack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    # Function to open a span for a stage: `with tracer.span("embed", chunks=64):`
+    def span(self, name, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    # Function to record a stage that was timed elsewhere, e.g. in a worker process
+    def record(self, name, seconds, **attributes):
+        if not self.enabled:
+            return
+        span = Span(self, name, attributes)
+        stack = self.stack()
+        span.trace_id = stack[-1].trace_id if stack else span.span_id
+        span.parent_id = stack[-1].span_id if stack else None
+        span.wall_start = time.time() - seconds
+        self.finish(span, seconds, None)
+
+    # Function to add to a counter, e.g. chunks embedded or answer cache hits
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self, span, seconds, error):
+        with self.lock:
+            histogram = self.histograms.get(span.name)
+            if histogram is None:
+                histogram = self.histograms[span.name] = Histogram()
+            histogram.observe(seconds)
+            if error is not None:
+                counter = f"{span.name}_cancelled" if error == "cancelled" else f"{span.name}_errors"
+                self.counters[counter] = self.counters.get(counter, 0) + 1
+            if self.trace_path is None:
+                return
+            if self.trace_file is None:
+                os.makedirs(os.path.dirname(self.trace_path) or ".", exist_ok=True)
+                self.trace_file = open(self.trace_path, "a", buffering=1)
+            record = {
+                "name": span.name,
+                "trace_id": span.trace_id,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "start": round(span.wall_start, 6),
+                "duration_ms": round(seconds * 1000, 3),
+                "thread": threading.current_thread().name,
+            }
+            if error is not None:
+                record["error"] = error
+            if span.attributes:
+                record["attributes"] = span.attributes
+            self.trace_file.write(json.dumps(record, default=str) + "\n")
+
+    # Function to summarise the metrics: count, total and mean seconds per stage
+    def summary(self):
+        with self.lock:
+            stages = {
+                name: {
+                    "count": histogram.count,
+                    "total_seconds": round(histogram.sum, 6),
+                    "mean_ms": round(histogram.sum / histogram.count * 1000, 3) if histogram.count else 0.0,
+                }
+                for name, histogram in self.histograms.items()
+            }
+            return {"stages": stages, "counters": dict(self.counters)}
+
+    # Function to render the metrics in the Prometheus text exposition format
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            if self.histograms:
+                metric = f"{METRIC_PREFIX}_stage_seconds"
+                lines.append(f"# HELP {metric} Time spent in each pipeline stage.")
+                lines.append(f"# TYPE {metric} histogram")
+                for name in sorted(self.histograms):
+                    histogram = self.histograms[name]
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{metric}_sum{{stage="{name}"}} {histogram.sum:.6f}')
+                    lines.append(f'{metric}_count{{stage="{name}"}} {histogram.count}')
+            for name in sorted(self.counters):
+                metric = f"{METRIC_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {self.counters[name]}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def write_prometheus(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.prometheus_text())
+
+# Process-wide tracer used by the instrumented modules
+tracer = Tracer()
+tracer.configure_from_environment()
+
+# Embedding function wrapper that records an embed span per call
+class TracedEmbeddingFunction:
+    def __init__(self, embedding_fn):
+        self.embedding_fn = embedding_fn
+
+    def __call__(self, input):
+        with tracer.span("embed", texts=len(input)):
+            return self.embedding_fn(input)
+
+# Function to instrument an embedchain App: embedder calls (ingestion batches and
+# query embeddings), vector store queries and app.add get their own spans. Does
+# nothing while tracing is disabled, so the app keeps its plain methods.
+def instrument_app(app):
+    if not tracer.enabled:
+        return app
+    app.embedder.set_embedding_fn(TracedEmbeddingFunction(app.embedder.embedding_fn))
+    # Reopen the collection so Chroma embeds queries through the traced function
+    app.db.set_collection_name(app.db.config.collection_name)
+
+    db_query = app.db.query
+
+    def traced_query(*args, **kwargs):
+        with tracer.span("retrieve"):
+            return db_query(*args, **kwargs)
+
+    app.db.query = traced_query
+
+    add = app.add
+
+    def traced_add(source, *args, **kwargs):
+        with tracer.span("add", source=str(source)[:200]):
+            return add(source, *args, **kwargs)
+
+    app.add = traced_add
+    return app